@@ -1,84 +1,321 @@
 #!/usr/bin/python3
 
 import argparse
+import json
 import logging
 import os
+import shlex
 import shutil
 import subprocess
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from substrateinterface import SubstrateInterface
 
 import script_utils
+from script_utils import accounts, genesis, metrics, transport
+
+GENERATED_COMPOSE_PATH = 'docker-compose.generated.yml'
+DEFAULT_TOPOLOGY_PATH = 'topology.json'
+
+# Peer id of the node key 0x00..01, lets the other nodes bootstrap from node-0
+BOOTNODE_KEY = '0' * 63 + '1'
+BOOTNODE_PEER_ID = '12D3KooWEyoppNCUx8Yx66oV9fJnriXwCcXwDDUA2kj6vnc6iDEp'
+
+# Host ports of worker i are offset by i, so at most this many fit between
+# the trusted (2011) and untrusted (2101) port ranges
+MAX_WORKERS = 90
 
 
-def build_image(docker_exec, dockerfile_path, image_base_name, submodule_path, verbose=False):
+def image_exists(docker_exec, image_name):
+    process = subprocess.run([docker_exec, 'image', 'inspect', image_name],
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return process.returncode == 0
+
+
+def build_image(docker_exec, dockerfile_path, image_base_name, submodule_path, verbose=False, force=False):
     node_hash = script_utils.get_submodule_commit_sha(submodule_path)
     image_name = f'{image_base_name}:{node_hash}'
     env = {'DOCKER_BUILDKIT': '1'}
 
+    if not force and image_exists(docker_exec, image_name):
+        logging.info(f'Image {image_name} already present, skipping build')
+        return image_name
+
     cmd = [docker_exec, 'build', '-f', dockerfile_path, '-t', image_name, '.']
 
+    log_name = os.path.basename(submodule_path)
+    log_path = f'{log_name}.log'
+
     logging.info(
-        f'Building image for submodule {submodule_path} at commit {node_hash}...')
-    if verbose:
-        stdout_type = sys.stdout
-    else:
-        stdout_type = subprocess.DEVNULL
+        f'Building image for submodule {submodule_path} at commit {node_hash}, output in {log_path}...')
+    start = time.monotonic()
 
-    process = subprocess.run(cmd, stdout=stdout_type, text=True,
-                             stderr=subprocess.STDOUT, env=env)
+    # Every build streams into its own log so concurrent builds stay readable
+    with open(log_path, 'w') as log_file:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True,
+                                   stderr=subprocess.STDOUT, env=env)
+        for line in process.stdout:
+            log_file.write(line)
+            if verbose:
+                sys.stdout.write(f'[{log_name}] {line}')
+        process.wait()
 
     if process.returncode != 0:
-        error_log_file = f'{os.path.basename(submodule_path)}.log'
         logging.error(
-            f'Error building image, check output of {error_log_file}')
-        with open(error_log_file, 'w') as f:
-            f.write(process.stdout)
-
-        exit(1)
+            f'Error building image, check output of {log_path}')
+        return None
     else:
-        logging.info(f'Image built succesfully: {image_name}')
+        logging.info(
+            f'Image built succesfully in {time.monotonic() - start:.0f}s: {image_name}')
         return image_name
 
 
-def build_node_image(docker_exec, verbose=False):
+def build_node_image(docker_exec, verbose=False, force=False):
     dockerfile = 'Dockerfile.node'
     submodule_path = os.path.abspath('node')
-    base_name = 'ajuna.io/node-solo'
+    base_name = script_utils.get_node_image_base_name()
 
-    return build_image(docker_exec, dockerfile, base_name, submodule_path, verbose)
+    return build_image(docker_exec, dockerfile, base_name, submodule_path, verbose, force)
 
 
-def build_worker_image(docker_exec, verbose=False):
+def build_worker_image(docker_exec, verbose=False, force=False):
     dockerfile = 'Dockerfile.worker'
     submodule_path = os.path.abspath('worker')
-    base_name = 'ajuna.io/worker'
+    base_name = script_utils.get_worker_image_base_name()
+
+    return build_image(docker_exec, dockerfile, base_name, submodule_path, verbose, force)
+
+
+def build_images(docker_exec, verbose=False, force=False):
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        node_build = executor.submit(
+            build_node_image, docker_exec, verbose, force)
+        worker_build = executor.submit(
+            build_worker_image, docker_exec, verbose, force)
+        node_image = node_build.result()
+        worker_image = worker_build.result()
 
-    return build_image(docker_exec, dockerfile, base_name, submodule_path, verbose)
+    if node_image is None or worker_image is None:
+        exit(1)
+
+    return node_image, worker_image
+
+
+def generate_topology(node_count, worker_count, compose_path=GENERATED_COMPOSE_PATH, topology_path=DEFAULT_TOPOLOGY_PATH,
+                      chain_spec_path=None):
+    lines = ['services:']
+    node_services = []
+    node_ports = []
+
+    # "--dev" is short for the dev chain with Alice authoring on a temporary
+    # database, spelled out when booting from a generated spec instead
+    if chain_spec_path is None:
+        dev_chain = '--dev'
+        chain = '--chain dev'
+    else:
+        chain = f'--chain {genesis.CONTAINER_CHAIN_SPEC_PATH}'
+        dev_chain = f'{chain} --alice --force-authoring --rpc-cors all --tmp'
+
+    for i in range(node_count):
+        service = f'node-{i}'
+        if i == 0:
+            # Only the first node authors blocks, the others follow its chain
+            command = f'./node-solo {dev_chain} --node-key {BOOTNODE_KEY}'
+        else:
+            command = f'./node-solo {chain} --tmp --bootnodes /dns/node-0/tcp/30333/p2p/{BOOTNODE_PEER_ID}'
+        lines += [f'  {service}:',
+                  '    image: "${NODE_IMAGE}"',
+                  f'    command: {command} --rpc-methods unsafe --ws-external --rpc-external --ws-port 9944 --prometheus-external',
+                  '    ports:',
+                  f'      - "{9944 + i}:9944"',
+                  f'      - "{9615 + i}:9615"']
+        if chain_spec_path is not None:
+            lines += ['    volumes:',
+                      f'      - "{os.path.abspath(chain_spec_path)}:{genesis.CONTAINER_CHAIN_SPEC_PATH}:ro"']
+        lines.append('')
+        node_services.append(service)
+        node_ports.append(9944 + i)
 
+    endpoints = []
+    for i in range(worker_count):
+        service = f'worker-{i}'
+        node_index = i % node_count
+        lines += [f'  {service}:',
+                  '    image: "${WORKER_IMAGE}"',
+                  f'    command: ./integritee-service --clean-reset --ws-external -u ws://node-{node_index} -U ws://{service}',
+                  f'      -M {service} -T wss://{service} -P 2011 -w 2101 -p 9944 -h 4645 run --dev --skip-ra',
+                  '    depends_on:',
+                  f'      - node-{node_index}',
+                  '    restart: on-failure',
+                  '    ports:',
+                  f'      - "{4645 + i}:4645"',
+                  f'      - "{2011 + i}:2011"',
+                  f'      - "{2101 + i}:2101"',
+                  '']
+        endpoints.append(transport.WorkerEndpoint(
+            service, '127.0.0.1', 2011 + i, node_ports[node_index]))
+
+    with open(compose_path, 'w') as compose_file:
+        compose_file.write('\n'.join(lines))
+
+    with open(topology_path, 'w') as topology_file:
+        json.dump({'nodes': [{'name': service, 'host': '127.0.0.1', 'port': port}
+                             for service, port in zip(node_services, node_ports)],
+                   'workers': [endpoint.to_dict() for endpoint in endpoints]}, topology_file, indent=2)
 
-def start_infraestructure(docker_exec, compose_path, node_image, worker_image, verbose=False):
     logging.info(
-        f'Starting up compose with {node_image} and {worker_image}...')
+        f'Generated {compose_path} with {node_count} node/s and {worker_count} worker/s, endpoints in {topology_path}')
+
+    return node_services, node_ports, endpoints
 
+
+def run_compose(docker_exec, compose_path, node_image, worker_image, args, verbose=False, stdout=None):
     env = {'NODE_IMAGE': node_image, 'WORKER_IMAGE': worker_image}
-    cmd = [docker_exec, 'compose', '-f', compose_path, 'up']
+    cmd = [docker_exec, 'compose', '-f', compose_path] + args
 
-    if verbose:
-        stdout_type = sys.stdout
-    else:
-        stdout_type = subprocess.DEVNULL
+    if stdout is None:
+        stdout = sys.stdout if verbose else subprocess.DEVNULL
+
+    return subprocess.run(cmd, stdout=stdout, stderr=subprocess.STDOUT, env=env, text=True)
 
-    try:
-        subprocess.run(
-            cmd, stdout=stdout_type, stderr=subprocess.STDOUT, env=env)
-    except KeyboardInterrupt:
-        pass
+
+def wait_until(check, deadline, what, poll_interval=1.0):
+    while (result := check()) is None:
+        if time.monotonic() > deadline:
+            logging.error(f'Timed out waiting for {what}')
+            return None
+        time.sleep(poll_interval)
+
+    return result
+
+
+def wait_for_node(node_url, deadline):
+    # Ready means the RPC answers and a block newer than the first seen one
+    # got imported, so the chain is really being produced
+    state = {'node': None, 'first_block': None}
+
+    def check():
+        try:
+            if state['node'] is None:
+                state['node'] = SubstrateInterface(url=node_url)
+            header = state['node'].rpc_request('chain_getHeader', [])['result']
+        except Exception as ex:
+            logging.debug(f'Node not answering yet: {ex!r}')
+            state['node'] = None
+            return None
+
+        block_number = int(header['number'], 16)
+        if state['first_block'] is None:
+            state['first_block'] = block_number
+        return block_number if block_number > state['first_block'] else None
+
+    block_number = wait_until(check, deadline, f'node at {node_url} to produce blocks')
+    if state['node'] is not None:
+        state['node'].close()
+    return block_number
+
+
+def wait_for_workers(docker_exec, compose_path, node_image, worker_image, endpoints, deadline):
+    def extract_cli():
+        process = run_compose(docker_exec, compose_path, node_image, worker_image,
+                              ['ps', '-q', endpoints[0].name], stdout=subprocess.PIPE)
+        if not (container_id := process.stdout.strip()):
+            return None
+        try:
+            return script_utils.get_integritee_cli(docker_exec, container_id)
+        except subprocess.CalledProcessError:
+            return None
+
+    if (cli_path := wait_until(extract_cli, deadline, 'worker container')) is None:
+        return None, None
+
+    # Every worker registers itself on chain, so one of them lists them all
+    def check_registered():
+        mrenclaves = script_utils.list_worker_mrenclaves(cli_path, 30, endpoints[0].node_port,
+                                                         endpoints[0].worker_port, endpoints[0].host)
+        return mrenclaves[0] if len(mrenclaves) >= len(endpoints) else None
+
+    mrenclave = wait_until(check_registered, deadline,
+                           f'{len(endpoints)} worker/s to register their MRENCLAVE')
+    return cli_path, mrenclave
+
+
+def start_infraestructure(docker_exec, compose_path, node_image, worker_image, verbose=False,
+                          node_services=('node',), node_ports=(9944,), endpoints=None, ready_timeout=600.0):
+    endpoints = endpoints or [transport.WorkerEndpoint('worker')]
+    logging.info(
+        f'Starting up compose with {node_image} and {worker_image}...')
+
+    run_metrics = metrics.get_run_metrics()
+    start = time.monotonic()
+    deadline = start + ready_timeout
+
+    # Workers only start once the nodes produce blocks, instead of sleeping
+    # a fixed amount of time
+    if run_compose(docker_exec, compose_path, node_image, worker_image, ['up', '-d'] + list(node_services),
+                   verbose).returncode != 0:
+        logging.error('Failed to start the node/s')
+        return None
+
+    for node_port in node_ports:
+        if (block_number := wait_for_node(f'ws://127.0.0.1:{node_port}', deadline)) is None:
+            run_metrics.record('node-ready', time.monotonic() - start, metrics.OUTCOME_TIMEOUT)
+            return None
+    node_ready = time.monotonic() - start
+    run_metrics.record('node-ready', node_ready)
+    logging.info(f'{len(node_ports)} node/s ready after {node_ready:.1f}s at block #{block_number}')
+
+    if run_compose(docker_exec, compose_path, node_image, worker_image,
+                   ['up', '-d'] + [endpoint.name for endpoint in endpoints], verbose).returncode != 0:
+        logging.error('Failed to start the worker/s')
+        return None
+
+    cli_path, mrenclave = wait_for_workers(
+        docker_exec, compose_path, node_image, worker_image, endpoints, deadline)
+    if mrenclave is None:
+        run_metrics.record('worker-ready', time.monotonic() - start, metrics.OUTCOME_TIMEOUT)
+        return None
+    stack_ready = time.monotonic() - start
+    run_metrics.record('worker-ready', stack_ready - node_ready)
+    run_metrics.record('stack-ready', stack_ready)
+    logging.info(
+        f'{len(endpoints)} worker/s ready after {stack_ready - node_ready:.1f}s with MRENCLAVE "{mrenclave}", stack ready in {stack_ready:.1f}s')
+
+    return cli_path
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('--build', required=False,
-                        help='Rebuild node and/or worker before launching tests', action='store_true')
+                        help='Build the node and worker images not present yet before launching tests', action='store_true')
+    parser.add_argument('--force-build', required=False,
+                        help='With "--build", rebuild the images even if their tags are already present', action='store_true')
+    parser.add_argument('--nodes', required=False, default=1,
+                        help='Number of nodes, more than one generates a compose topology, defaults to 1', type=int)
+    parser.add_argument('--workers', required=False, default=1,
+                        help=f'Number of workers, more than one generates a compose topology and a "{DEFAULT_TOPOLOGY_PATH}" '
+                        f'for "launch_tests.py --topology", defaults to 1, at most {MAX_WORKERS}', type=int)
+    parser.add_argument('--genesis-accounts', required=False,
+                        help='Boot the nodes from a generated chain spec endowing "//Account_0" up to this many accounts at '
+                        'genesis, "launch_tests.py" then skips funding them on chain', type=int)
+    parser.add_argument('--genesis-endowment', required=False, default=genesis.DEFAULT_ENDOWMENT,
+                        help=f'Free balance of every "--genesis-accounts" account, defaults to {genesis.DEFAULT_ENDOWMENT}', type=int)
+    parser.add_argument('--base-chain-spec', required=False,
+                        help='Endow the accounts in this non-raw chain spec instead of the one exported from the node image', type=str)
+    parser.add_argument('--account-pool', required=False, default=accounts.DEFAULT_POOL_PATH,
+                        help=f'Cache of derived keypairs shared with "launch_tests.py", defaults to "{accounts.DEFAULT_POOL_PATH}"', type=str)
+    parser.add_argument('--derive-processes', required=False,
+                        help='Processes deriving the "--genesis-accounts" keypairs, defaults to the number of CPUs', type=int)
+    parser.add_argument('--ready-timeout', required=False, default=600.0,
+                        help='Seconds to wait for the node to produce blocks and the worker to register, defaults to 600', type=float)
+    parser.add_argument('--report', required=False, default=f'reports/{int(time.time())}-startup',
+                        help='Path prefix of the JSON and CSV time-to-ready report, defaults to "reports/<epoch>-startup"', type=str)
+    parser.add_argument('--test-args', required=False,
+                        help='Once the stack is ready run "launch_tests.py" with these arguments, e.g. "--games 100"', type=str)
+    parser.add_argument('--down', required=False,
+                        help='Stop the stack after "--test-args" ran instead of leaving it up', action='store_true')
     parser.add_argument('--verbose', required=False,
                         help='Show additional logging messages', action='store_true')
 
@@ -86,11 +323,16 @@ if __name__ == "__main__":
 
     script_utils.setup_logging(verbose=args.verbose)
 
+    if args.nodes < 1 or not 1 <= args.workers <= MAX_WORKERS:
+        parser.error(f'"--nodes" must be at least 1 and "--workers" between 1 and {MAX_WORKERS}')
+    if args.genesis_accounts is not None and args.genesis_accounts < 1:
+        parser.error('"--genesis-accounts" must be at least 1')
+
     if (docker_path := shutil.which('docker')) is not None:
         logging.debug(f'Docker path: {docker_path}')
         if args.build:
-            node_image = build_node_image(docker_path, args.verbose)
-            worker_image = build_worker_image(docker_path, args.verbose)
+            node_image, worker_image = build_images(
+                docker_path, args.verbose, args.force_build)
         else:
             node_image_sha = script_utils.get_submodule_commit_sha(
                 os.path.abspath('node'))
@@ -102,10 +344,57 @@ if __name__ == "__main__":
             logging.debug(
                 f'Build flag set to "{args.build}", skipping build...')
 
-        compose_path = os.path.abspath('docker-compose.yml')
+        test_args = []
+        chain_spec_path = None
+        if args.genesis_accounts is not None:
+            try:
+                if args.base_chain_spec is not None:
+                    base_spec = genesis.load_spec(args.base_chain_spec)
+                else:
+                    base_spec = genesis.build_base_spec(docker_path, node_image)
+                chain_spec_path = genesis.generate_chain_spec(
+                    base_spec, args.genesis_accounts, args.genesis_endowment, args.account_pool, args.derive_processes)
+            except genesis.GenesisException as ex:
+                logging.error(f'Failed to generate the genesis: {ex}')
+                sys.exit(1)
+            test_args = ['--genesis-accounts', os.path.abspath(genesis.DEFAULT_MANIFEST_PATH),
+                         '--account-pool', os.path.abspath(args.account_pool)]
+
+        # Booting from a generated spec needs the generated compose file
+        if args.nodes > 1 or args.workers > 1 or chain_spec_path is not None:
+            compose_path = os.path.abspath(GENERATED_COMPOSE_PATH)
+            node_services, node_ports, endpoints = generate_topology(
+                args.nodes, args.workers, compose_path, chain_spec_path=chain_spec_path)
+            test_args += ['--topology', os.path.abspath(DEFAULT_TOPOLOGY_PATH)]
+            cli_path = start_infraestructure(docker_path, compose_path, node_image, worker_image, args.verbose,
+                                             node_services, node_ports, endpoints, args.ready_timeout)
+        else:
+            compose_path = os.path.abspath('docker-compose.yml')
+            cli_path = start_infraestructure(docker_path, compose_path, node_image, worker_image,
+                                             args.verbose, ready_timeout=args.ready_timeout)
+        report = metrics.get_run_metrics().write_report(args.report)
+        metrics.log_summary(report)
+
+        if cli_path is None:
+            logging.error('Infrastructure did not become ready! Exiting...')
+            sys.exit(1)
+
+        returncode = 0
+        if args.test_args is not None:
+            cmd = [sys.executable, os.path.abspath('launch_tests.py'), '--cli-path', cli_path] + \
+                test_args + shlex.split(args.test_args)
+            logging.info(f'Handing off to tests: {" ".join(cmd)}')
+            returncode = subprocess.run(cmd).returncode
+
+            if args.down:
+                run_compose(docker_path, compose_path,
+                            node_image, worker_image, ['down'], args.verbose)
+
+        if args.test_args is None or not args.down:
+            logging.info(
+                f'Infrastructure is up, stop it with "docker compose -f {compose_path} down"')
 
-        start_infraestructure(docker_path, compose_path,
-                              node_image, worker_image, args.verbose)
+        sys.exit(returncode)
 
     else:
         logging.error('Docker binary could not be located! Exiting...')
@@ -1,61 +1,138 @@
 #!/usr/bin/python3
 
 import argparse
+import asyncio
+import collections
 import logging
-from multiprocessing import Pool
 import os
+import random
+import re
 import shutil
 import subprocess
 import sys
 import time
 
 from substrateinterface import SubstrateInterface, Keypair
+from substrateinterface.utils.ss58 import ss58_encode
 
 import script_utils as scu
+from script_utils import accounts, adaptive, baseline, chain_monitor, distributed, eventlog, funding, genesis, loadgen, metrics, scenario, simulator, soak, telemetry, tracing, transport
 
+DEFAULT_MAX_IN_FLIGHT = 512
+DEFAULT_BOARD_DEADLINE = 300.0
+DEFAULT_LAG_TOLERANCE = 0.05
+DEFAULT_BALANCE = 1_000_000_000
+MATCH_POLL_INTERVAL = 1.0
 
-def generate_player_account(cli_cmd, account_name, balance, stdout_type):
+# Boards fetched to find out whether a game exists yet, or who it pairs, are
+# kept apart from the reads made while playing
+BOARD_POLL_METRIC = 'board-poll'
+MATCH_POLL_METRIC = 'match-poll'
+
+# Beyond this share of accounts that could not be funded the run is aborted,
+# below it they are left out of the run
+MAX_UNFUNDED_FRACTION = 0.1
+
+
+async def run_operation(cli_transport, operation, player, args=(), stdout=subprocess.PIPE, game_id=None, metric=None):
+    # Calls made for another purpose than the operation itself, such as
+    # polling until a board exists, are recorded under a metric of their own
+    metric = metric or operation
+    started_at = time.time()
+    start = time.perf_counter()
+    outcome = metrics.OUTCOME_OK
+    output = None
+    with tracing.span(metric, 'cli', game=game_id, player=player, transport=cli_transport.name):
+        try:
+            output = await cli_transport.execute(operation, player, args, stdout, affinity=game_id, metric=metric)
+            return output
+        except subprocess.TimeoutExpired:
+            outcome = metrics.OUTCOME_TIMEOUT
+            raise
+        except subprocess.CalledProcessError as cpe:
+            outcome = metrics.OUTCOME_ERROR
+            output = cpe.output
+            raise
+        except transport.TransportException as te:
+            outcome = metrics.OUTCOME_ERROR
+            output = str(te)
+            raise
+        finally:
+            tracing.annotate(outcome=outcome)
+            eventlog.emit(metric, game_id, player, started_at, time.perf_counter() - start, outcome,
+                          args=[str(arg) for arg in args], output=output.strip() if output else None)
+
+
+async def generate_player_account(cli_transport, account_name, balance, stdout_type):
     logging.debug(f'"{account_name}" Setting funds...')
-    cmd = cli_cmd + [account_name, str(balance)]
-    proc = subprocess.run(cmd, stdout=stdout_type, stderr=subprocess.STDOUT)
-    if proc.returncode != 0:
+    try:
+        await run_operation(cli_transport, 'set-balance', account_name, [balance], stdout_type)
+    except subprocess.CalledProcessError as cpe:
         logging.error(
-            f'Error setting funds to {account_name}: {proc.stdout.decode("ascii")}')
+            f'Error setting funds to {account_name}: {cpe.output}')
+        return False
+    except subprocess.TimeoutExpired:
+        logging.error(f'Timeout expired setting funds to {account_name}!')
+        return False
+    except transport.TransportException as te:
+        logging.error(f'Error setting funds to {account_name}: {te}')
         return False
     else:
         logging.info(f'"{account_name}" Transfer succesfull!')
         return True
 
 
-def generate_player_accounts(cli_exec, mrenclave, player_count, ws_addr='127.0.0.1', ws_port=9944, balance=1_000_000_000, verbose=False):
-    def transfer_funds_to_created_accounts(rpc_node, alice_keypair, account_name, balance):
-        logging.info(f'Tranfering {balance} funds to {account_name}')
-        try:
-            account_keypair = Keypair.create_from_uri(account_name)
-            alice_keypair = Keypair.create_from_uri('//Alice')
-            call = rpc_node.compose_call(
-                call_module='Balances',
-                call_function='transfer',
-                call_params={
-                    'dest': account_keypair.ss58_address,
-                    'value': balance
-                }
-            )
-            extrinsic = rpc_node.create_signed_extrinsic(
-                call=call, keypair=alice_keypair)
-            receipt = rpc_node.submit_extrinsic(
-                extrinsic, wait_for_inclusion=True)
-            logging.info(
-                f'Funds transferred to {account_name}!')
-            logging.debug(
-                f'Transfer receipt identifier {receipt.get_extrinsic_identifier()}')
-            logging.debug(f'{receipt.extrinsic}')
-            return True
-        except Exception as ex:
-            logging.error(f'Failed to transfer funds: {ex}')
+async def set_player_balances(cli_transport, account_names, balance, stdout_type, max_in_flight):
+    in_flight = asyncio.Semaphore(max_in_flight)
+
+    async def set_limited_balance(account_name):
+        async with in_flight:
+            return await generate_player_account(cli_transport, account_name, balance, stdout_type)
+
+    return await asyncio.gather(*[set_limited_balance(account_name) for account_name in account_names])
+
+
+def drop_unfunded_players(player_names, failed_names):
+    if not failed_names:
+        return player_names
+
+    if len(failed_names) > len(player_names) * MAX_UNFUNDED_FRACTION:
+        logging.error(f'{len(failed_names)}/{len(player_names)} account/s could not be funded! Exiting...')
+        sys.exit(1)
+
+    logging.warning(f'Leaving {len(failed_names)} account/s that could not be funded out of the run')
+    metrics.get_run_metrics().increment('accounts-unfunded', len(failed_names))
+    return [name for name in player_names if name not in failed_names]
+
+
+def cached_trusted_balances_hold(cli_transport, account_pool, player_names, balance):
+    # The pool is keyed by MRENCLAVE, which a worker "--clean-reset" keeps
+    # while wiping the balances, so one of the cached ones is checked first
+    mrenclave = cli_transport.mrenclave
+    cached_names = [name for name in player_names if account_pool.get_trusted_balance(mrenclave, name) >= balance]
+    if not cached_names:
+        return True
+
+    sampled_name = random.choice(cached_names)
+    try:
+        output = asyncio.run(run_operation(cli_transport, 'balance', sampled_name))
+        trusted_balance = int(output.strip().splitlines()[-1])
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, transport.TransportException,
+            ValueError, IndexError, AttributeError) as ex:
+        logging.warning(f'Could not check the trusted balance of {sampled_name}, not trusting the account pool: {ex}')
+        return False
+
+    if trusted_balance < balance:
+        logging.warning(f'{sampled_name} holds {trusted_balance} on the worker although the account pool says '
+                        f'{account_pool.get_trusted_balance(mrenclave, sampled_name)}, was the worker reset? Setting all balances again')
+        return False
+    return True
 
-    base_name = '//Account_'
 
+def generate_player_accounts(cli_transport, player_count, ws_addr='127.0.0.1', ws_port=9944, balance=DEFAULT_BALANCE, verbose=False,
+                             funding_batch_size=None, funding_max_pending=256, max_in_flight=DEFAULT_MAX_IN_FLIGHT,
+                             pool_path=accounts.DEFAULT_POOL_PATH, refresh_trusted_balances=False, balance_setter=None,
+                             monitor=None, skip_chain_funding=False, genesis_manifest=genesis.DEFAULT_MANIFEST_PATH):
     logging.info(f'Creating {player_count} player accounts...')
 
     if verbose:
@@ -63,15 +140,37 @@ def generate_player_accounts(cli_exec, mrenclave, player_count, ws_addr='127.0.0
     else:
         stdout_type = subprocess.DEVNULL
 
-    base_cli_cmd = scu.get_base_cli_cmd(cli_exec)
+    player_names = accounts.get_account_names(player_count)
 
-    account_names = [(base_cli_cmd + scu.get_trusted_cli_subcommand(f'{base_name}{i}', mrenclave, 'set-balance'), f'{base_name}{i}', balance, stdout_type)
-                     for i in range(0, player_count)]
+    account_pool = accounts.AccountPool.load(pool_path)
+    account_pool.derive(player_names)
 
-    proc_count = min(len(os.sched_getaffinity(0)), player_count)
+    mrenclave = cli_transport.mrenclave
+    if refresh_trusted_balances or not cached_trusted_balances_hold(cli_transport, account_pool, player_names, balance):
+        account_pool.clear_trusted_balances(mrenclave)
 
-    with Pool(proc_count) as pool:
-        pool.starmap(generate_player_account, account_names)
+    unfunded_names = [name for name in player_names
+                      if account_pool.get_trusted_balance(mrenclave, name) < balance]
+    logging.info(
+        f'{len(player_names) - len(unfunded_names)} account/s already hold trusted funds, setting {len(unfunded_names)}...')
+
+    with tracing.span('set_player_balances', 'funding', accounts=len(unfunded_names)):
+        if balance_setter is not None:
+            results = balance_setter(unfunded_names, balance)
+        else:
+            results = asyncio.run(set_player_balances(cli_transport, unfunded_names,
+                                                      balance, stdout_type, max_in_flight))
+    failed_names = set()
+    for name, funded in zip(unfunded_names, results):
+        if funded:
+            account_pool.set_trusted_balance(mrenclave, name, balance)
+        else:
+            failed_names.add(name)
+    account_pool.save()
+
+    if skip_chain_funding:
+        logging.info('Skipping on-chain funding')
+        return drop_unfunded_players(player_names, failed_names)
 
     try:
         logging.info(f'Connecting to Ajuna node...')
@@ -82,167 +181,1182 @@ def generate_player_accounts(cli_exec, mrenclave, player_count, ws_addr='127.0.0
 
     alice_keypair = Keypair.create_from_uri('//Alice')
 
-    for account_tuple in account_names:
-        transfer_funds_to_created_accounts(
-            node, alice_keypair, account_tuple[1], balance)
+    # Accounts whose funding is not known to have worked
+    unconfirmed_names = player_names
+    try:
+        # Accounts endowed at genesis by "launch_infrastructure.py --genesis-accounts"
+        # need neither a balance query nor a transfer
+        prefunded = 0
+        if (manifest := genesis.load_manifest(genesis_manifest)) is not None:
+            prefunded = genesis.count_prefunded(node, account_pool, manifest, player_names, balance)
+        if prefunded:
+            logging.info(f'{prefunded} account/s endowed at genesis, skipping their on-chain funding')
+        chain_names = player_names[prefunded:]
+
+        player_addresses = [account_pool.get_address(
+            name) for name in chain_names]
+        free_balances = accounts.query_free_balances(node, player_addresses)
 
-    return [acc[1] for acc in account_names]
+        underfunded_names = []
+        underfunded_addresses = []
+        top_ups = []
+        for name, address in zip(chain_names, player_addresses):
+            if free_balances[address] < balance:
+                underfunded_names.append(name)
+                underfunded_addresses.append(address)
+                top_ups.append(balance - free_balances[address])
 
+        logging.info(
+            f'{len(chain_names) - len(underfunded_names)} account/s already funded on chain, topping up {len(underfunded_names)}...')
 
-def drop_bomb(cli_cmd, player, col, row, log_file):
-    cmd = cli_cmd + [player, col, row]
-    logging.debug(f'Running command: "{" ".join(cmd)}"')
-    p = subprocess.run(cmd, stdout=log_file,
-                       stderr=subprocess.STDOUT, timeout=60.0)
-    p.check_returncode()
+        unconfirmed_names = underfunded_names
+        if underfunded_names:
+            with tracing.span('fund_accounts', 'funding', accounts=len(underfunded_names)):
+                _, failed_transfers = funding.fund_accounts(
+                    node, alice_keypair, underfunded_names, underfunded_addresses, top_ups,
+                    batch_size=funding_batch_size, max_pending=funding_max_pending, chain_monitor=monitor)
+            failed_names.update(failed_transfers)
+    except Exception as ex:
+        logging.error(f'Failed to transfer funds: {ex}')
+        failed_names.update(unconfirmed_names)
 
+    return drop_unfunded_players(player_names, failed_names)
 
-def drop_stone(cli_cmd, player, direction, x, log_file):
-    cmd = cli_cmd + [player, direction, x]
-    logging.debug(f'Running command: "{" ".join(cmd)}"')
-    p = subprocess.run(cmd, stdout=log_file,
-                       stderr=subprocess.STDOUT, timeout=60.0)
-    p.check_returncode()
 
+async def drop_bomb(cli_transport, player, col, row, game_id):
+    await run_operation(cli_transport, 'drop-bomb', player, [col, row], game_id=game_id)
 
-def check_board(cli_cmd, player, log_file):
-    cmd = cli_cmd + [player]
-    logging.debug(f'Running command: "{" ".join(cmd)}"')
-    p = subprocess.run(cmd, stdout=log_file,
-                       stderr=subprocess.STDOUT, timeout=60.0)
-    p.check_returncode()
 
+async def drop_stone(cli_transport, player, direction, x, game_id):
+    await run_operation(cli_transport, 'drop-stone', player, [direction, x], game_id=game_id)
 
-def compute_playing_positions(cli_cmd, player_1, player_2):
-    cmd = cli_cmd + [player_1]
 
-    p = subprocess.run(cmd, stdout=subprocess.PIPE,
-                       stderr=subprocess.STDOUT, timeout=60.0, text=True)
-    p.check_returncode()
+async def check_board(cli_transport, player, game_id, metric=None):
+    return await run_operation(cli_transport, 'get-board', player, game_id=game_id, metric=metric)
 
-    cmd_output = p.stdout
-    if 'could not fetch board' in cmd_output:
-        logging.warning(
-            f'Failed to fetch board for {player_1} - {player_2} game, trying once more in 30s...')
 
-        time.sleep(30)
+class BoardVerifier:
+    MODES = ['every', 'sampled', 'end', 'off']
 
-        p = subprocess.run(cmd, stdout=subprocess.PIPE,
-                           stderr=subprocess.STDOUT, timeout=60.0, text=True)
-        p.check_returncode()
+    def __init__(self, mode='every', sample_rate=0.1):
+        self.mode = mode
+        self.sample_rate = sample_rate
 
-        cmd_output = p.stdout
-        if 'could not fetch board' in cmd_output:
+    def verify_move(self):
+        if self.mode == 'every':
+            return True
+        elif self.mode == 'sampled':
+            return random.random() < self.sample_rate
+        return False
+
+    def verify_end(self):
+        return self.mode != 'off'
+
+    async def verify(self, cli_transport, player, shadow_board, game_id):
+        run_metrics = metrics.get_run_metrics()
+        output = await check_board(cli_transport, player, game_id)
+        try:
+            with tracing.span('parse_board', game=game_id):
+                board = scu.BoardParser(output)
+        except scu.BoardParseException:
+            logging.warning(f'Could not parse board fetched by {player}')
+            run_metrics.increment('board-unparseable')
+            eventlog.emit('board-unparseable', game_id, player)
+            return
+
+        run_metrics.increment('board-verifications')
+        if divergences := shadow_board.diff(board):
+            run_metrics.increment('board-divergences')
+            eventlog.emit('board-divergence', game_id, player,
+                          outcome=metrics.OUTCOME_ERROR, divergences=divergences)
+            logging.warning(
+                f'Board fetched by {player} diverges from the predicted one at (row, col, expected, actual): {divergences}')
+            # Keep predicting from the real board from now on
+            shadow_board.apply_board(board)
+
+
+async def wait_for_board(cli_transport, player, deadline, initial_delay=0.5, max_delay=8.0, game_id=None):
+    delay = initial_delay
+    while True:
+        try:
+            cmd_output = await check_board(cli_transport, player, game_id, BOARD_POLL_METRIC)
+            if 'could not fetch board' not in cmd_output:
+                return cmd_output
+        except subprocess.CalledProcessError as cpe:
+            cmd_output = cpe.output
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
             raise subprocess.CalledProcessError(
-                cmd=' '.join(cmd), returncode=1, output=p.stdout)
+                cmd=f'get-board {player}', returncode=1, output=cmd_output)
 
-    # Extract the board cells and convert them to a list
-    parser = scu.BoardParser(cmd_output)
+        # Jitter keeps thousands of waiting games from polling in lockstep
+        retry_in = min(random.uniform(delay / 2, delay), remaining)
+        logging.debug(
+            f'Board for {player} not ready, polling again in {retry_in:.2f}s')
+        await asyncio.sleep(retry_in)
+        delay = min(delay * 2, max_delay)
 
-    bomb_orders = parser.compute_bomb_orders(update_matrix=True)
-    stone_orders = parser.compute_stone_orders(
-        player_1, player_2, update_matrix=True)
 
-    return {'bomb_orders': bomb_orders, 'stone_orders': stone_orders}
+async def compute_playing_positions(cli_transport, player_1, player_2, board_deadline=DEFAULT_BOARD_DEADLINE, game_id=None):
+    with tracing.span('compute_playing_positions', 'game', game=game_id):
+        cmd_output = await wait_for_board(cli_transport, player_1, time.monotonic() + board_deadline, game_id=game_id)
 
+        with tracing.span('plan_moves', game=game_id):
+            # Extract the board cells and convert them to a list
+            parser = scu.BoardParser(cmd_output)
+            shadow_board = parser.copy()
 
-def play_game(cli_exec, mrenclave, account_1, account_2):
-    player_1, player_2 = scu.sort_accounts_by_public_key(
-        [account_1, account_2])
+            bomb_orders = parser.compute_bomb_orders(update_matrix=True)
+            stone_orders = parser.compute_stone_orders(
+                player_1, player_2, update_matrix=True)
+
+    return {'bomb_orders': bomb_orders, 'stone_orders': stone_orders, 'shadow_board': shadow_board}
+
+
+def plan_game_moves(playing_positions, player_1, player_2):
+    moves = []
+
+    # Place bombs for player one
+    for order in playing_positions['bomb_orders']:
+        moves.append((drop_bomb, player_1, (order[1], order[0])))
+
+    for order in playing_positions['bomb_orders']:
+        moves.append((drop_bomb, player_2, (order[1], order[0])))
+
+    # Place stones alternatively for each player
+    for i in range(4):
+        for player in [player_1, player_2]:
+            order = playing_positions['stone_orders'][player][i]
+            moves.append((drop_stone, player, (order[0], order[1])))
 
+    return moves
+
+
+def apply_move(shadow_board, move):
+    move_fn, _, args = move
+    if move_fn is drop_bomb:
+        col, row = args
+        shadow_board.apply_bomb(row, col)
+    else:
+        direction, x = args
+        shadow_board.apply_stone(direction, x)
+
+
+async def play_move(cli_transport, move, game_id, shadow_board, verifier, last_move=False):
+    move_fn, player, args = move
+    await move_fn(cli_transport, player, *args, game_id)
+    apply_move(shadow_board, move)
+
+    if verifier.verify_move() or (last_move and verifier.verify_end()):
+        await verifier.verify(cli_transport, player, shadow_board, game_id)
+
+
+def count_game(finished):
+    metrics.get_run_metrics().increment(
+        'games-finished' if finished else 'games-failed')
+    return finished
+
+
+def get_game_id(account_1, account_2):
     epoch = int(time.time())
     player_names = f'{account_1.replace("//", "")}-{account_2.replace("//", "")}'
 
-    base_cli_cmd = scu.get_base_cli_cmd(cli_exec)
+    return f'{epoch}-{player_names}'
 
-    with open(f'game-logs/{epoch}-{player_names}-game.log', 'w+') as game_log_file:
 
-        logging.info(f'Starting game between {account_1} and {account_2}')
-        logging.info(f'Player 1 is {player_1}, Player 2 is {player_2}')
+async def prepare_game(cli_transport, player_1, player_2, game_id, queued_at=None, board_deadline=DEFAULT_BOARD_DEADLINE,
+                       verifier=None):
+    eventlog.emit('game-start', game_id, player_1, player_2=player_2)
+    playing_positions = await compute_playing_positions(
+        cli_transport, player_1, player_2, board_deadline, game_id)
+    if queued_at is not None:
+        board_ready = time.monotonic() - queued_at
+        metrics.get_run_metrics().record('board-ready', board_ready)
+        eventlog.emit('board-ready', game_id, player_1, latency=board_ready)
 
+    shadow_board = playing_positions['shadow_board']
+    if verifier is not None and verifier.verify_move():
+        await verifier.verify(cli_transport, player_1, shadow_board, game_id)
+
+    return plan_game_moves(playing_positions, player_1, player_2), shadow_board
+
+
+async def play_game(cli_transport, account_1, account_2, queued_at=None, board_deadline=DEFAULT_BOARD_DEADLINE, verifier=None):
+    verifier = verifier or BoardVerifier()
+    player_1, player_2 = scu.sort_accounts_by_public_key(
+        [account_1, account_2])
+
+    game_id = get_game_id(account_1, account_2)
+    started_at = time.time()
+
+    logging.info(f'Starting game between {account_1} and {account_2}')
+    logging.info(f'Player 1 is {player_1}, Player 2 is {player_2}')
+
+    with tracing.span('play_game', 'game', game=game_id, player_1=player_1, player_2=player_2):
         try:
-            playing_positions = compute_playing_positions(
-                base_cli_cmd + scu.get_trusted_cli_subcommand(player_1, mrenclave, 'get-board'), player_1, player_2)
-
-            check_board(base_cli_cmd + scu.get_trusted_cli_subcommand(player_1,
-                                                                      mrenclave, 'get-board'), player_1, game_log_file)
-            # Place bombs for player one
-            for order in playing_positions['bomb_orders']:
-                drop_bomb(base_cli_cmd + scu.get_trusted_cli_subcommand(player_1, mrenclave, 'drop-bomb'),
-                          player_1, order[1], order[0], game_log_file)
-                check_board(base_cli_cmd + scu.get_trusted_cli_subcommand(player_1,
-                                                                          mrenclave, 'get-board'), player_1, game_log_file)
-
-            for order in playing_positions['bomb_orders']:
-                drop_bomb(base_cli_cmd + scu.get_trusted_cli_subcommand(player_2, mrenclave, 'drop-bomb'),
-                          player_2, order[1], order[0], game_log_file)
-                check_board(base_cli_cmd + scu.get_trusted_cli_subcommand(player_2,
-                                                                          mrenclave, 'get-board'), player_2, game_log_file)
-
-            # Place stones alternatively for each player
-            for i in range(4):
-                for player in [player_1, player_2]:
-                    order = playing_positions['stone_orders'][player][i]
-                    drop_stone(base_cli_cmd + scu.get_trusted_cli_subcommand(player, mrenclave, 'drop-stone'),
-                               player, order[0], order[1], game_log_file)
-                    check_board(base_cli_cmd + scu.get_trusted_cli_subcommand(player,
-                                                                              mrenclave, 'get-board'), player, game_log_file)
+            moves, shadow_board = await prepare_game(cli_transport, player_1, player_2, game_id,
+                                                     queued_at, board_deadline, verifier)
+            for i, move in enumerate(moves):
+                await play_move(cli_transport, move, game_id, shadow_board, verifier,
+                                last_move=i == len(moves) - 1)
 
         except subprocess.CalledProcessError as cpe:
             logging.error(f'Game {account_1} <-> {account_2} failed to play turn: {cpe.output}')
+            eventlog.emit('game-end', game_id, started_at=started_at, latency=time.time() - started_at,
+                          outcome=metrics.OUTCOME_ERROR)
             return False
         except subprocess.TimeoutExpired as tee:
-            logging.error(f'Timeout expired for {player_names} game!')
+            logging.error(f'Timeout expired for {account_1} <-> {account_2} game!')
+            eventlog.emit('game-end', game_id, started_at=started_at, latency=time.time() - started_at,
+                          outcome=metrics.OUTCOME_TIMEOUT)
+            return False
+        except transport.TransportException as te:
+            logging.error(f'Game {account_1} <-> {account_2} failed to play turn: {te}')
+            eventlog.emit('game-end', game_id, started_at=started_at, latency=time.time() - started_at,
+                          outcome=metrics.OUTCOME_ERROR)
             return False
 
+        logging.info(
+            f'Game {player_1} <-> {player_2} finished succesfully!')
+        eventlog.emit('game-end', game_id, started_at=started_at,
+                      latency=time.time() - started_at)
+        return True
+
+
+async def play_limited_game(cli_transport, account_1, account_2, in_flight, queue_times,
+                            board_deadline=DEFAULT_BOARD_DEADLINE, verifier=None):
+    # The board exists once the last of both players is queued
+    queued_at = max(queue_times.get(account_1, 0.0),
+                    queue_times.get(account_2, 0.0)) or None
+    async with in_flight:
+        try:
+            return count_game(await play_game(cli_transport, account_1, account_2, queued_at, board_deadline, verifier))
+        except Exception as ex:
+            logging.error(f'Game {account_1} <-> {account_2} crashed: {ex}')
+            return count_game(False)
+
+
+async def run_games(cli_transport, player_pairs_list, max_in_flight, queue_times=None, board_deadline=DEFAULT_BOARD_DEADLINE,
+                    verifier=None):
+    in_flight = asyncio.Semaphore(max_in_flight)
+    queue_times = queue_times or {}
+
+    results = await asyncio.gather(*[play_limited_game(cli_transport, p[0], p[1], in_flight, queue_times,
+                                                       board_deadline, verifier)
+                                     for p in player_pairs_list])
+
+    finished_games = sum(1 for result in results if result)
     logging.info(
-        f'Game {player_1} <-> {player_2} finished succesfully!')
+        f'{finished_games}/{len(player_pairs_list)} game/s finished succesfully')
 
+    return results
 
-def launch_games(cli_exec, mrenclave, player_list, num_procs=None):
-    cli_extrinsic = ['queue-game']
 
-    cli_cmd = scu.get_base_cli_cmd(cli_exec) + cli_extrinsic
-    # Detect somehow if games get stuck
-    for player in player_list:
-        logging.info(f'"{player}" queueing for game')
-        cmd = cli_cmd + [player]
-        proc = subprocess.run(cmd, stdout=subprocess.PIPE,
-                              stderr=subprocess.STDOUT)
-        if proc.returncode != 0:
+class OpenLoopGame:
+    def __init__(self, account_1, account_2, moves, shadow_board, game_id):
+        self.account_1 = account_1
+        self.account_2 = account_2
+        self.moves = moves
+        self.shadow_board = shadow_board
+        self.game_id = game_id
+        self.started_at = time.time()
+        self.next_move = 0
+
+
+async def run_open_loop_games(cli_transport, player_pairs_list, profile, queue_times=None, board_deadline=DEFAULT_BOARD_DEADLINE,
+                              lag_tolerance=DEFAULT_LAG_TOLERANCE, verifier=None):
+    loop = asyncio.get_running_loop()
+    queue_times = queue_times or {}
+    pending_pairs = collections.deque(player_pairs_list)
+    results = []
+
+    async def play_scheduled_game(account_1, account_2, intended_at):
+        queued_at = max(queue_times.get(account_1, 0.0),
+                        queue_times.get(account_2, 0.0)) or None
+        try:
+            finished = await play_game(cli_transport, account_1, account_2, queued_at, board_deadline, verifier)
+        except Exception as ex:
+            logging.error(f'Game {account_1} <-> {account_2} crashed: {ex}')
+            finished = False
+
+        metrics.get_run_metrics().record('open-loop-game', loop.time() - intended_at,
+                                         metrics.OUTCOME_OK if finished else metrics.OUTCOME_ERROR)
+        results.append(count_game(finished))
+
+    def dispatch(intended_at):
+        if not pending_pairs:
+            return None
+
+        account_1, account_2 = pending_pairs.popleft()
+        return play_scheduled_game(account_1, account_2, intended_at)
+
+    await loadgen.run_open_loop(profile, dispatch, done=lambda: not pending_pairs,
+                                lag_tolerance=lag_tolerance)
+
+    if pending_pairs:
+        logging.warning(
+            f'Rate profile ended with {len(pending_pairs)} game/s never started')
+
+    return results
+
+
+async def run_open_loop_moves(cli_transport, player_pairs_list, profile, max_in_flight, queue_times=None,
+                              board_deadline=DEFAULT_BOARD_DEADLINE, lag_tolerance=DEFAULT_LAG_TOLERANCE, verifier=None):
+    verifier = verifier or BoardVerifier()
+    loop = asyncio.get_running_loop()
+    run_metrics = metrics.get_run_metrics()
+    queue_times = queue_times or {}
+    in_flight = asyncio.Semaphore(max_in_flight)
+    ready_games = collections.deque()
+    unfinished_games = set()
+    results = []
+
+    def finish_game(game, finished, outcome=metrics.OUTCOME_ERROR):
+        eventlog.emit('game-end', game.game_id, started_at=game.started_at, latency=time.time() - game.started_at,
+                      outcome=metrics.OUTCOME_OK if finished else outcome)
+        unfinished_games.discard(game)
+        results.append(count_game(finished))
+
+    async def open_game(account_1, account_2):
+        player_1, player_2 = scu.sort_accounts_by_public_key(
+            [account_1, account_2])
+        queued_at = max(queue_times.get(account_1, 0.0),
+                        queue_times.get(account_2, 0.0)) or None
+        game_id = get_game_id(account_1, account_2)
+
+        async with in_flight:
+            try:
+                moves, shadow_board = await prepare_game(cli_transport, player_1, player_2, game_id,
+                                                         queued_at, board_deadline, verifier)
+            except (subprocess.CalledProcessError, subprocess.TimeoutExpired, transport.TransportException) as ex:
+                logging.error(
+                    f'Game {account_1} <-> {account_2} failed to start: {ex}')
+                eventlog.emit('game-end', game_id, outcome=metrics.OUTCOME_ERROR)
+                results.append(count_game(False))
+                return
+
+        game = OpenLoopGame(account_1, account_2, moves, shadow_board, game_id)
+        unfinished_games.add(game)
+        ready_games.append(game)
+
+    async def play_scheduled_move(game, intended_at):
+        try:
+            await play_move(cli_transport, game.moves[game.next_move], game.game_id, game.shadow_board, verifier,
+                            last_move=game.next_move == len(game.moves) - 1)
+        except subprocess.TimeoutExpired:
+            run_metrics.record('open-loop-move', loop.time() -
+                               intended_at, metrics.OUTCOME_TIMEOUT)
+            logging.error(
+                f'Timeout expired for {game.account_1} <-> {game.account_2} game!')
+            finish_game(game, False, metrics.OUTCOME_TIMEOUT)
+            return
+        except (subprocess.CalledProcessError, transport.TransportException) as ex:
+            run_metrics.record('open-loop-move', loop.time() -
+                               intended_at, metrics.OUTCOME_ERROR)
             logging.error(
-                f'Error queueing game for {player}: {proc.stdout.decode("ascii")}')
+                f'Game {game.account_1} <-> {game.account_2} failed to play turn: {ex}')
+            finish_game(game, False)
+            return
+
+        run_metrics.record('open-loop-move', loop.time() - intended_at)
+
+        game.next_move += 1
+        if game.next_move < len(game.moves):
+            ready_games.append(game)
         else:
             logging.info(
-                f'"{player}" queued succesfully: {proc.stdout.decode("ascii")}!')
+                f'Game {game.account_1} <-> {game.account_2} finished succesfully!')
+            finish_game(game, True)
+
+    # Moves are only scheduled once every board is ready, so waiting for
+    # boards is not mistaken for the generator having no game to move
+    await asyncio.gather(*[open_game(p[0], p[1]) for p in player_pairs_list])
+
+    def dispatch(intended_at):
+        if not ready_games:
+            return None
+
+        return play_scheduled_move(ready_games.popleft(), intended_at)
+
+    await loadgen.run_open_loop(profile, dispatch, done=lambda: not unfinished_games,
+                                lag_tolerance=lag_tolerance)
+
+    if unfinished_games:
+        logging.warning(
+            f'Rate profile ended with {len(unfinished_games)} game/s unfinished')
+        for game in list(unfinished_games):
+            finish_game(game, False)
+
+    return results
+
+
+async def queue_player(cli_transport, player):
+    logging.info(f'"{player}" queueing for game')
+    submitted_at = time.monotonic()
+    try:
+        with tracing.span('queue_player', 'queue', player=player):
+            output = await run_operation(cli_transport, 'queue-game', player)
+    except subprocess.CalledProcessError as cpe:
+        logging.error(f'Error queueing game for {player}: {cpe.output}')
+        return False
+    except subprocess.TimeoutExpired:
+        logging.error(f'Timeout expired queueing game for {player}!')
+        return False
+    except transport.TransportException as te:
+        # Transports other than the CLI fail this way, the transport and the
+        # event log already recorded the call as an error
+        logging.error(f'Error queueing game for {player}: {te}')
+        return False
+    else:
+        logging.info(f'"{player}" queued succesfully: {output}!')
+        if (extrinsic_hash := chain_monitor.find_extrinsic_hash(output)) is not None:
+            chain_monitor.track(extrinsic_hash, 'queue-game', submitted_at)
+        return True
+
+
+async def queue_players(cli_transport, player_list, max_in_flight=DEFAULT_MAX_IN_FLIGHT, queue_rate=None, wave_size=None,
+                        queue_times=None, on_queued=None):
+    run_metrics = metrics.get_run_metrics()
+    in_flight = asyncio.Semaphore(max_in_flight)
+    queue_times = {} if queue_times is None else queue_times
+
+    async def queue_arrival(player, arrived_at):
+        async with in_flight:
+            queued = await queue_player(cli_transport, player)
+
+        # Measured from the arrival, so waiting for a free slot counts too
+        run_metrics.record('queue-latency', time.monotonic() - arrived_at,
+                           metrics.OUTCOME_OK if queued else metrics.OUTCOME_ERROR)
+        if queued:
+            queue_times[player] = time.monotonic()
+            if on_queued is not None:
+                on_queued(player)
+
+    wave_size = wave_size or (1 if queue_rate else max(len(player_list), 1))
+    waves = [player_list[i:i + wave_size] for i in range(0, len(player_list), wave_size)]
+
+    start = time.monotonic()
+    arrivals = []
+    for i, wave in enumerate(waves):
+        if queue_rate:
+            # Waves arrive on schedule whether or not earlier ones are queued
+            arrived_at = start + i * wave_size / queue_rate
+            await asyncio.sleep(max(arrived_at - time.monotonic(), 0.0))
+            arrivals.extend(asyncio.ensure_future(queue_arrival(player, arrived_at)) for player in wave)
+        else:
+            # Otherwise a wave arrives once the previous one is queued
+            arrived_at = time.monotonic()
+            await asyncio.gather(*[queue_arrival(player, arrived_at) for player in wave])
+    await asyncio.gather(*arrivals)
+
+    logging.info(
+        f'{len(queue_times)}/{len(player_list)} player/s queued in {time.monotonic() - start:.1f}s')
+    return queue_times
+
+
+def get_player_ids(player_list):
+    # Boards may name players by account URI, public key or SS58 address
+    player_ids = {}
+    for player in player_list:
+        public_key = scu.get_public_key(player)
+        for player_id in (player, public_key.hex(), f'0x{public_key.hex()}', ss58_encode(public_key)):
+            player_ids[player_id] = player
+
+    return player_ids
+
+
+def identify_player(player_ids, board_player):
+    for word in re.findall(r'[\w/]+', board_player):
+        if (player := player_ids.get(word)) is not None:
+            return player
+    return None
+
+
+class Matchmaker:
+    # Finds out who got paired with whom by polling the boards of queued
+    # players, matchmaking does not necessarily pair them in queue order
+    def __init__(self, cli_transport, queue_times, board_deadline=DEFAULT_BOARD_DEADLINE,
+                 max_in_flight=DEFAULT_MAX_IN_FLIGHT, poll_interval=MATCH_POLL_INTERVAL, on_matched=None,
+                 on_unmatched=None):
+        self.cli_transport = cli_transport
+        self.queue_times = queue_times
+        self.board_deadline = board_deadline
+        self.poll_interval = poll_interval
+        self.in_flight = asyncio.Semaphore(max_in_flight)
+        self.on_matched = on_matched or (lambda player_1, player_2: self.pairs.append((player_1, player_2)))
+        self.on_unmatched = on_unmatched or (lambda player: None)
+        self.player_ids = {}
+        self.opponents = {}
+        self.unnamed_player = None
+        self.discoveries = set()
+        self.pairs = []
+
+    def add_player(self, player, discover=True):
+        # Polling starts right away so time to match is not bounded by the
+        # time it takes to queue every other player. Players queueing again
+        # start over. Players not discovered themselves are only found on
+        # the board of their opponent.
+        self.player_ids.update(get_player_ids([player]))
+        self.opponents.pop(player, None)
+        if not discover:
+            return
+        discovery = asyncio.ensure_future(self.discover_match(player))
+        self.discoveries.add(discovery)
+        discovery.add_done_callback(self.discoveries.discard)
+
+    def set_matched(self, player, opponent, matched_at):
+        if player in self.opponents:
+            return False
+
+        self.opponents[player] = opponent
+        if player in self.queue_times:
+            metrics.get_run_metrics().record('time-to-match', matched_at - self.queue_times[player])
+        return True
+
+    def add_pair(self, player_1, player_2):
+        metrics.get_run_metrics().increment('players-matched', 2)
+        self.on_matched(player_1, player_2)
+
+    async def poll_board(self, player):
+        try:
+            async with self.in_flight:
+                return await check_board(self.cli_transport, player, None, MATCH_POLL_METRIC)
+        except subprocess.CalledProcessError as cpe:
+            return cpe.output or ''
+        except (subprocess.TimeoutExpired, transport.TransportException):
+            return ''
+
+    async def discover_match(self, player):
+        with tracing.span('discover_match', 'queue', player=player):
+            deadline = self.queue_times[player] + self.board_deadline
+            while True:
+                # Either player of a game finding the board settles the match of both
+                if player in self.opponents:
+                    return
+                if time.monotonic() > deadline:
+                    logging.error(f'"{player}" was not matched within {self.board_deadline:g}s')
+                    metrics.get_run_metrics().increment('players-unmatched')
+                    self.on_unmatched(player)
+                    return
+
+                output = await self.poll_board(player)
+                if player not in self.opponents and 'could not fetch board' not in output and '[[' in output:
+                    break
+                await asyncio.sleep(random.uniform(self.poll_interval / 2, self.poll_interval))
 
-    logging.info(f'Waiting 45s for boards to initialize...')
-    time.sleep(45)
-    logging.info(f'Starting games...')
-    player_pairs_list = [(cli_exec, mrenclave, p[0], p[1])
-                         for p in zip(player_list[::2], player_list[1::2])]
+            matched_at = time.monotonic()
+            board_players = scu.parse_board_players(output)
+            named = [identify_player(self.player_ids, board_player) for board_player in board_players or []]
+            if player not in named:
+                # Without names, players are paired in the order their boards show up
+                self.set_matched(player, None, matched_at)
+                if self.unnamed_player is None:
+                    self.unnamed_player = player
+                else:
+                    self.add_pair(self.unnamed_player, player)
+                    self.unnamed_player = None
+                return
 
+            opponent = next((other for other in named if other is not None and other != player), None)
+            if opponent is None:
+                logging.warning(f'"{player}" was matched with an account outside this run: {board_players}')
+                metrics.get_run_metrics().increment('foreign-matches')
+                self.set_matched(player, None, matched_at)
+                self.on_unmatched(player)
+                return
+
+            self.set_matched(player, opponent, matched_at)
+            if self.set_matched(opponent, player, matched_at):
+                self.add_pair(player, opponent)
+
+    async def get_pairs(self):
+        while self.discoveries:
+            await asyncio.gather(*list(self.discoveries))
+
+        if self.unnamed_player is not None:
+            logging.error(f'Skipping "{self.unnamed_player}", no matched player is left to play against')
+            self.unnamed_player = None
+
+        return self.pairs
+
+
+async def run_matchmaking(cli_transport, player_list, max_in_flight=DEFAULT_MAX_IN_FLIGHT, queue_rate=None,
+                          wave_size=None, board_deadline=DEFAULT_BOARD_DEADLINE, poll_interval=MATCH_POLL_INTERVAL):
+    scu.raise_open_files_limit()
+    start = time.monotonic()
+
+    queue_times = {}
+    matchmaker = Matchmaker(cli_transport, queue_times, board_deadline, max_in_flight, poll_interval)
+    await queue_players(cli_transport, player_list, max_in_flight, queue_rate, wave_size,
+                        queue_times, matchmaker.add_player)
+    player_pairs_list = await matchmaker.get_pairs()
+
+    logging.info(
+        f'{len(player_pairs_list)} game/s matched in {time.monotonic() - start:.1f}s')
+    return queue_times, player_pairs_list
+
+
+async def run_matched_games(cli_transport, player_list, max_in_flight=DEFAULT_MAX_IN_FLIGHT, queue_rate=None,
+                            wave_size=None, board_deadline=DEFAULT_BOARD_DEADLINE, poll_interval=MATCH_POLL_INTERVAL,
+                            verifier=None):
+    # Every game starts as soon as the matchmaker finds it, rather than once
+    # the last player is matched or gave up
+    scu.raise_open_files_limit()
+    start = time.monotonic()
+
+    queue_times = {}
+    in_flight = asyncio.Semaphore(max_in_flight)
+    games = []
+
+    def start_game(account_1, account_2):
+        games.append(asyncio.ensure_future(play_limited_game(cli_transport, account_1, account_2, in_flight,
+                                                             queue_times, board_deadline, verifier)))
+
+    logging.info(f'Running games with at most {max_in_flight} in flight over the "{cli_transport.name}" '
+                 f'transport, each as soon as it is matched')
+    matchmaker = Matchmaker(cli_transport, queue_times, board_deadline, max_in_flight, poll_interval,
+                            on_matched=start_game)
+    await queue_players(cli_transport, player_list, max_in_flight, queue_rate, wave_size,
+                        queue_times, matchmaker.add_player)
+    await matchmaker.get_pairs()
+    logging.info(
+        f'{len(games)} game/s matched in {time.monotonic() - start:.1f}s')
+
+    results = await asyncio.gather(*games)
+
+    finished_games = sum(1 for result in results if result)
+    logging.info(
+        f'{finished_games}/{len(games)} game/s finished succesfully')
+
+    return results
+
+
+async def run_pairs(cli_transport, player_pairs_list, max_in_flight=DEFAULT_MAX_IN_FLIGHT, queue_times=None,
+                    board_deadline=DEFAULT_BOARD_DEADLINE, open_loop=None, rate_profile=None,
+                    lag_tolerance=DEFAULT_LAG_TOLERANCE, verifier=None):
+    logging.info(
+        f'Starting games as soon as their boards are ready, waiting up to {board_deadline}s each...')
+
+    # Every game in flight keeps a CLI subprocess open
+    scu.raise_open_files_limit()
+
+    if open_loop == 'games':
+        logging.info(
+            f'Starting games open loop over the "{cli_transport.name}" transport')
+        return await run_open_loop_games(cli_transport, player_pairs_list, rate_profile,
+                                         queue_times, board_deadline, lag_tolerance, verifier)
+    elif open_loop == 'moves':
+        logging.info(
+            f'Scheduling moves open loop over the "{cli_transport.name}" transport')
+        return await run_open_loop_moves(cli_transport, player_pairs_list, rate_profile, max_in_flight,
+                                         queue_times, board_deadline, lag_tolerance, verifier)
+
+    logging.info(
+        f'Running games with at most {max_in_flight} in flight over the "{cli_transport.name}" transport')
+
+    return await run_games(cli_transport, player_pairs_list, max_in_flight, queue_times, board_deadline, verifier)
+
+
+def launch_games(cli_transport, player_list, max_in_flight=DEFAULT_MAX_IN_FLIGHT, board_deadline=DEFAULT_BOARD_DEADLINE,
+                 open_loop=None, rate_profile=None, lag_tolerance=DEFAULT_LAG_TOLERANCE, verifier=None,
+                 queue_rate=None, queue_wave=None, match_poll_interval=MATCH_POLL_INTERVAL):
+    if open_loop is None:
+        return asyncio.run(run_matched_games(cli_transport, player_list, max_in_flight, queue_rate, queue_wave,
+                                             board_deadline, match_poll_interval, verifier))
+
+    # Open loop runs are scheduled over every matched game, so matchmaking
+    # still in progress is not mistaken for nothing being ready to serve
+    queue_times, player_pairs_list = asyncio.run(run_matchmaking(
+        cli_transport, player_list, max_in_flight, queue_rate, queue_wave, board_deadline, match_poll_interval))
+
+    return asyncio.run(run_pairs(cli_transport, player_pairs_list, max_in_flight, queue_times, board_deadline,
+                                 open_loop, rate_profile, lag_tolerance, verifier))
+
+
+async def cycle_games(cli_transport, player_list, deadline, limiter, max_in_flight=DEFAULT_MAX_IN_FLIGHT,
+                      board_deadline=DEFAULT_BOARD_DEADLINE, verifier=None, match_poll_interval=MATCH_POLL_INTERVAL,
+                      on_game_end=None, should_stop=None):
+    queue_times = {}
+    matched_pairs = asyncio.Queue()
+    requeues = set()
+    games = set()
+
+    # Accounts cycle from the queue through a game and back into the queue,
+    # nothing is kept per game so memory stays flat however long the run
+    matchmaker = Matchmaker(cli_transport, queue_times, board_deadline, max_in_flight, match_poll_interval,
+                            on_matched=lambda player_1, player_2: matched_pairs.put_nowait((player_1, player_2)),
+                            on_unmatched=lambda player: recycle([player]))
+
+    async def requeue(player):
+        delay = 1.0
+        while time.monotonic() < deadline:
+            if await queue_player(cli_transport, player):
+                queue_times[player] = time.monotonic()
+                matchmaker.add_player(player)
+                return
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
+
+    def recycle(players):
+        for player in players:
+            task = asyncio.ensure_future(requeue(player))
+            requeues.add(task)
+            task.add_done_callback(requeues.discard)
+
+    async def play_matched_game(account_1, account_2):
+        try:
+            try:
+                finished = await play_game(cli_transport, account_1, account_2, None, board_deadline, verifier)
+            except Exception as ex:
+                logging.error(f'Game {account_1} <-> {account_2} crashed: {ex}')
+                finished = False
+            finished = count_game(finished)
+            if on_game_end is not None:
+                on_game_end(finished)
+            recycle([account_1, account_2])
+        finally:
+            await limiter.release()
+
+    scu.raise_open_files_limit()
+    recycle(player_list)
+    try:
+        # Short waits so that the deadline and stop requests are noticed
+        while time.monotonic() < deadline and not (should_stop is not None and should_stop()):
+            try:
+                await asyncio.wait_for(limiter.acquire(), 1.0)
+            except asyncio.TimeoutError:
+                continue
+            try:
+                account_1, account_2 = await asyncio.wait_for(matched_pairs.get(), 1.0)
+            except asyncio.TimeoutError:
+                await limiter.release()
+                continue
+
+            game = asyncio.ensure_future(play_matched_game(account_1, account_2))
+            games.add(game)
+            game.add_done_callback(games.discard)
+
+        # Games in progress are played to the end
+        while games:
+            await asyncio.gather(*list(games))
+    finally:
+        for task in list(requeues) + list(matchmaker.discoveries):
+            task.cancel()
+
+
+async def run_soak(cli_transport, soak_run, player_list, max_in_flight=DEFAULT_MAX_IN_FLIGHT,
+                   board_deadline=DEFAULT_BOARD_DEADLINE, verifier=None, match_poll_interval=MATCH_POLL_INTERVAL,
+                   checkpoint_interval=60.0):
+    run_metrics = metrics.get_run_metrics()
+
+    async def record_progress():
+        next_bucket = time.monotonic() + soak_run.bucket_length
+        next_checkpoint = time.monotonic() + checkpoint_interval
+        while True:
+            await asyncio.sleep(max(min(next_bucket, next_checkpoint) - time.monotonic(), 0.0))
+            now = time.monotonic()
+            if now >= next_bucket:
+                soak_run.close_bucket(run_metrics.take_window())
+                next_bucket += soak_run.bucket_length
+                logging.info(f'Soak at {soak_run.elapsed:.0f}/{soak_run.duration:.0f}s, {soak_run.games_finished} '
+                             f'game/s finished and {soak_run.games_failed} failed')
+            if now >= next_checkpoint:
+                soak_run.write_checkpoint(run_metrics)
+                next_checkpoint += checkpoint_interval
+
+    logging.info(f'Soaking for {soak_run.remaining:.0f}s with {len(player_list)} account/s, at most '
+                 f'{max_in_flight} game/s in flight over the "{cli_transport.name}" transport')
+
+    run_metrics.take_window()
+    progress = asyncio.ensure_future(record_progress())
+    try:
+        await cycle_games(cli_transport, player_list, time.monotonic() + soak_run.remaining,
+                          asyncio.Semaphore(max_in_flight), max_in_flight, board_deadline, verifier,
+                          match_poll_interval, on_game_end=soak_run.add_game)
+    finally:
+        progress.cancel()
+
+    soak_run.close_bucket(run_metrics.take_window())
+    run_metrics.stop_windows()
+    soak_run.write_checkpoint(run_metrics, finished=True)
+    logging.info(f'Soak finished, {soak_run.games_finished} game/s finished and {soak_run.games_failed} failed, '
+                 f'trends written to {soak_run.trends_path}')
+
+
+async def run_adaptive(cli_transport, controller, player_list, duration, interval=10.0, max_in_flight=DEFAULT_MAX_IN_FLIGHT,
+                       board_deadline=DEFAULT_BOARD_DEADLINE, verifier=None, match_poll_interval=MATCH_POLL_INTERVAL):
+    run_metrics = metrics.get_run_metrics()
+    limiter = adaptive.ConcurrencyLimiter(controller.limit)
+
+    async def control():
+        while True:
+            await asyncio.sleep(interval)
+            controller.update(run_metrics.take_window(), interval, limiter.take_peak())
+            await limiter.set_limit(controller.limit)
+
+    logging.info(f'Searching the saturation point for up to {duration:g}s, starting at {controller.limit} '
+                 f'game/s in flight and at most {controller.maximum}')
+
+    run_metrics.take_window()
+    controlling = asyncio.ensure_future(control())
+    try:
+        await cycle_games(cli_transport, player_list, time.monotonic() + duration, limiter, max_in_flight,
+                          board_deadline, verifier, match_poll_interval, should_stop=lambda: controller.converged)
+    finally:
+        controlling.cancel()
+        run_metrics.stop_windows()
+
+    if controller.converged:
+        logging.info('Concurrency converged')
+
+
+class ScenarioAccounts:
+    # Accounts are taken while queued or playing. Games are the pairs the
+    # matchmaker discovers, not necessarily the players an operation queued,
+    # and their players are given back once the game is over.
+    def __init__(self, account_names, cli_transport, board_deadline=DEFAULT_BOARD_DEADLINE,
+                 max_in_flight=DEFAULT_MAX_IN_FLIGHT, match_poll_interval=MATCH_POLL_INTERVAL):
+        self.account_names = list(account_names)
+        self.idle_accounts = collections.deque(account_names)
+        self.returned = asyncio.Event()
+        self.queue_times = {}
+        self.matched_pairs = asyncio.Queue()
+        self.matchmaker = Matchmaker(cli_transport, self.queue_times, board_deadline, max_in_flight,
+                                     match_poll_interval, on_matched=lambda *pair: self.matched_pairs.put_nowait(pair),
+                                     on_unmatched=lambda player: self.give_back([player]))
+
+    def pick(self):
+        return random.choice(self.account_names)
+
+    async def take(self, count, timeout=None):
+        # Waits for accounts to be given back, None when none are in time
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while len(self.idle_accounts) < count:
+            self.returned.clear()
+            try:
+                await asyncio.wait_for(self.returned.wait(),
+                                       None if deadline is None else max(deadline - time.monotonic(), 0.0))
+            except asyncio.TimeoutError:
+                return None
+        return [self.idle_accounts.popleft() for _ in range(count)]
+
+    def give_back(self, account_names):
+        self.idle_accounts.extend(account_names)
+        self.returned.set()
+
+    async def queue(self, cli_transport, players, discover=True):
+        queued = [False] * len(players)
+        try:
+            queued = await asyncio.gather(*[queue_player(cli_transport, player) for player in players])
+        finally:
+            # Queued players belong to the matchmaker until their game is
+            # over, the others are idle again right away
+            for player, player_queued in zip(players, queued):
+                if player_queued:
+                    self.queue_times[player] = time.monotonic()
+                    self.matchmaker.add_player(player, discover)
+            self.give_back([player for player, player_queued in zip(players, queued) if not player_queued])
+        return all(queued)
+
+    async def next_pair(self, timeout):
+        try:
+            return await asyncio.wait_for(self.matched_pairs.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def release_pairs(self):
+        # Games nobody got around to playing
+        while not self.matched_pairs.empty():
+            self.give_back(self.matched_pairs.get_nowait())
+
+    def stop(self):
+        self.release_pairs()
+        for discovery in list(self.matchmaker.discoveries):
+            discovery.cancel()
+
+
+async def run_scenario_operation(cli_transport, operation, scenario_accounts, board_deadline=DEFAULT_BOARD_DEADLINE,
+                                 verifier=None, take_timeout=None):
+    # Returns whether the operation succeeded, or None without an idle
+    # account to run it with before the phase ends
+    if operation == 'get-board':
+        await check_board(cli_transport, scenario_accounts.pick(), None)
+        return True
+    elif operation == 'set-balance':
+        return await generate_player_account(cli_transport, scenario_accounts.pick(), DEFAULT_BALANCE, subprocess.PIPE)
+    elif operation == 'queue-game':
+        # Queued accounts stay taken until a "game" operation plays the game
+        # they end up in, if ever
+        if (players := await scenario_accounts.take(1, take_timeout)) is None:
+            return None
+        return await scenario_accounts.queue(cli_transport, players, discover=False)
+
+    if (players := await scenario_accounts.take(2, take_timeout)) is None:
+        return None
+    if not await scenario_accounts.queue(cli_transport, players):
+        return False
+
+    # Any game the matchmaker found is played, every operation queues the
+    # two players of one
+    if (pair := await scenario_accounts.next_pair(board_deadline)) is None:
+        return False
     try:
-        os.mkdir('game-logs')
-    except Exception:
-        pass
-    
-    if num_procs is None:
-        proc_count = min(len(os.sched_getaffinity(0)), len(player_pairs_list))
+        queued_at = max(scenario_accounts.queue_times.get(player, time.monotonic()) for player in pair)
+        return count_game(await play_game(cli_transport, pair[0], pair[1], queued_at, board_deadline, verifier))
+    finally:
+        scenario_accounts.give_back(pair)
+
+
+async def run_scenario_phase(cli_transport, phase, scenario_accounts, board_deadline=DEFAULT_BOARD_DEADLINE,
+                             lag_tolerance=DEFAULT_LAG_TOLERANCE, verifier=None):
+    loop = asyncio.get_running_loop()
+    run_metrics = metrics.get_run_metrics()
+    operations = list(phase.mix)
+    weights = list(phase.mix.values())
+    profile = phase.get_rate_profile()
+    deadline = loop.time() + (profile.duration if profile is not None else phase.duration)
+
+    async def run_one(intended_at=None):
+        operation = random.choices(operations, weights)[0]
+        start = intended_at or loop.time()
+        try:
+            succeeded = await run_scenario_operation(cli_transport, operation, scenario_accounts, board_deadline,
+                                                     verifier, max(deadline - loop.time(), 0.0))
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, transport.TransportException) as ex:
+            logging.debug(f'Scenario operation "{operation}" failed: {ex}')
+            succeeded = False
+
+        if succeeded is None:
+            run_metrics.increment(f'{phase.name}:{operation}-skipped')
+        else:
+            run_metrics.record(f'{phase.name}:{operation}', loop.time() - start,
+                               metrics.OUTCOME_OK if succeeded else metrics.OUTCOME_ERROR)
+
+    if profile is not None:
+        in_flight = asyncio.Semaphore(phase.concurrency)
+
+        async def run_limited(intended_at):
+            async with in_flight:
+                await run_one(intended_at)
+
+        await loadgen.run_open_loop(profile, run_limited, lag_tolerance=lag_tolerance)
     else:
-        proc_count = num_procs
+        async def run_worker():
+            while loop.time() < deadline:
+                await run_one()
+                if phase.think_time:
+                    await asyncio.sleep(phase.think_time)
+
+        await asyncio.gather(*[run_worker() for _ in range(phase.concurrency)])
+
+    scenario_accounts.release_pairs()
+
+
+def launch_scenario(cli_transport, workload, player_list, board_deadline=DEFAULT_BOARD_DEADLINE,
+                    lag_tolerance=DEFAULT_LAG_TOLERANCE, verifier=None, max_in_flight=DEFAULT_MAX_IN_FLIGHT,
+                    match_poll_interval=MATCH_POLL_INTERVAL):
+    scu.raise_open_files_limit()
+
+    async def run_phases():
+        scenario_accounts = ScenarioAccounts(player_list, cli_transport, board_deadline, max_in_flight,
+                                             match_poll_interval)
+        try:
+            for phase in workload.phases:
+                logging.info(f'Scenario "{workload.name}" phase "{phase.name}": {phase.mix}, '
+                             f'{phase.concurrency} in flight, {phase.duration:g}s')
+                await run_scenario_phase(cli_transport, phase, scenario_accounts, board_deadline,
+                                         lag_tolerance, verifier)
+        finally:
+            scenario_accounts.stop()
+
+    asyncio.run(run_phases())
+
+
+def launch_distributed_games(coordinator, cli_transport, player_list, max_in_flight=DEFAULT_MAX_IN_FLIGHT,
+                             board_deadline=DEFAULT_BOARD_DEADLINE, queue_rate=None, queue_wave=None,
+                             match_poll_interval=MATCH_POLL_INTERVAL):
+    # Matchmaking stays here, agents only play the matched games
+    queue_times, player_pairs_list = asyncio.run(run_matchmaking(
+        cli_transport, player_list, max_in_flight, queue_rate, queue_wave, board_deadline, match_poll_interval))
+
+    # Agents rebuild the queue times on their own monotonic clock
+    now = time.monotonic()
+    queued_ago = [now - max(queue_times[player_1], queue_times[player_2])
+                  for player_1, player_2 in player_pairs_list]
+
+    results = coordinator.play(player_pairs_list, queued_ago)
+    finished_games = sum(1 for result in results if result)
+    logging.info(
+        f'{finished_games}/{len(player_pairs_list)} game/s finished succesfully across all agents')
 
-    with Pool(proc_count) as pool:
-        pool.starmap(play_game, player_pairs_list)
+    return results
+
+
+def run_agent(coordinator_address, agent_name, cli_transport, verbose=False, max_in_flight=DEFAULT_MAX_IN_FLIGHT,
+              board_deadline=DEFAULT_BOARD_DEADLINE, open_loop=None, rate_profile=None,
+              lag_tolerance=DEFAULT_LAG_TOLERANCE, verifier=None):
+    stdout_type = subprocess.PIPE if verbose else subprocess.DEVNULL
+
+    async def setup(message):
+        logging.info(f'Setting funds of {len(message["accounts"])} account/s...')
+        results = await set_player_balances(cli_transport, message['accounts'], message['balance'],
+                                            stdout_type, max_in_flight)
+        return {'type': 'setup-done', 'results': results}
+
+    async def assign(message):
+        now = time.monotonic()
+        player_pairs_list = [tuple(pair) for pair in message['pairs']]
+        queue_times = {}
+        for (player_1, player_2), ago in zip(player_pairs_list, message['queued_ago']):
+            queue_times[player_1] = queue_times[player_2] = now - ago
+
+        results = await run_pairs(cli_transport, player_pairs_list, max_in_flight, queue_times, board_deadline,
+                                  open_loop, rate_profile, lag_tolerance, verifier)
+        return {'type': 'done', 'results': results}
+
+    asyncio.run(distributed.run_agent(coordinator_address, {'setup': setup, 'assign': assign},
+                                      agent_name))
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument('--games', required=True,
-                        help='Amount of games to play', type=int)
-    parser.add_argument('--processes', required=False, help='Maximum number of processes tu launch, detaults to "len(os.sched_getaffinity(0))"', type=int)
+    parser.add_argument('--games', required=False,
+                        help='Amount of games to play, required unless running as "--agent"', type=int)
+    parser.add_argument('--scenario', required=False,
+                        help='Run the weighted operation mix and phases of this YAML, TOML or JSON scenario file instead of "--games"', type=str)
+    parser.add_argument('--soak', required=False,
+                        help='Keep playing games for that many seconds, queueing the "--games" account pairs again as their games end', type=float)
+    parser.add_argument('--soak-bucket', required=False, default=300.0,
+                        help='Seconds of each throughput and latency trend bucket of a soak run, defaults to 300', type=float)
+    parser.add_argument('--checkpoint', required=False,
+                        help='File a soak run periodically saves its progress and metrics to, defaults to "<report>-checkpoint.json"', type=str)
+    parser.add_argument('--checkpoint-interval', required=False, default=60.0,
+                        help='Seconds between soak checkpoints, defaults to 60', type=float)
+    parser.add_argument('--resume', required=False,
+                        help='Resume the soak run of this checkpoint, its "--soak", "--games" and "--report" are reused', type=str)
+    parser.add_argument('--adaptive', required=False,
+                        help='Adjust the games in flight for up to that many seconds to find the highest sustainable throughput '
+                        'and the concurrency where latency knees, "--games" account pairs bound the concurrency', type=float)
+    parser.add_argument('--adaptive-interval', required=False, default=10.0,
+                        help='Seconds between concurrency adjustments of "--adaptive", defaults to 10', type=float)
+    parser.add_argument('--adaptive-step', required=False, default=4,
+                        help='Games added to the concurrency after a healthy interval, defaults to 4', type=int)
+    parser.add_argument('--latency-factor', required=False, default=2.0,
+                        help='Back off once the p99 of trusted calls exceeds the lowest p99 seen that many times, defaults to 2', type=float)
+    parser.add_argument('--latency-target-ms', required=False,
+                        help='Back off once the p99 of trusted calls exceeds this instead of using "--latency-factor"', type=float)
+    parser.add_argument('--max-error-rate', required=False, default=0.02,
+                        help='Back off once that fraction of trusted calls fails or times out, defaults to 0.02', type=float)
+    parser.add_argument('--max-in-flight', '--processes', required=False, default=DEFAULT_MAX_IN_FLIGHT, dest='max_in_flight',
+                        help=f'Maximum number of games played concurrently, defaults to {DEFAULT_MAX_IN_FLIGHT}', type=int)
+    parser.add_argument('--board-deadline', required=False, default=DEFAULT_BOARD_DEADLINE,
+                        help=f'Seconds a game waits for its board after queueing, defaults to {DEFAULT_BOARD_DEADLINE:g}', type=float)
+    parser.add_argument('--queue-rate', required=False,
+                        help='Players queued per second, defaults to as fast as "--max-in-flight" allows', type=float)
+    parser.add_argument('--queue-wave', required=False,
+                        help='Players queued together in each wave, a wave starts once the previous one is queued '
+                        'unless "--queue-rate" schedules them, defaults to 1 with "--queue-rate" and all players otherwise', type=int)
+    parser.add_argument('--match-poll-interval', required=False, default=MATCH_POLL_INTERVAL,
+                        help=f'Seconds between board polls finding out who a queued player was matched with, bounds the '
+                        f'resolution of the time to match, defaults to {MATCH_POLL_INTERVAL:g}', type=float)
+    parser.add_argument('--open-loop', required=False, choices=['games', 'moves'],
+                        help='Schedule game starts or moves at the rate given by "--rate-profile" instead of a fixed pool', type=str)
+    parser.add_argument('--rate-profile', required=False,
+                        help='Arrivals per second for "--open-loop", e.g. "step:rates=5/10/20,step=30", '
+                        '"ramp:start=1,end=50,duration=120" or "spike:base=5,peak=50,duration=120,at=60,length=10"', type=str)
+    parser.add_argument('--lag-tolerance', required=False, default=DEFAULT_LAG_TOLERANCE,
+                        help=f'Seconds an arrival may start late before the generator counts as behind schedule, defaults to {DEFAULT_LAG_TOLERANCE}', type=float)
+    parser.add_argument('--verify-board', required=False, default='every', choices=BoardVerifier.MODES,
+                        help='When to fetch the board and compare it with the locally predicted one: after every move, '
+                        'after a sample of moves, at the end of the game only or never, defaults to "every"', type=str)
+    parser.add_argument('--verify-sample-rate', required=False, default=0.1,
+                        help='Fraction of moves verified with "--verify-board sampled", defaults to 0.1', type=float)
     parser.add_argument('--container', required=False, default='stress_tester-worker-1',
                         help='Name of the worker container from which to extract the "integritee-cli"', type=str)
+    parser.add_argument('--cli-path', required=False,
+                        help='Use this "integritee-cli" binary instead of extracting it from "--container"', type=str)
+    parser.add_argument('--coordinator', required=False,
+                        help='Listen on this "host:port" and spread setting balances and playing games across "--agents" agent processes', type=str)
+    parser.add_argument('--agents', required=False, default=1,
+                        help='Number of agents the coordinator waits for, defaults to 1', type=int)
+    parser.add_argument('--agent', required=False,
+                        help='Run as an agent of the coordinator at this "host:port", "--games" is then ignored', type=str)
+    parser.add_argument('--agent-name', required=False,
+                        help='Name reported by this agent to the coordinator, defaults to "<hostname>-<pid>"', type=str)
+    parser.add_argument('--funding-batch-size', required=False,
+                        help='Pack that many transfers into each "Utility.batch_all" when funding accounts', type=int)
+    parser.add_argument('--funding-max-pending', required=False, default=256,
+                        help='Maximum number of funding extrinsics awaiting inclusion, defaults to 256', type=int)
+    parser.add_argument('--account-pool', required=False, default=accounts.DEFAULT_POOL_PATH,
+                        help=f'File caching derived keypairs and trusted balances between runs, defaults to "{accounts.DEFAULT_POOL_PATH}"', type=str)
+    parser.add_argument('--refresh-trusted-balances', required=False,
+                        help='Run "set-balance" for every account even if the account pool says it is funded, without first '
+                        'checking one of the cached balances on the worker', action='store_true')
+    parser.add_argument('--transport', required=False, default=transport.CliTransport.name,
+                        choices=[transport.CliTransport.name, transport.WorkerRpcTransport.name, simulator.SimulatedTransport.name],
+                        help='Run trusted operations by forking "integritee-cli", over pooled worker RPC websockets with '
+                        '"--worker-codec" or against an in-process simulator without node and worker, defaults to "cli"', type=str)
+    parser.add_argument('--worker-url', required=False, default='wss://127.0.0.1:2011',
+                        help='Worker direct RPC endpoint used by the "rpc" transport, defaults to "wss://127.0.0.1:2011"', type=str)
+    parser.add_argument('--worker-codec', required=False, choices=sorted(transport.WORKER_CODECS),
+                        help='Encoding of the trusted operations sent by the "rpc" transport, required by it. "json" is only '
+                        'understood by "python -m script_utils.simulator serve --worker-address", not by a worker', type=str)
+    parser.add_argument('--rpc-pool-size', required=False, default=32,
+                        help='Number of worker RPC websockets kept open by the "rpc" transport, defaults to 32', type=int)
+    parser.add_argument('--sim-config', required=False, default=simulator.DEFAULT_SIM_CONFIG,
+                        help=f'Latency, jitter, failure and hang rates of the "sim" transport, defaults to "{simulator.DEFAULT_SIM_CONFIG}"', type=str)
+    parser.add_argument('--genesis-accounts', required=False, default=genesis.DEFAULT_MANIFEST_PATH,
+                        help='Manifest of the accounts "launch_infrastructure.py --genesis-accounts" endowed at genesis, they are '
+                        f'not funded on chain again, defaults to "{genesis.DEFAULT_MANIFEST_PATH}"', type=str)
+    parser.add_argument('--skip-chain-funding', required=False,
+                        help='Only set trusted balances and do not transfer funds on chain, implied by the "sim" transport', action='store_true')
+    parser.add_argument('--topology', required=False,
+                        help='JSON file listing the worker endpoints to spread games over, as written by "launch_infrastructure.py --workers"', type=str)
+    parser.add_argument('--balancing', required=False, default='round-robin', choices=transport.BALANCING_POLICIES,
+                        help='How calls are spread over the "--topology" workers: in turn, to the least busy one or '
+                        'every game to a single worker, defaults to "round-robin"', type=str)
+    parser.add_argument('--monitor-chain', required=False,
+                        help='Record block times, extrinsics, events, weight fullness and inclusion latency of every block produced during the run', action='store_true')
+    parser.add_argument('--node-url', required=False, default='ws://127.0.0.1:9944',
+                        help='Node RPC endpoint watched by "--monitor-chain", defaults to "ws://127.0.0.1:9944"', type=str)
+    parser.add_argument('--telemetry', required=False,
+                        help='Sample CPU, memory, file descriptors and context switches of the tester, the node Prometheus metrics '
+                        'and the container cgroups into "<report>-resources.csv"', action='store_true')
+    parser.add_argument('--telemetry-interval', required=False, default=telemetry.DEFAULT_TELEMETRY_INTERVAL,
+                        help=f'Seconds between "--telemetry" samples, defaults to {telemetry.DEFAULT_TELEMETRY_INTERVAL:g}', type=float)
+    parser.add_argument('--node-metrics-url', required=False, default=telemetry.DEFAULT_NODE_METRICS_URL,
+                        help=f'Prometheus endpoint of the node sampled by "--telemetry", defaults to "{telemetry.DEFAULT_NODE_METRICS_URL}"', type=str)
+    parser.add_argument('--telemetry-containers', required=False,
+                        help='Comma separated containers whose cgroups "--telemetry" samples, defaults to every container of "--compose-project"', type=str)
+    parser.add_argument('--compose-project', required=False,
+                        help='Compose project of the node and worker containers sampled by "--telemetry", '
+                        'defaults to "$COMPOSE_PROJECT_NAME" or the current directory name', type=str)
+    parser.add_argument('--report', required=False, default=f'reports/{int(time.time())}-run',
+                        help='Path prefix of the JSON and CSV run report, defaults to "reports/<epoch>-run"', type=str)
+    parser.add_argument('--event-log', required=False, default=eventlog.DEFAULT_EVENT_LOG_PATH,
+                        help=f'Path prefix of the rotated JSONL game event log, defaults to "{eventlog.DEFAULT_EVENT_LOG_PATH}"', type=str)
+    parser.add_argument('--event-log-compression', required=False, choices=['gzip', 'zstd'],
+                        help='Compress the event log segments, "zstd" requires the "zstandard" package', type=str)
+    parser.add_argument('--event-log-rotate-mb', required=False, default=256,
+                        help='Start a new event log segment after that many megabytes, defaults to 256', type=int)
+    parser.add_argument('--trace', required=False, nargs='?', const=tracing.DEFAULT_TRACE_PATH,
+                        help=f'Write a Chrome trace of games, queueing, funding and CLI calls to "<path>-<host>-<pid>.json" for '
+                        f'ui.perfetto.dev, the path prefix defaults to "{tracing.DEFAULT_TRACE_PATH}"', type=str)
+    parser.add_argument('--profile', required=False,
+                        help='Sample the Python stacks of the tester into the "--trace" to find its own hot spots', action='store_true')
+    parser.add_argument('--profile-interval', required=False, default=tracing.DEFAULT_PROFILE_INTERVAL,
+                        help=f'Seconds between "--profile" samples, defaults to {tracing.DEFAULT_PROFILE_INTERVAL:g}', type=float)
+    parser.add_argument('--baseline-store', required=False, default=baseline.DEFAULT_STORE_PATH,
+                        help=f'SQLite file the run results are added to for "python -m script_utils.baseline compare", defaults to "{baseline.DEFAULT_STORE_PATH}"', type=str)
+    parser.add_argument('--no-baseline-store', required=False,
+                        help='Do not add this run to the baseline store', action='store_true')
+    parser.add_argument('--label', required=False,
+                        help='Label of this run in the baseline store, e.g. to compare against it by name', type=str)
+    parser.add_argument('--node-sha', required=False,
+                        help='Node commit the run is stored under, defaults to the "node" submodule commit', type=str)
+    parser.add_argument('--worker-sha', required=False,
+                        help='Worker commit the run is stored under, defaults to the "worker" submodule commit', type=str)
     parser.add_argument('--verbose', required=False,
                         help='Show additional logging messages', action='store_true')
 
@@ -250,18 +1364,275 @@ if __name__ == "__main__":
 
     scu.setup_logging(verbose=args.verbose)
 
-    if (docker_path := shutil.which('docker')) is not None:
-        logging.debug(f'Docker path: {docker_path}')
+    rate_profile = None
+    if args.open_loop is not None:
+        if args.rate_profile is None:
+            parser.error('"--open-loop" requires "--rate-profile"')
+        try:
+            rate_profile = loadgen.parse_profile(args.rate_profile)
+        except loadgen.ProfileParseException as ex:
+            parser.error(str(ex))
 
+    if args.queue_rate is not None and args.queue_rate <= 0:
+        parser.error('"--queue-rate" must be positive')
+    if args.queue_wave is not None and args.queue_wave < 1:
+        parser.error('"--queue-wave" must be at least 1')
+    if args.profile and args.trace is None:
+        parser.error('"--profile" requires "--trace"')
+    if args.profile_interval <= 0:
+        parser.error('"--profile-interval" must be positive')
+    if args.telemetry_interval <= 0:
+        parser.error('"--telemetry-interval" must be positive')
+
+    soak_run = None
+    if args.soak is not None or args.resume is not None:
+        if args.scenario is not None or args.agent is not None or args.coordinator is not None or args.open_loop is not None:
+            parser.error('"--soak" cannot be combined with "--scenario", "--agent", "--coordinator" or "--open-loop"')
+        try:
+            if args.resume is not None:
+                soak_run, checkpoint_metrics = soak.SoakRun.resume(args.resume)
+                metrics.get_run_metrics().merge(checkpoint_metrics)
+                args.games, args.report = soak_run.games, soak_run.report_prefix
+            elif args.games is None:
+                parser.error('"--soak" requires "--games"')
+            else:
+                soak_run = soak.SoakRun(args.soak, args.games, args.report,
+                                        args.checkpoint or f'{args.report}-checkpoint.json', args.soak_bucket)
+        except soak.SoakException as ex:
+            parser.error(str(ex))
+
+    controller = None
+    if args.adaptive is not None:
+        if soak_run is not None or args.scenario is not None or args.agent is not None or args.coordinator is not None \
+                or args.open_loop is not None:
+            parser.error('"--adaptive" cannot be combined with "--soak", "--scenario", "--agent", "--coordinator" or "--open-loop"')
+        if args.games is None:
+            parser.error('"--adaptive" requires "--games"')
+        controller = adaptive.AimdController(initial=args.adaptive_step, maximum=args.games, step=args.adaptive_step,
+                                             latency_factor=args.latency_factor, latency_target_ms=args.latency_target_ms,
+                                             max_error_rate=args.max_error_rate)
+
+    workload = None
+    if args.scenario is not None:
+        if args.agent is not None or args.coordinator is not None:
+            parser.error('"--scenario" cannot be distributed yet')
+        try:
+            workload = scenario.load_scenario(args.scenario)
+        except scenario.ScenarioException as ex:
+            parser.error(str(ex))
+    elif args.agent is None and args.games is None:
+        parser.error('"--games" or "--scenario" is required unless running as "--agent"')
+    if args.agent is not None and args.coordinator is not None:
+        parser.error('"--agent" and "--coordinator" are mutually exclusive')
+
+    if args.transport == transport.WorkerRpcTransport.name and args.worker_codec is None:
+        parser.error('The "rpc" transport needs "--worker-codec"')
+
+    sim_config = None
+    if args.transport == simulator.SimulatedTransport.name:
+        if args.topology is not None:
+            parser.error('"--topology" cannot be used with the "sim" transport')
+        try:
+            sim_config = simulator.parse_sim_config(args.sim_config)
+        except simulator.SimulatorException as ex:
+            parser.error(str(ex))
+        # The simulator cannot serve the runtime metadata transfers are built from
+        args.skip_chain_funding = True
+
+    if sim_config is not None:
+        cli_path = None
+    elif args.cli_path is not None:
+        cli_path = os.path.abspath(args.cli_path)
+    elif (docker_path := shutil.which('docker')) is not None:
+        logging.debug(f'Docker path: {docker_path}')
         cli_path = scu.get_integritee_cli(docker_path, args.container)
+    else:
+        logging.error('Docker binary could not be located! Exiting...')
+        sys.exit(1)
+
+    endpoints = None
+    if args.topology is not None:
+        try:
+            endpoints = transport.load_topology(args.topology)
+        except transport.TransportException as ex:
+            parser.error(str(ex))
+
+    # Every worker of a topology runs the same enclave build
+    if sim_config is not None:
+        mrenclave = simulator.FAKE_MRENCLAVE
+    elif endpoints:
+        mrenclave = scu.get_mrenclave(
+            cli_path, endpoints[0].node_port, endpoints[0].worker_port, endpoints[0].host)
+    else:
         mrenclave = scu.get_mrenclave(cli_path)
-        account_number = args.games * 2
-        account_list = generate_player_accounts(
-            cli_path, mrenclave, account_number, verbose=args.verbose)
+    try:
+        eventlog.open_event_log(args.event_log, args.event_log_compression,
+                                args.event_log_rotate_mb * 1024 * 1024)
+    except eventlog.EventLogException as ex:
+        logging.error(f'Failed to open event log: {ex}')
+        sys.exit(1)
 
-        logging.info(f'Launching {args.games} game/s...')
-        launch_games(cli_path, mrenclave, account_list, args.processes)
+    if args.trace is not None:
+        if args.agent is not None:
+            process_name = f'agent {args.agent_name or distributed.get_default_agent_name()}'
+        else:
+            process_name = 'coordinator' if args.coordinator is not None else 'launch_tests'
+        try:
+            tracing.open_trace(args.trace, process_name, args.profile_interval if args.profile else None)
+        except tracing.TracingException as ex:
+            logging.error(f'Failed to open trace: {ex}')
+            sys.exit(1)
 
+    if sim_config is not None:
+        cli_transport = simulator.SimulatedTransport(
+            simulator.GameSimulator(sim_config.seed), sim_config)
     else:
-        logging.error('Docker binary could not be located! Exiting...')
+        codec = transport.WORKER_CODECS[args.worker_codec]() if args.worker_codec is not None else None
+        cli_transport = transport.create_transport(args.transport, cli_path, mrenclave, args.worker_url, args.rpc_pool_size,
+                                                   endpoints, args.balancing, codec)
+    verifier = BoardVerifier(args.verify_board, args.verify_sample_rate)
+
+    monitor = None
+    if args.monitor_chain and args.agent is None:
+        monitor = chain_monitor.ChainMonitor(args.node_url, args.report)
+        try:
+            monitor.start()
+            chain_monitor.set_chain_monitor(monitor)
+        except Exception as ex:
+            logging.error(f'Failed to start chain monitor: {ex}')
+            monitor = None
+
+    resource_monitor = None
+    if args.telemetry:
+        # The simulator has neither a node nor containers to look at
+        samplers = telemetry.create_samplers(
+            node_metrics_url=args.node_metrics_url if sim_config is None else None,
+            containers=[] if sim_config is not None else
+            None if args.telemetry_containers is None else [name for name in args.telemetry_containers.split(',') if name],
+            compose_project=args.compose_project, docker_exec=shutil.which('docker'))
+        resource_monitor = telemetry.ResourceMonitor(samplers, args.telemetry_interval, args.report)
+        resource_monitor.start()
+
+    try:
+        if args.agent is not None:
+            run_agent(args.agent, args.agent_name, cli_transport, args.verbose, args.max_in_flight,
+                      args.board_deadline, args.open_loop, rate_profile, args.lag_tolerance, verifier)
+
+        elif args.coordinator is not None:
+            coordinator = distributed.Coordinator(args.coordinator, args.agents)
+            try:
+                coordinator.start()
+                coordinator.wait_for_agents()
+
+                account_number = args.games * 2
+                account_list = generate_player_accounts(
+                    cli_transport, account_number, verbose=args.verbose,
+                    funding_batch_size=args.funding_batch_size, funding_max_pending=args.funding_max_pending,
+                    max_in_flight=args.max_in_flight, pool_path=args.account_pool,
+                    refresh_trusted_balances=args.refresh_trusted_balances, balance_setter=coordinator.set_balances,
+                    monitor=monitor, skip_chain_funding=args.skip_chain_funding, genesis_manifest=args.genesis_accounts)
+
+                logging.info(f'Launching {args.games} game/s across {args.agents} agent/s...')
+                launch_distributed_games(coordinator, cli_transport, account_list, args.max_in_flight,
+                                         args.board_deadline, args.queue_rate, args.queue_wave, args.match_poll_interval)
+            finally:
+                # Agents are told to stop even when the run fails
+                coordinator.close()
+
+            if (agent_metrics := coordinator.merged_metrics()) is not None:
+                metrics.get_run_metrics().merge(agent_metrics)
+
+        elif workload is not None:
+            account_list = generate_player_accounts(
+                cli_transport, workload.accounts, verbose=args.verbose,
+                funding_batch_size=args.funding_batch_size, funding_max_pending=args.funding_max_pending,
+                max_in_flight=args.max_in_flight, pool_path=args.account_pool,
+                refresh_trusted_balances=args.refresh_trusted_balances, monitor=monitor,
+                skip_chain_funding=args.skip_chain_funding, genesis_manifest=args.genesis_accounts)
+
+            logging.info(f'Running scenario "{workload.name}" with {len(workload.phases)} phase/s...')
+            launch_scenario(cli_transport, workload, account_list, args.board_deadline, args.lag_tolerance,
+                            verifier, args.max_in_flight, args.match_poll_interval)
+
+        elif controller is not None:
+            account_list = generate_player_accounts(
+                cli_transport, args.games * 2, verbose=args.verbose,
+                funding_batch_size=args.funding_batch_size, funding_max_pending=args.funding_max_pending,
+                max_in_flight=args.max_in_flight, pool_path=args.account_pool,
+                refresh_trusted_balances=args.refresh_trusted_balances, monitor=monitor,
+                skip_chain_funding=args.skip_chain_funding, genesis_manifest=args.genesis_accounts)
+
+            asyncio.run(run_adaptive(cli_transport, controller, account_list, args.adaptive, args.adaptive_interval,
+                                     args.max_in_flight, args.board_deadline, verifier, args.match_poll_interval))
+
+        elif soak_run is not None:
+            account_list = generate_player_accounts(
+                cli_transport, args.games * 2, verbose=args.verbose,
+                funding_batch_size=args.funding_batch_size, funding_max_pending=args.funding_max_pending,
+                max_in_flight=args.max_in_flight, pool_path=args.account_pool,
+                refresh_trusted_balances=args.refresh_trusted_balances, monitor=monitor,
+                skip_chain_funding=args.skip_chain_funding, genesis_manifest=args.genesis_accounts)
+
+            asyncio.run(run_soak(cli_transport, soak_run, account_list, args.max_in_flight, args.board_deadline,
+                                 verifier, args.match_poll_interval, args.checkpoint_interval))
+
+        else:
+            account_number = args.games * 2
+            account_list = generate_player_accounts(
+                cli_transport, account_number, verbose=args.verbose,
+                funding_batch_size=args.funding_batch_size, funding_max_pending=args.funding_max_pending,
+                max_in_flight=args.max_in_flight, pool_path=args.account_pool,
+                refresh_trusted_balances=args.refresh_trusted_balances, monitor=monitor,
+                skip_chain_funding=args.skip_chain_funding, genesis_manifest=args.genesis_accounts)
+
+            logging.info(f'Launching {args.games} game/s...')
+            launch_games(cli_transport, account_list, args.max_in_flight, args.board_deadline,
+                         args.open_loop, rate_profile, args.lag_tolerance, verifier, args.queue_rate, args.queue_wave,
+                         args.match_poll_interval)
+
+    except distributed.DistributedException as ex:
+        logging.error(f'Distributed run failed: {ex}')
         sys.exit(1)
+    finally:
+        cli_transport.close()
+        eventlog.close_event_log()
+        if monitor is not None:
+            chain_monitor.set_chain_monitor(None)
+            monitor.stop()
+        if resource_monitor is not None:
+            resource_monitor.stop()
+        tracing.close_trace()
+
+    if monitor is not None:
+        monitor.write_report()
+
+    if resource_monitor is not None:
+        resource_monitor.write_report()
+
+    if controller is not None:
+        controller.write_report(args.report)
+
+    report = metrics.get_run_metrics().write_report(args.report)
+    metrics.log_summary(report)
+
+    if args.agent is None and not args.no_baseline_store:
+        if workload is not None:
+            run_scenario = f'scenario:{workload.name}'
+            run_concurrency = max(phase.concurrency for phase in workload.phases)
+        elif controller is not None:
+            run_scenario = f'adaptive:{args.games}'
+            run_concurrency = args.games
+        elif soak_run is not None:
+            run_scenario = f'soak:{args.games}x{soak_run.duration:g}s'
+            run_concurrency = args.max_in_flight
+        elif args.open_loop is not None:
+            run_scenario = f'open-loop-{args.open_loop}:{args.rate_profile}'
+            run_concurrency = args.max_in_flight
+        else:
+            run_scenario = f'games:{args.games}'
+            run_concurrency = args.max_in_flight
+
+        baseline.store_run(args.baseline_store, metrics.get_run_metrics(),
+                           args.node_sha or baseline.get_submodule_sha('node'),
+                           args.worker_sha or baseline.get_submodule_sha('worker'),
+                           run_scenario, run_concurrency, args.transport, args.label)
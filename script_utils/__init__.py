@@ -2,6 +2,7 @@
 import logging
 import re
 import os
+import resource
 import subprocess
 
 from substrateinterface import Keypair
@@ -38,6 +39,20 @@ def setup_logging(verbose=False):
     )
 
 
+def raise_open_files_limit():
+    soft_limit, hard_limit = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft_limit < hard_limit:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE,
+                               (hard_limit, hard_limit))
+            soft_limit = hard_limit
+        except (ValueError, OSError) as ex:
+            logging.warning(f'Could not raise open files limit: {ex}')
+
+    logging.debug(f'Open files limit: {soft_limit}')
+    return soft_limit
+
+
 def get_integritee_cli(docker_exec, worker_container):
     container_path = f'{worker_container}:/service/integritee-cli'
     cmd = [docker_exec, 'cp', container_path, '.']
@@ -53,17 +68,31 @@ def get_integritee_cli(docker_exec, worker_container):
     return os.path.abspath('integritee-cli')
 
 
-def get_mrenclave(cli_exec):
-    logging.info(f'Parsing MRENCLAVE...')
-    cmd = get_base_cli_cmd(cli_exec) + ['list-workers']
+def list_worker_mrenclaves(cli_exec, timeout=None, node_port=9944, worker_port=2011, websocket_ip='127.0.0.1'):
+    cmd = get_base_cli_cmd(cli_exec, node_port, worker_port,
+                           websocket_ip) + ['list-workers']
+
+    try:
+        process = subprocess.run(
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return []
+    output = process.stdout.decode('ascii', errors='replace')
+
+    return re.findall(r'MRENCLAVE: (\w+)', output)
 
-    process = subprocess.run(cmd, stdout=subprocess.PIPE)
-    output = process.stdout.decode('ascii')
 
-    matches = re.findall(r'MRENCLAVE: (\w+)', output)
+def query_mrenclave(cli_exec, timeout=None, node_port=9944, worker_port=2011, websocket_ip='127.0.0.1'):
+    matches = list_worker_mrenclaves(
+        cli_exec, timeout, node_port, worker_port, websocket_ip)
 
-    if matches:
-        mrenclave = matches[0]
+    return matches[0] if matches else None
+
+
+def get_mrenclave(cli_exec, node_port=9944, worker_port=2011, websocket_ip='127.0.0.1'):
+    logging.info(f'Parsing MRENCLAVE...')
+
+    if (mrenclave := query_mrenclave(cli_exec, None, node_port, worker_port, websocket_ip)) is not None:
         logging.info(F'Parsed MRENCLAVE: "{mrenclave}"')
         return mrenclave
     else:
@@ -80,8 +109,34 @@ def get_trusted_cli_subcommand(call_signer, mrenclave, subcmd):
     return ['trusted', '--xt-signer', call_signer, '--direct', '--mrenclave', mrenclave, subcmd]
 
 
+_public_keys = {}
+
+
+def get_public_key(account_uri):
+    if (public_key := _public_keys.get(account_uri)) is None:
+        public_key = Keypair.create_from_uri(account_uri).public_key
+        _public_keys[account_uri] = public_key
+
+    return public_key
+
+
+def cache_public_keys(public_keys):
+    _public_keys.update(public_keys)
+
+
 def sort_accounts_by_public_key(account_uri_list):
-    return sorted(account_uri_list, key=lambda x: Keypair.create_from_uri(x).public_key)
+    return sorted(account_uri_list, key=get_public_key)
+
+
+_BOARD_PLAYERS = re.compile(r'players: \[([^\]]*)\]')
+
+
+def parse_board_players(board_string):
+    # None when the board output does not name the players of the game
+    if (match := _BOARD_PLAYERS.search(board_string)) is None:
+        return None
+
+    return [player.strip() for player in match.group(1).split(',') if player.strip()]
 
 
 class BoardParseException(Exception):
@@ -89,153 +144,166 @@ class BoardParseException(Exception):
 
 
 class BoardParser:
-    EMPTY = 'Empty'
-    STONE = 'Stone'
-    BOMB = 'Bomb'
-    BLOCK = 'Block'
+    SIZE = 10
+
+    # Cell codes stored one byte per cell, row major
+    EMPTY = 0
+    STONE = 1
+    BOMB = 2
+    BLOCK = 3
+    UNKNOWN = 4
+
+    CELL_CODES = {'Empty': EMPTY, 'Stone': STONE, 'Bomb': BOMB, 'Block': BLOCK}
+    CELL_NAMES = {code: name for name, code in CELL_CODES.items()}
+
+    _CELL_TOKEN = re.compile(r'[^\[\],\s]+')
+    _CELL_DIGITS = [('Empty', '0'), ('Stone', '1'), ('Bomb', '2'), ('Block', '3')]
+    _SEPARATORS = str.maketrans('', '', '[], \n\t')
+    _DIGIT_CODES = bytes.maketrans(b'0123', bytes([EMPTY, STONE, BOMB, BLOCK]))
+    _SIDES = [('west', True, True), ('east', True, False),
+              ('north', False, True), ('south', False, False)]
+    _EMPTY_RUN = bytes([EMPTY] * 4)
 
     def __init__(self, board_string):
-        try:
-            cells_list = board_string.split('[[')[1].split(']]')[0].replace(
-                ']', '').replace('[', '').split(', ')
-            self._board_matrix = [
-                cells_list[i * 10:(i * 10) + 10] for i in range(10)]
-        except Exception:
+        start = board_string.find('[[')
+        end = board_string.find(']]', start)
+        if start == -1 or end == -1:
             raise BoardParseException
 
-    def compute_bomb_orders(self, update_matrix=False):
-        bomb_orders = []
+        cell_count = BoardParser.SIZE * BoardParser.SIZE
 
-        for i in range(10):
-            for j in range(10):
-                if self._board_matrix[i][j] == BoardParser.EMPTY:
-                    bomb_orders.append((str(i), str(j)))
-                    if update_matrix:
-                        self._board_matrix[i][j] = BoardParser.BOMB
+        # Fast path: swap every known cell name for a digit and drop separators
+        digits = board_string[start:end]
+        for name, digit in BoardParser._CELL_DIGITS:
+            digits = digits.replace(name, digit)
+        digits = digits.translate(BoardParser._SEPARATORS)
 
-                    if len(bomb_orders) == 3:
-                        return bomb_orders
+        if len(digits) == cell_count and digits.isdigit():
+            self._board = bytearray(digits.encode(
+                'ascii').translate(BoardParser._DIGIT_CODES))
+            return
 
-        return bomb_orders
+        cells = BoardParser._CELL_TOKEN.findall(board_string, start, end)
+        if len(cells) < cell_count:
+            raise BoardParseException
 
-    def compute_stone_orders(self, player_1, player_2, update_matrix=False):
-        def is_valid_row(cells_matrix, row_index, start_point, direction):
-
-            row_can_fit_stones = (cells_matrix[row_index][start_point] == BoardParser.EMPTY and
-                    cells_matrix[row_index][start_point + direction] == BoardParser.EMPTY and
-                    cells_matrix[row_index][start_point + (direction * 2)] == BoardParser.EMPTY and
-                    cells_matrix[row_index][start_point + (direction * 3)] == BoardParser.EMPTY)
-            
-            if row_can_fit_stones:
-                i = start_point + (direction * 3)
-                while i > 0 and i < len(cells_matrix[row_index]):
-                    if cells_matrix[row_index][i] == BoardParser.BLOCK:
-                        return True
-                    i += direction
-            
+        self._board = bytearray(BoardParser.CELL_CODES.get(cell, BoardParser.UNKNOWN)
+                                for cell in cells[:cell_count])
+
+    @property
+    def board(self):
+        return bytes(self._board)
+
+    @property
+    def board_matrix(self):
+        return [[BoardParser.CELL_NAMES.get(code, 'Unknown') for code in self._board[i:i + BoardParser.SIZE]]
+                for i in range(0, len(self._board), BoardParser.SIZE)]
+
+    def _get_line(self, is_row, index):
+        if is_row:
+            return self._board[index * BoardParser.SIZE:(index + 1) * BoardParser.SIZE]
+        return self._board[index::BoardParser.SIZE]
+
+    def _find_valid_lines(self, is_row, from_start):
+        # Four free cells at the dropping side and a block further in
+        size = BoardParser.SIZE
+        board = self._board
+        empty_run = BoardParser._EMPTY_RUN
+        block = BoardParser.BLOCK
+
+        for i in range(size):
+            if is_row and from_start:
+                offset = i * size
+                valid = board[offset:offset + 4] == empty_run and board.find(
+                    block, offset + 3, offset + size) != -1
+            elif is_row:
+                offset = i * size
+                valid = board[offset + size - 4:offset + size] == empty_run and board.find(
+                    block, offset + 1, offset + size - 3) != -1
+            elif from_start:
+                valid = board[i:i + 4 * size:size] == empty_run and block in board[i + 3 * size::size]
+            else:
+                valid = board[i + (size - 4) * size::size] == empty_run and block in board[i + size:i + (size - 3) * size:size]
+
+            if valid:
+                yield i
+
+    def _drop_stones(self, is_row, index, from_start, count=4):
+        line = self._get_line(is_row, index)
+
+        # Stones pile up against the first occupied cell seen from the side
+        if from_start:
+            first_occupied = len(line) - len(line.lstrip(bytes([BoardParser.EMPTY])))
+            start, end = first_occupied - count, first_occupied
+        else:
+            last_occupied = len(line.rstrip(bytes([BoardParser.EMPTY]))) - 1
+            start, end = last_occupied + 1, last_occupied + 1 + count
+
+        if start < 0 or end > BoardParser.SIZE:
             return False
 
-        def is_valid_col(cells_matrix, col_index, start_point, direction):
+        if is_row:
+            offset, stride = index * BoardParser.SIZE, 1
+        else:
+            offset, stride = index, BoardParser.SIZE
 
-            col_can_fit_stones = (cells_matrix[start_point][col_index] == BoardParser.EMPTY and
-                    cells_matrix[start_point + direction][col_index] == BoardParser.EMPTY and
-                    cells_matrix[start_point + (direction * 2)][col_index] == BoardParser.EMPTY and
-                    cells_matrix[start_point + (direction * 3)][col_index] == BoardParser.EMPTY)
+        self._board[offset + start * stride:offset + end * stride:stride] = bytes([BoardParser.STONE] * count)
+        return True
 
-            if col_can_fit_stones:
-                i = start_point + (direction * 3)
-                while i > 0 and i < len(cells_matrix):
-                    if cells_matrix[i][col_index] == BoardParser.BLOCK:
-                        return True
-                    i += direction
-            
-            return False
+    def copy(self):
+        board_copy = BoardParser.__new__(BoardParser)
+        board_copy._board = bytearray(self._board)
+        return board_copy
 
-        def drop_stones_in_row(cells_matrix, row_index, start_point, direction):
-            true_start_point = start_point
-            for i in range(10):
-                moved_start_point = start_point + (i * direction)
-                if cells_matrix[row_index][start_point + (i * direction)] != BoardParser.EMPTY:
-                    true_start_point = moved_start_point
-
-            i = 4
-            r = 0
-            while i > 0:
-                if cells_matrix[row_index][true_start_point + r] == BoardParser.EMPTY:
-                    cells_matrix[row_index][true_start_point +
-                                            r] = BoardParser.STONE
-                    i -= 1
-                r += direction
-
-        def drop_stones_in_col(cells_matrix, col_index, start_point, direction):
-            true_start_point = start_point
-            for i in range(10):
-                moved_start_point = start_point + (i * direction)
-                if cells_matrix[start_point + (i * direction)][col_index] != BoardParser.EMPTY:
-                    true_start_point = moved_start_point
-
-            i = 4
-            r = 0
-            while i > 0:
-                if cells_matrix[true_start_point + r][col_index] == BoardParser.EMPTY:
-                    cells_matrix[true_start_point +
-                                 r][col_index] = BoardParser.STONE
-                    i -= 1
-                r += direction
+    def apply_board(self, other):
+        self._board[:] = other._board
 
-        stone_orders_player_1 = []
-        stone_orders_player_2 = []
+    def apply_bomb(self, row, col):
+        self._board[int(row) * BoardParser.SIZE + int(col)] = BoardParser.BOMB
 
-        # Check west side
-        for i in range(10):
-            if is_valid_row(self._board_matrix, i, 0, 1):
-                if len(stone_orders_player_1) == 0:
-                    stone_orders_player_1 = [('west', str(i))] * 4
-                elif len(stone_orders_player_2) == 0:
-                    stone_orders_player_2 = [('west', str(i))] * 4
-                else:
-                    return {player_1: stone_orders_player_1, player_2: stone_orders_player_2}
+    def apply_stone(self, side, index):
+        for side_name, is_row, from_start in BoardParser._SIDES:
+            if side_name == side:
+                return self._drop_stones(is_row, int(index), from_start, count=1)
 
-                if update_matrix:
-                    drop_stones_in_row(self._board_matrix, i, 9, -1)
+        raise ValueError(f'Unknown side "{side}"')
 
-        # Check east side
-        for i in range(10):
-            if is_valid_row(self._board_matrix, i, 9, -1):
-                if len(stone_orders_player_1) == 0:
-                    stone_orders_player_1 = [('east', str(i))] * 4
-                elif len(stone_orders_player_2) == 0:
-                    stone_orders_player_2 = [('east', str(i))] * 4
-                else:
-                    return {player_1: stone_orders_player_1, player_2: stone_orders_player_2}
+    def diff(self, other):
+        return [(*divmod(i, BoardParser.SIZE), BoardParser.CELL_NAMES.get(expected, 'Unknown'),
+                 BoardParser.CELL_NAMES.get(actual, 'Unknown'))
+                for i, (expected, actual) in enumerate(zip(self._board, other._board)) if expected != actual]
 
-                if update_matrix:
-                    drop_stones_in_row(self._board_matrix, i, 0, 1)
+    def compute_bomb_orders(self, update_matrix=False):
+        bomb_orders = []
 
-        # Check north side
-        for i in range(10):
-            if is_valid_col(self._board_matrix, i, 0, 1):
-                if len(stone_orders_player_1) == 0:
-                    stone_orders_player_1 = [('north', str(i))] * 4
-                elif len(stone_orders_player_2) == 0:
-                    stone_orders_player_2 = [('north', str(i))] * 4
-                else:
-                    return {player_1: stone_orders_player_1, player_2: stone_orders_player_2}
+        index = self._board.find(BoardParser.EMPTY)
+        while index != -1 and len(bomb_orders) < 3:
+            row, col = divmod(index, BoardParser.SIZE)
+            bomb_orders.append((str(row), str(col)))
+            if update_matrix:
+                self._board[index] = BoardParser.BOMB
 
-                if update_matrix:
-                    drop_stones_in_col(self.__board_matrix, i, 9, -1)
+            index = self._board.find(BoardParser.EMPTY, index + 1)
+
+        return bomb_orders
+
+    def compute_stone_orders(self, player_1, player_2, update_matrix=False):
+        stone_orders_player_1 = []
+        stone_orders_player_2 = []
 
-        # Check south side
-        for i in range(10):
-            if is_valid_col(self._board_matrix, i, 9, -1):
+        # Check west, east, north and south sides in turn
+        for side, is_row, from_start in BoardParser._SIDES:
+            # Dropping stones only changes that line, so lines can be found
+            # lazily while the board is being updated
+            for i in self._find_valid_lines(is_row, from_start):
                 if len(stone_orders_player_1) == 0:
-                    stone_orders_player_1 = [('south', str(i))] * 4
+                    stone_orders_player_1 = [(side, str(i))] * 4
                 elif len(stone_orders_player_2) == 0:
-                    stone_orders_player_2 = [('south', str(i))] * 4
+                    stone_orders_player_2 = [(side, str(i))] * 4
                 else:
                     return {player_1: stone_orders_player_1, player_2: stone_orders_player_2}
 
                 if update_matrix:
-                    drop_stones_in_col(self._board_matrix, i, 0, 1)
+                    self._drop_stones(is_row, i, from_start)
 
         return {player_1: stone_orders_player_1, player_2: stone_orders_player_2}
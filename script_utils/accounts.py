@@ -0,0 +1,191 @@
+import json
+import logging
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+from substrateinterface import Keypair
+
+import script_utils as scu
+
+
+DEFAULT_POOL_PATH = 'account-pool.sqlite'
+
+POOL_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS accounts (
+    uri TEXT PRIMARY KEY,
+    public_key TEXT NOT NULL,
+    address TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS trusted_balances (
+    mrenclave TEXT NOT NULL,
+    account_uri TEXT NOT NULL,
+    balance INTEGER NOT NULL,
+    PRIMARY KEY (mrenclave, account_uri)
+);
+'''
+
+SQLITE_HEADER = b'SQLite format 3\x00'
+
+# Player accounts are "//Account_0", "//Account_1", ... everywhere
+ACCOUNT_BASE_NAME = '//Account_'
+
+BALANCE_QUERY_CHUNK = 1000
+
+# Below this many keypairs starting processes costs more than it saves,
+# deriving one takes about 2ms
+PARALLEL_DERIVE_MIN = 5000
+DERIVE_CHUNK = 2000
+
+# Under the 999 parameters older SQLite versions allow per statement
+LOOKUP_CHUNK = 900
+
+
+def get_account_names(count, start=0):
+    return [f'{ACCOUNT_BASE_NAME}{i}' for i in range(start, start + count)]
+
+
+def derive_keypairs(account_uris):
+    derived = {}
+    for uri in account_uris:
+        keypair = Keypair.create_from_uri(uri)
+        derived[uri] = {'public_key': keypair.public_key.hex(),
+                        'address': keypair.ss58_address}
+    return derived
+
+
+class AccountPool:
+    # Rows are only added when the pool grows and only the accounts asked for
+    # are read, at a million accounts neither a rewrite nor a full parse fits
+    def __init__(self, path=DEFAULT_POOL_PATH):
+        self.path = path
+        self.accounts = {}
+        self.trusted_balances = {}
+        self.connection = None
+
+    @classmethod
+    def load(cls, path=DEFAULT_POOL_PATH):
+        pool = cls(path)
+        if path is None:
+            pool.connection = open_pool_store(':memory:')
+            return pool
+
+        legacy = read_legacy_pool(path)
+        pool.connection = open_pool_store(path)
+        if legacy is not None:
+            pool.import_legacy(legacy)
+            logging.info(f'Converted the JSON account pool {path} to SQLite')
+
+        account_count = pool.connection.execute('SELECT COUNT(*) FROM accounts').fetchone()[0]
+        logging.info(f'Opened {account_count} cached account/s in {path}')
+        return pool
+
+    def import_legacy(self, data):
+        self.connection.executemany('INSERT OR REPLACE INTO accounts VALUES (?, ?, ?)', (
+            (uri, account['public_key'], account['address']) for uri, account in data.get('accounts', {}).items()))
+        self.connection.executemany('INSERT OR REPLACE INTO trusted_balances VALUES (?, ?, ?)', (
+            (mrenclave, uri, balance) for mrenclave, balances in data.get('trusted_balances', {}).items()
+            for uri, balance in balances.items()))
+        self.connection.commit()
+
+    def save(self):
+        self.connection.commit()
+
+    def derive(self, account_uris, processes=None):
+        self.read_accounts(uri for uri in account_uris if uri not in self.accounts)
+        missing_uris = [uri for uri in account_uris if uri not in self.accounts]
+        processes = processes or os.cpu_count() or 1
+
+        if len(missing_uris) >= PARALLEL_DERIVE_MIN and processes > 1:
+            logging.info(f'Deriving {len(missing_uris)} new keypair/s across {processes} processes...')
+            chunks = [missing_uris[i:i + DERIVE_CHUNK] for i in range(0, len(missing_uris), DERIVE_CHUNK)]
+            with ProcessPoolExecutor(processes) as executor:
+                for derived in executor.map(derive_keypairs, chunks):
+                    self.add_accounts(derived)
+        elif missing_uris:
+            logging.info(f'Deriving {len(missing_uris)} new keypair/s...')
+            self.add_accounts(derive_keypairs(missing_uris))
+
+        # Kept even if the run stops before the balances are saved
+        if missing_uris:
+            self.connection.commit()
+
+        # Share the derived keys with sort_accounts_by_public_key
+        scu.cache_public_keys({uri: bytes.fromhex(self.accounts[uri]['public_key'])
+                               for uri in account_uris})
+
+    def read_accounts(self, account_uris):
+        account_uris = list(account_uris)
+        for start in range(0, len(account_uris), LOOKUP_CHUNK):
+            chunk = account_uris[start:start + LOOKUP_CHUNK]
+            rows = self.connection.execute(
+                f'SELECT uri, public_key, address FROM accounts WHERE uri IN ({", ".join("?" * len(chunk))})', chunk)
+            for uri, public_key, address in rows:
+                self.accounts[uri] = {'public_key': public_key, 'address': address}
+
+    def add_accounts(self, derived):
+        self.accounts.update(derived)
+        self.connection.executemany('INSERT OR REPLACE INTO accounts VALUES (?, ?, ?)', (
+            (uri, account['public_key'], account['address']) for uri, account in derived.items()))
+
+    def get_address(self, account_uri):
+        return self.accounts[account_uri]['address']
+
+    def get_trusted_balances(self, mrenclave):
+        if mrenclave not in self.trusted_balances:
+            self.trusted_balances[mrenclave] = dict(self.connection.execute(
+                'SELECT account_uri, balance FROM trusted_balances WHERE mrenclave = ?', (mrenclave,)))
+        return self.trusted_balances[mrenclave]
+
+    def get_trusted_balance(self, mrenclave, account_uri):
+        return self.get_trusted_balances(mrenclave).get(account_uri, 0)
+
+    def set_trusted_balance(self, mrenclave, account_uri, balance):
+        self.get_trusted_balances(mrenclave)[account_uri] = balance
+        self.connection.execute('INSERT OR REPLACE INTO trusted_balances VALUES (?, ?, ?)',
+                                (mrenclave, account_uri, balance))
+
+    def clear_trusted_balances(self, mrenclave):
+        self.trusted_balances[mrenclave] = {}
+        self.connection.execute('DELETE FROM trusted_balances WHERE mrenclave = ?', (mrenclave,))
+
+
+def open_pool_store(path):
+    pool_dir = os.path.dirname(path)
+    if pool_dir:
+        os.makedirs(pool_dir, exist_ok=True)
+
+    connection = sqlite3.connect(path)
+    connection.executescript(POOL_SCHEMA)
+    return connection
+
+
+def read_legacy_pool(path):
+    # Pools used to be one JSON document, they are converted in place once.
+    # Files that are neither are replaced, as unreadable pools always were.
+    try:
+        with open(path, 'rb') as pool_file:
+            if pool_file.read(len(SQLITE_HEADER)) == SQLITE_HEADER:
+                return None
+            pool_file.seek(0)
+            data = json.load(pool_file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as ex:
+        logging.warning(f'Ignoring unreadable account pool {path}: {ex}')
+        data = {}
+
+    os.remove(path)
+    return data
+
+
+def query_free_balances(rpc_node, addresses, chunk_size=BALANCE_QUERY_CHUNK):
+    balances = {}
+    for start in range(0, len(addresses), chunk_size):
+        storage_keys = [rpc_node.create_storage_key('System', 'Account', [address])
+                        for address in addresses[start:start + chunk_size]]
+
+        for storage_key, account_info in rpc_node.query_multi(storage_keys):
+            balances[storage_key.params[0]] = account_info.value['data']['free']
+
+    return {address: balances.get(address, 0) for address in addresses}
@@ -0,0 +1,176 @@
+import asyncio
+import csv
+import json
+import logging
+import math
+import os
+
+from script_utils import metrics
+
+
+# Trusted calls of a game in progress, the latency and error signal
+SIGNAL_OPERATIONS = ['get-board', 'drop-bomb', 'drop-stone']
+
+INTERVAL_FIELDS = ['interval', 'limit', 'peak_in_flight', 'throughput', 'games_per_second', 'p50_ms', 'p99_ms',
+                   'error_rate', 'decision']
+
+
+class ConcurrencyLimiter:
+    # Like asyncio.Semaphore, but the limit can change while tasks hold it
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self.condition:
+            try:
+                await self.condition.wait_for(lambda: self.in_flight < self.limit)
+            except asyncio.CancelledError:
+                # Callers give up through asyncio.wait_for, a wakeup this
+                # waiter was notified of goes to the next one
+                if self.in_flight < self.limit:
+                    self.condition.notify()
+                raise
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    async def release(self):
+        # Counted before waiting for the lock, a cancelled release still
+        # frees its slot
+        self.in_flight -= 1
+        async with self.condition:
+            self.condition.notify()
+
+    async def set_limit(self, limit):
+        async with self.condition:
+            raised = limit > self.limit
+            self.limit = limit
+            if raised:
+                self.condition.notify_all()
+
+    def take_peak(self):
+        peak, self.peak_in_flight = self.peak_in_flight, self.in_flight
+        return peak
+
+
+class AimdController:
+    # Additive increase while the trusted calls stay healthy, multiplicative
+    # decrease once their p99 climbs past the knee or errors show up. The
+    # limits at which it backs off are the knee of the latency curve.
+    def __init__(self, initial=4, minimum=1, maximum=512, step=4, backoff=0.7, latency_factor=2.0,
+                 latency_target_ms=None, max_error_rate=0.02, min_samples=20, knee_tolerance=0.15, knee_count=3):
+        self.limit = min(initial, maximum)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.step = step
+        self.backoff = backoff
+        self.latency_factor = latency_factor
+        self.latency_target_ms = latency_target_ms
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.knee_tolerance = knee_tolerance
+        self.knee_count = knee_count
+
+        self.lowest_p99_ms = None
+        self.knees = []
+        self.best = None
+        self.intervals = []
+
+    @property
+    def latency_limit_ms(self):
+        if self.latency_target_ms is not None:
+            return self.latency_target_ms
+        if self.lowest_p99_ms is None:
+            return math.inf
+        return self.lowest_p99_ms * self.latency_factor
+
+    @property
+    def converged(self):
+        # The last knees agree, further probing would only repeat them
+        if len(self.knees) < self.knee_count:
+            return False
+        recent = self.knees[-self.knee_count:]
+        mean = sum(recent) / len(recent)
+        return all(abs(knee - mean) <= mean * self.knee_tolerance for knee in recent)
+
+    def update(self, window, duration, peak_in_flight):
+        signal = metrics.OperationMetrics()
+        if window is not None:
+            for operation in SIGNAL_OPERATIONS:
+                if operation in window.operations:
+                    signal.merge(window.operations[operation])
+        games = window.counters.get('games-finished', 0) if window is not None else 0
+
+        samples = signal.latencies.count + signal.errors + signal.timeouts
+        row = {'interval': len(self.intervals), 'limit': self.limit, 'peak_in_flight': peak_in_flight,
+               'throughput': signal.latencies.count / duration, 'games_per_second': games / duration,
+               'p50_ms': signal.latencies.percentile(50.0) / 1000.0,
+               'p99_ms': signal.latencies.percentile(99.0) / 1000.0,
+               'error_rate': (signal.errors + signal.timeouts) / samples if samples else 0.0}
+
+        if samples < self.min_samples:
+            row['decision'] = 'hold'
+        elif row['error_rate'] > self.max_error_rate or row['p99_ms'] > self.latency_limit_ms:
+            row['decision'] = 'decrease'
+            self.knees.append(self.limit)
+            self.limit = max(self.minimum, math.floor(self.limit * self.backoff))
+        else:
+            if self.lowest_p99_ms is None or row['p99_ms'] < self.lowest_p99_ms:
+                self.lowest_p99_ms = row['p99_ms']
+            if self.best is None or row['throughput'] > self.best['throughput']:
+                self.best = row
+
+            # Raising a limit that games cannot even fill teaches nothing
+            if peak_in_flight >= self.limit and self.limit < self.maximum:
+                row['decision'] = 'increase'
+                self.limit = min(self.maximum, self.limit + self.step)
+            else:
+                row['decision'] = 'hold'
+
+        self.intervals.append(row)
+        logging.info(f'Concurrency {row["limit"]} ({peak_in_flight} in flight): {row["throughput"]:.1f} op/s, '
+                     f'p99 {row["p99_ms"]:.1f}ms, {row["error_rate"]:.1%} errors, {row["decision"]} '
+                     f'to {self.limit}')
+        return row['decision']
+
+    def summary(self):
+        recent = self.knees[-self.knee_count:]
+        return {
+            'converged': self.converged,
+            'knee_concurrency': sum(recent) / len(recent) if recent else None,
+            'max_throughput': self.best['throughput'] if self.best else None,
+            'max_throughput_concurrency': self.best['limit'] if self.best else None,
+            'max_throughput_p99_ms': self.best['p99_ms'] if self.best else None,
+            'lowest_p99_ms': self.lowest_p99_ms,
+            'knees': self.knees,
+            'intervals': len(self.intervals),
+        }
+
+    def write_report(self, report_prefix):
+        report_dir = os.path.dirname(report_prefix)
+        if report_dir:
+            os.makedirs(report_dir, exist_ok=True)
+
+        with open(f'{report_prefix}-adaptive.csv', 'w', newline='') as csv_file:
+            writer = csv.DictWriter(csv_file, fieldnames=INTERVAL_FIELDS)
+            writer.writeheader()
+            writer.writerows(self.intervals)
+
+        summary = self.summary()
+        with open(f'{report_prefix}-adaptive.json', 'w') as json_file:
+            json.dump(summary, json_file, indent=2)
+
+        logging.info(f'Adaptive concurrency report written to {report_prefix}-adaptive.json and '
+                     f'{report_prefix}-adaptive.csv')
+        if summary['max_throughput'] is not None:
+            logging.info(f'Maximum sustainable throughput {summary["max_throughput"]:.1f} op/s at concurrency '
+                         f'{summary["max_throughput_concurrency"]} (p99 {summary["max_throughput_p99_ms"]:.1f}ms)')
+        if summary['knee_concurrency'] is not None:
+            logging.info(f'Latency knee at concurrency {summary["knee_concurrency"]:.0f}'
+                         f'{"" if summary["converged"] else ", not converged yet"}')
+        else:
+            logging.info('No latency knee reached, raise "--games" to allow more concurrency')
+
+        return summary
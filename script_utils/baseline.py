@@ -0,0 +1,263 @@
+#!/usr/bin/python3
+
+import argparse
+import json
+import logging
+import math
+import os
+import sqlite3
+import sys
+import time
+
+import script_utils as scu
+
+
+DEFAULT_STORE_PATH = 'reports/baselines.sqlite'
+
+# Summary fields compared between runs, and whether a higher value is better
+COMPARED_METRICS = [('throughput', True), ('p50_ms', False), ('p90_ms', False), ('p99_ms', False)]
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at REAL NOT NULL,
+    node_sha TEXT NOT NULL,
+    worker_sha TEXT NOT NULL,
+    scenario TEXT NOT NULL,
+    concurrency INTEGER NOT NULL,
+    transport TEXT NOT NULL,
+    label TEXT,
+    metrics TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS operations (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    operation TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    errors INTEGER NOT NULL,
+    timeouts INTEGER NOT NULL,
+    throughput REAL NOT NULL,
+    mean_ms REAL NOT NULL,
+    p50_ms REAL NOT NULL,
+    p90_ms REAL NOT NULL,
+    p99_ms REAL NOT NULL,
+    max_ms REAL NOT NULL,
+    PRIMARY KEY (run_id, operation)
+);
+CREATE INDEX IF NOT EXISTS runs_by_key ON runs (scenario, concurrency, transport);
+'''
+
+
+class BaselineException(Exception):
+    pass
+
+
+def get_submodule_sha(submodule_path):
+    try:
+        return scu.get_submodule_commit_sha(os.path.abspath(submodule_path))
+    except Exception:
+        return 'unknown'
+
+
+def open_store(store_path=DEFAULT_STORE_PATH):
+    store_dir = os.path.dirname(store_path)
+    if store_dir:
+        os.makedirs(store_dir, exist_ok=True)
+
+    connection = sqlite3.connect(store_path)
+    connection.row_factory = sqlite3.Row
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def store_run(store_path, run_metrics, node_sha, worker_sha, scenario, concurrency, transport_name, label=None):
+    summary = run_metrics.summary()
+
+    with open_store(store_path) as connection:
+        cursor = connection.execute(
+            'INSERT INTO runs (started_at, node_sha, worker_sha, scenario, concurrency, transport, label, metrics) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (run_metrics.started_at, node_sha, worker_sha, scenario, concurrency, transport_name, label,
+             json.dumps(run_metrics.to_dict())))
+        run_id = cursor.lastrowid
+
+        connection.executemany(
+            'INSERT INTO operations VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            [(run_id, operation, s['count'], s['errors'], s['timeouts'], s['throughput'], s['mean_ms'],
+              s['p50_ms'], s['p90_ms'], s['p99_ms'], s['max_ms'])
+             for operation, s in summary['operations'].items()])
+    connection.close()
+
+    logging.info(
+        f'Run stored as #{run_id} in {store_path} (node {node_sha}, worker {worker_sha}, {scenario} x{concurrency})')
+    return run_id
+
+
+def get_run(connection, run_ref):
+    if run_ref == 'latest':
+        row = connection.execute('SELECT * FROM runs ORDER BY id DESC LIMIT 1').fetchone()
+    elif run_ref.isdigit():
+        row = connection.execute('SELECT * FROM runs WHERE id = ?', (int(run_ref),)).fetchone()
+    else:
+        row = connection.execute('SELECT * FROM runs WHERE label = ? ORDER BY id DESC LIMIT 1',
+                                 (run_ref,)).fetchone()
+
+    if row is None:
+        raise BaselineException(f'No run matches "{run_ref}"')
+    return row
+
+
+def get_baseline_runs(connection, candidate, baseline_ref=None, baseline_runs=5):
+    if baseline_ref is not None:
+        return [get_run(connection, baseline_ref)]
+
+    # By default the latest comparable runs before the candidate
+    return connection.execute(
+        'SELECT * FROM runs WHERE scenario = ? AND concurrency = ? AND transport = ? AND id < ? '
+        'ORDER BY id DESC LIMIT ?',
+        (candidate['scenario'], candidate['concurrency'], candidate['transport'], candidate['id'],
+         baseline_runs)).fetchall()
+
+
+def get_operations(connection, run_id):
+    return {row['operation']: row for row in
+            connection.execute('SELECT * FROM operations WHERE run_id = ?', (run_id,))}
+
+
+def compare_metric(candidate_value, baseline_values, higher_is_better, threshold, noise_factor, min_delta):
+    mean = sum(baseline_values) / len(baseline_values)
+    if len(baseline_values) > 1:
+        variance = sum((v - mean) ** 2 for v in baseline_values) / (len(baseline_values) - 1)
+        stddev = math.sqrt(variance)
+    else:
+        stddev = 0.0
+
+    # A change is only a regression beyond both the relative threshold and
+    # the run to run noise of the baseline
+    allowed = max(abs(mean) * threshold, noise_factor * stddev, min_delta)
+    delta = candidate_value - mean
+    worse = -delta if higher_is_better else delta
+
+    return mean, delta, worse > allowed
+
+
+def error_rate(row):
+    total = row['count'] + row['errors'] + row['timeouts']
+    return (row['errors'] + row['timeouts']) / total if total else 0.0
+
+
+def compare_runs(connection, candidate, baselines, threshold=0.10, noise_factor=3.0, min_delta_ms=1.0,
+                 max_error_rate_increase=0.01, min_count=20, operations=None):
+    candidate_operations = get_operations(connection, candidate['id'])
+    baseline_operations = [get_operations(connection, baseline['id']) for baseline in baselines]
+
+    rows = []
+    regressions = 0
+    for operation, candidate_row in sorted(candidate_operations.items()):
+        if operations and operation not in operations:
+            continue
+
+        comparable = [ops[operation] for ops in baseline_operations
+                      if operation in ops and ops[operation]['count'] >= min_count]
+        if not comparable or candidate_row['count'] < min_count:
+            continue
+
+        for metric, higher_is_better in COMPARED_METRICS:
+            min_delta = 0.0 if metric == 'throughput' else min_delta_ms
+            mean, delta, regressed = compare_metric(candidate_row[metric], [row[metric] for row in comparable],
+                                                    higher_is_better, threshold, noise_factor, min_delta)
+            rows.append((operation, metric, mean, candidate_row[metric], delta, regressed))
+            regressions += regressed
+
+        baseline_error_rate = sum(error_rate(row) for row in comparable) / len(comparable)
+        candidate_error_rate = error_rate(candidate_row)
+        regressed = candidate_error_rate - baseline_error_rate > max_error_rate_increase
+        rows.append((operation, 'error_rate', baseline_error_rate, candidate_error_rate,
+                     candidate_error_rate - baseline_error_rate, regressed))
+        regressions += regressed
+
+    return rows, regressions
+
+
+def print_comparison(candidate, baselines, rows):
+    baseline_ids = ', '.join(f'#{baseline["id"]}' for baseline in baselines)
+    print(f'Candidate #{candidate["id"]} (node {candidate["node_sha"]}, worker {candidate["worker_sha"]}, '
+          f'{candidate["scenario"]} x{candidate["concurrency"]}) against {baseline_ids}')
+    print(f'{"operation":<32} {"metric":<12} {"baseline":>12} {"candidate":>12} {"delta":>9}')
+    for operation, metric, baseline_value, candidate_value, delta, regressed in rows:
+        relative = f'{delta / baseline_value:+.1%}' if baseline_value else 'n/a'
+        print(f'{operation:<32} {metric:<12} {baseline_value:>12.3f} {candidate_value:>12.3f} {relative:>9}'
+              f'{"  REGRESSION" if regressed else ""}')
+
+
+def list_runs(connection, limit):
+    print(f'{"id":>5} {"started":<19} {"node":<8} {"worker":<8} {"scenario":<20} {"conc":>5} {"transport":<9} label')
+    for row in connection.execute('SELECT * FROM runs ORDER BY id DESC LIMIT ?', (limit,)):
+        started = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(row['started_at']))
+        print(f'{row["id"]:>5} {started:<19} {row["node_sha"]:<8} {row["worker_sha"]:<8} {row["scenario"]:<20} '
+              f'{row["concurrency"]:>5} {row["transport"]:<9} {row["label"] or ""}')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=['list', 'compare'],
+                        help='List the stored runs or compare a run against its baseline')
+    parser.add_argument('--store', required=False, default=DEFAULT_STORE_PATH,
+                        help=f'SQLite file holding the run results, defaults to "{DEFAULT_STORE_PATH}"', type=str)
+    parser.add_argument('--run', required=False, default='latest',
+                        help='Run id or label to compare, defaults to "latest"', type=str)
+    parser.add_argument('--baseline', required=False,
+                        help='Run id or label to compare against, defaults to the latest "--baseline-runs" runs '
+                        'with the same scenario, concurrency and transport', type=str)
+    parser.add_argument('--baseline-runs', required=False, default=5,
+                        help='Number of earlier runs forming the default baseline, defaults to 5', type=int)
+    parser.add_argument('--threshold', required=False, default=0.10,
+                        help='Relative change tolerated before flagging a regression, defaults to 0.10', type=float)
+    parser.add_argument('--noise-factor', required=False, default=3.0,
+                        help='Changes within that many standard deviations of the baseline runs are noise, defaults to 3', type=float)
+    parser.add_argument('--min-delta-ms', required=False, default=1.0,
+                        help='Latency changes below this are never regressions, defaults to 1ms', type=float)
+    parser.add_argument('--max-error-rate-increase', required=False, default=0.01,
+                        help='Tolerated increase of the error and timeout rate, defaults to 0.01', type=float)
+    parser.add_argument('--min-count', required=False, default=20,
+                        help='Skip operations with fewer successful samples than this, defaults to 20', type=int)
+    parser.add_argument('--operation', required=False, action='append',
+                        help='Only compare this operation, can be repeated', type=str)
+    parser.add_argument('--limit', required=False, default=20,
+                        help='Number of runs shown by "list", defaults to 20', type=int)
+    parser.add_argument('--verbose', required=False,
+                        help='Show additional logging messages', action='store_true')
+
+    args = parser.parse_args()
+
+    scu.setup_logging(verbose=args.verbose)
+
+    if not os.path.exists(args.store):
+        logging.error(f'No baseline store at {args.store}')
+        sys.exit(2)
+
+    store = open_store(args.store)
+    if args.command == 'list':
+        list_runs(store, args.limit)
+        sys.exit(0)
+
+    try:
+        candidate_run = get_run(store, args.run)
+        baseline_rows = get_baseline_runs(store, candidate_run, args.baseline, args.baseline_runs)
+    except BaselineException as ex:
+        logging.error(str(ex))
+        sys.exit(2)
+
+    if not baseline_rows:
+        logging.error(f'No baseline run to compare #{candidate_run["id"]} with')
+        sys.exit(2)
+
+    comparison, regression_count = compare_runs(store, candidate_run, baseline_rows, args.threshold,
+                                                args.noise_factor, args.min_delta_ms,
+                                                args.max_error_rate_increase, args.min_count, args.operation)
+    print_comparison(candidate_run, baseline_rows, comparison)
+
+    if regression_count:
+        logging.error(f'{regression_count} regression/s found')
+        sys.exit(1)
+
+    logging.info('No regression found')
@@ -0,0 +1,259 @@
+#!/usr/bin/python3
+
+import argparse
+import logging
+import random
+import sys
+import time
+
+import script_utils as scu
+from script_utils import eventlog, metrics
+
+
+def generate_board_string(rng, block_ratio=0.08, bomb_ratio=0.03, stone_ratio=0.03):
+    cells = []
+    for _ in range(scu.BoardParser.SIZE * scu.BoardParser.SIZE):
+        draw = rng.random()
+        if draw < block_ratio:
+            cells.append('Block')
+        elif draw < block_ratio + bomb_ratio:
+            cells.append('Bomb')
+        elif draw < block_ratio + bomb_ratio + stone_ratio:
+            cells.append('Stone')
+        else:
+            cells.append('Empty')
+
+    rows = ', '.join('[' + ', '.join(cells[i:i + scu.BoardParser.SIZE]) + ']'
+                     for i in range(0, len(cells), scu.BoardParser.SIZE))
+    return f'BoardState {{ board: [{rows}] }}'
+
+
+class BaselineBoardParser:
+    # The list of lists parser BoardParser replaced, kept as the reference
+    # the byte buffer one must agree with. Only the north side is changed, it
+    # dropped stones into the non-existent self.__board_matrix.
+    EMPTY = 'Empty'
+    STONE = 'Stone'
+    BOMB = 'Bomb'
+    BLOCK = 'Block'
+
+    def __init__(self, board_string):
+        try:
+            cells_list = board_string.split('[[')[1].split(']]')[0].replace(
+                ']', '').replace('[', '').split(', ')
+            self._board_matrix = [
+                cells_list[i * 10:(i * 10) + 10] for i in range(10)]
+        except Exception:
+            raise scu.BoardParseException
+
+    @property
+    def board_matrix(self):
+        return self._board_matrix
+
+    def compute_bomb_orders(self, update_matrix=False):
+        bomb_orders = []
+
+        for i in range(10):
+            for j in range(10):
+                if self._board_matrix[i][j] == BaselineBoardParser.EMPTY:
+                    bomb_orders.append((str(i), str(j)))
+                    if update_matrix:
+                        self._board_matrix[i][j] = BaselineBoardParser.BOMB
+
+                    if len(bomb_orders) == 3:
+                        return bomb_orders
+
+        return bomb_orders
+
+    def compute_stone_orders(self, player_1, player_2, update_matrix=False):
+        def is_valid_row(cells_matrix, row_index, start_point, direction):
+            row_can_fit_stones = all(cells_matrix[row_index][start_point + direction * k] == BaselineBoardParser.EMPTY
+                                     for k in range(4))
+
+            if row_can_fit_stones:
+                i = start_point + (direction * 3)
+                while i > 0 and i < len(cells_matrix[row_index]):
+                    if cells_matrix[row_index][i] == BaselineBoardParser.BLOCK:
+                        return True
+                    i += direction
+
+            return False
+
+        def is_valid_col(cells_matrix, col_index, start_point, direction):
+            col_can_fit_stones = all(cells_matrix[start_point + direction * k][col_index] == BaselineBoardParser.EMPTY
+                                     for k in range(4))
+
+            if col_can_fit_stones:
+                i = start_point + (direction * 3)
+                while i > 0 and i < len(cells_matrix):
+                    if cells_matrix[i][col_index] == BaselineBoardParser.BLOCK:
+                        return True
+                    i += direction
+
+            return False
+
+        def drop_stones_in_row(cells_matrix, row_index, start_point, direction):
+            true_start_point = start_point
+            for i in range(10):
+                moved_start_point = start_point + (i * direction)
+                if cells_matrix[row_index][start_point + (i * direction)] != BaselineBoardParser.EMPTY:
+                    true_start_point = moved_start_point
+
+            i = 4
+            r = 0
+            while i > 0:
+                if cells_matrix[row_index][true_start_point + r] == BaselineBoardParser.EMPTY:
+                    cells_matrix[row_index][true_start_point + r] = BaselineBoardParser.STONE
+                    i -= 1
+                r += direction
+
+        def drop_stones_in_col(cells_matrix, col_index, start_point, direction):
+            true_start_point = start_point
+            for i in range(10):
+                moved_start_point = start_point + (i * direction)
+                if cells_matrix[start_point + (i * direction)][col_index] != BaselineBoardParser.EMPTY:
+                    true_start_point = moved_start_point
+
+            i = 4
+            r = 0
+            while i > 0:
+                if cells_matrix[true_start_point + r][col_index] == BaselineBoardParser.EMPTY:
+                    cells_matrix[true_start_point + r][col_index] = BaselineBoardParser.STONE
+                    i -= 1
+                r += direction
+
+        stone_orders_player_1 = []
+        stone_orders_player_2 = []
+
+        sides = [('west', is_valid_row, 0, 1, drop_stones_in_row, 9, -1),
+                 ('east', is_valid_row, 9, -1, drop_stones_in_row, 0, 1),
+                 ('north', is_valid_col, 0, 1, drop_stones_in_col, 9, -1),
+                 ('south', is_valid_col, 9, -1, drop_stones_in_col, 0, 1)]
+        for side, is_valid, start_point, direction, drop_stones, drop_start_point, drop_direction in sides:
+            for i in range(10):
+                if is_valid(self._board_matrix, i, start_point, direction):
+                    if len(stone_orders_player_1) == 0:
+                        stone_orders_player_1 = [(side, str(i))] * 4
+                    elif len(stone_orders_player_2) == 0:
+                        stone_orders_player_2 = [(side, str(i))] * 4
+                    else:
+                        return {player_1: stone_orders_player_1, player_2: stone_orders_player_2}
+
+                    if update_matrix:
+                        drop_stones(self._board_matrix, i, drop_start_point, drop_direction)
+
+        return {player_1: stone_orders_player_1, player_2: stone_orders_player_2}
+
+
+def compare_with_baseline(board_string):
+    # Orders and the board after applying them must match the baseline parser
+    baseline = BaselineBoardParser(board_string)
+    parser = scu.BoardParser(board_string)
+
+    for name, board_parser in (('baseline', baseline), ('parser', parser)):
+        if len(board_parser.board_matrix) != scu.BoardParser.SIZE:
+            return f'{name} did not parse {scu.BoardParser.SIZE} rows'
+
+    if parser.board_matrix != baseline.board_matrix:
+        return 'parsed boards differ'
+    if (orders := parser.compute_bomb_orders(update_matrix=True)) != (
+            expected := baseline.compute_bomb_orders(update_matrix=True)):
+        return f'bomb orders {orders} differ from {expected}'
+    if (orders := parser.compute_stone_orders('player_1', 'player_2', update_matrix=True)) != (
+            expected := baseline.compute_stone_orders('player_1', 'player_2', update_matrix=True)):
+        return f'stone orders {orders} differ from {expected}'
+    if parser.board_matrix != baseline.board_matrix:
+        return 'boards differ after applying the orders'
+
+    return None
+
+
+def load_recorded_boards(event_log_path):
+    return [event['output'] for event in eventlog.iter_events(event_log_path)
+            if event['operation'] == 'get-board' and event.get('outcome') == metrics.OUTCOME_OK
+            and event.get('output') and 'could not fetch board' not in event['output']]
+
+
+def check_orders(board_string, bomb_orders, stone_orders):
+    board = scu.BoardParser(board_string).board_matrix
+
+    for row, col in bomb_orders:
+        if board[int(row)][int(col)] != 'Empty':
+            return f'bomb order {(row, col)} is not on an empty cell'
+
+    for orders in stone_orders.values():
+        if orders and len(set(orders)) != 1:
+            return f'stone orders {orders} are not on a single line'
+
+    return None
+
+
+def run_benchmark(boards, rounds):
+    failures = 0
+    for board_string in boards:
+        try:
+            parser = scu.BoardParser(board_string)
+        except scu.BoardParseException:
+            failures += 1
+            continue
+
+        bomb_orders = parser.compute_bomb_orders(update_matrix=True)
+        stone_orders = parser.compute_stone_orders(
+            'player_1', 'player_2', update_matrix=True)
+        if (error := check_orders(board_string, bomb_orders, stone_orders)) is not None:
+            logging.error(f'Invalid orders for {board_string}: {error}')
+            failures += 1
+        elif (error := compare_with_baseline(board_string)) is not None:
+            logging.error(f'Orders for {board_string} differ from the baseline parser: {error}')
+            failures += 1
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for board_string in boards:
+            scu.BoardParser(board_string)
+    parse_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for board_string in boards:
+            parser = scu.BoardParser(board_string)
+            parser.compute_bomb_orders(update_matrix=True)
+            parser.compute_stone_orders(
+                'player_1', 'player_2', update_matrix=True)
+    total_time = time.perf_counter() - start
+
+    board_count = len(boards) * rounds
+    logging.info(f'Parse: {parse_time / board_count * 1e6:.1f}us/board')
+    logging.info(
+        f'Parse and compute orders: {total_time / board_count * 1e6:.1f}us/board, {board_count / total_time:.0f} boards/s')
+
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--boards', required=False, default=1000,
+                        help='Amount of random boards to generate, defaults to 1000', type=int)
+    parser.add_argument('--rounds', required=False, default=10,
+                        help='Times every board is parsed while timing, defaults to 10', type=int)
+    parser.add_argument('--seed', required=False, default=0,
+                        help='Seed of the random board generator, defaults to 0', type=int)
+    parser.add_argument('--event-log', required=False,
+                        help='Also benchmark the boards recorded in this event log, e.g. "game-logs/events"', type=str)
+    parser.add_argument('--verbose', required=False,
+                        help='Show additional logging messages', action='store_true')
+
+    args = parser.parse_args()
+
+    scu.setup_logging(verbose=args.verbose)
+
+    rng = random.Random(args.seed)
+    boards = [generate_board_string(rng) for _ in range(args.boards)]
+    if args.event_log is not None:
+        recorded_boards = load_recorded_boards(args.event_log)
+        logging.info(
+            f'Loaded {len(recorded_boards)} recorded board/s from {args.event_log}')
+        boards.extend(recorded_boards)
+
+    if run_benchmark(boards, args.rounds) > 0:
+        sys.exit(1)
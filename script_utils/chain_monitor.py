@@ -0,0 +1,279 @@
+import collections
+import csv
+import logging
+import os
+import re
+import threading
+import time
+
+from substrateinterface import SubstrateInterface
+
+from script_utils import metrics
+from script_utils.funding import hash_extrinsic_hex
+
+
+# twox128("Timestamp") ++ twox128("Now"), raw so that no metadata is needed
+TIMESTAMP_NOW_KEY = '0xf0c365c3cf59d671eb72da0e7a4113c49f1f0515f462cdcf84e0f1d6045dfcbb'
+
+BLOCK_FIELDS = ['number', 'hash', 'observed_at', 'timestamp', 'block_time',
+                'extrinsics', 'events', 'weight_fullness', 'tracked_included']
+
+# Extrinsics seen in blocks are remembered for a while, so an extrinsic
+# tracked only after it was included, e.g. by a CLI waiting for inclusion,
+# still gets its latency
+RECENT_INCLUSIONS = 65536
+
+_EXTRINSIC_HASH = re.compile(r'0x[0-9a-fA-F]{64}')
+
+
+def get_ref_time(weight):
+    # Weight is a plain u64 before WeightV2 and {ref_time, proof_size} after
+    if isinstance(weight, dict):
+        return weight.get('ref_time', 0)
+    return weight or 0
+
+
+class TrackedExtrinsic:
+    def __init__(self, extrinsic_hash, operation, submitted_at):
+        self.extrinsic_hash = extrinsic_hash
+        self.operation = operation
+        self.submitted_at = submitted_at
+
+
+def find_extrinsic_hash(output):
+    # The last hash printed by the CLI for a submitted extrinsic
+    if not output or not (hashes := _EXTRINSIC_HASH.findall(output)):
+        return None
+    return hashes[-1].lower()
+
+
+class ChainMonitor:
+    # Blocks are streamed to <report_prefix>-blocks.csv as they are observed
+    # and only running totals are kept, so long runs do not pile them up
+    def __init__(self, rpc_url, report_prefix=None, poll_interval=0.25, connect=SubstrateInterface):
+        self.rpc_url = rpc_url
+        self.report_prefix = report_prefix
+        self.poll_interval = poll_interval
+        self.connect = connect
+
+        self.rpc_node = None
+        self.csv_file = None
+        self.csv_writer = None
+        self.block_count = 0
+        self.extrinsics_total = 0
+        self.extrinsics_max = 0
+        self.fullness_total = 0.0
+        self.fullness_count = 0
+        self.fullness_max = None
+        self.block_time_max = None
+
+        self.tracked = {}
+        self.recent_inclusions = collections.OrderedDict()
+        self.tracked_lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.thread = None
+
+        self.next_block = None
+        self.last_timestamp = None
+        self.max_block_ref_time = None
+        self.weights_available = True
+        self.events_available = True
+
+    def track(self, extrinsic_hash, operation, submitted_at=None):
+        submitted_at = submitted_at or time.monotonic()
+        with self.tracked_lock:
+            if (observed_at := self.recent_inclusions.pop(extrinsic_hash, None)) is not None:
+                metrics.get_run_metrics().record(f'inclusion-{operation}', max(observed_at - submitted_at, 0.0))
+                return
+            self.tracked[extrinsic_hash] = TrackedExtrinsic(extrinsic_hash, operation, submitted_at)
+
+    def start(self):
+        # A connection of its own, SubstrateInterface is not thread safe
+        self.rpc_node = self.connect(url=self.rpc_url)
+        header = self.rpc_node.rpc_request('chain_getHeader', [])['result']
+        self.next_block = int(header['number'], 16) + 1
+
+        try:
+            block_weights = self.rpc_node.get_constant('System', 'BlockWeights')
+            self.max_block_ref_time = get_ref_time(block_weights.value['max_block'])
+        except Exception as ex:
+            logging.debug(f'Block weight limits unavailable: {ex!r}')
+            self.weights_available = False
+
+        if self.report_prefix is not None:
+            report_dir = os.path.dirname(self.report_prefix)
+            if report_dir:
+                os.makedirs(report_dir, exist_ok=True)
+            self.csv_file = open(f'{self.report_prefix}-blocks.csv', 'w', newline='')
+            self.csv_writer = csv.DictWriter(self.csv_file, fieldnames=BLOCK_FIELDS)
+            self.csv_writer.writeheader()
+
+        self.thread = threading.Thread(
+            target=self._watch_blocks, name='chain-monitor', daemon=True)
+        self.thread.start()
+        logging.info(f'Monitoring blocks from #{self.next_block} on {self.rpc_url}')
+
+    def stop(self):
+        if self.thread is None:
+            return
+
+        self.stopping.set()
+        self.thread.join()
+        self.thread = None
+        if self.csv_file is not None:
+            self.csv_file.close()
+            self.csv_file = None
+
+        run_metrics = metrics.get_run_metrics()
+        with self.tracked_lock:
+            now = time.monotonic()
+            for waiting in self.tracked.values():
+                run_metrics.record(f'inclusion-{waiting.operation}',
+                                   now - waiting.submitted_at, metrics.OUTCOME_TIMEOUT)
+            if self.tracked:
+                logging.warning(
+                    f'{len(self.tracked)} tracked extrinsic/s not included by the end of the run')
+            self.tracked.clear()
+
+    def _watch_blocks(self):
+        while True:
+            stopping = self.stopping.is_set()
+            try:
+                header = self.rpc_node.rpc_request('chain_getHeader', [])['result']
+                while self.next_block <= int(header['number'], 16):
+                    self._observe_block(self.next_block)
+                    self.next_block += 1
+            except Exception as ex:
+                logging.warning(f'Chain monitor failed to read block #{self.next_block}: {ex!r}')
+
+            # One last sweep after stop() so blocks of the final moves count
+            if stopping:
+                break
+            self.stopping.wait(self.poll_interval)
+
+    def _read_timestamp(self, block_hash):
+        response = self.rpc_node.rpc_request(
+            'state_getStorage', [TIMESTAMP_NOW_KEY, block_hash])
+        if not (raw := response.get('result')):
+            return None
+        # Moment is a little endian u64 of milliseconds
+        return int.from_bytes(bytes.fromhex(raw[2:]), 'little') / 1000.0
+
+    def _read_weight_fullness(self, block_hash):
+        if not self.weights_available or not self.max_block_ref_time:
+            return None
+        try:
+            block_weight = self.rpc_node.query('System', 'BlockWeight', block_hash=block_hash).value
+        except Exception as ex:
+            logging.debug(f'Block weight unavailable: {ex!r}')
+            self.weights_available = False
+            return None
+
+        used = sum(get_ref_time(weight) for weight in block_weight.values())
+        return used / self.max_block_ref_time
+
+    def _read_event_count(self, block_hash):
+        if not self.events_available:
+            return None
+        try:
+            return len(self.rpc_node.get_events(block_hash))
+        except Exception as ex:
+            logging.debug(f'Block events unavailable: {ex!r}')
+            self.events_available = False
+            return None
+
+    def _observe_block(self, block_number):
+        run_metrics = metrics.get_run_metrics()
+        observed_at = time.monotonic()
+
+        block_hash = self.rpc_node.rpc_request(
+            'chain_getBlockHash', [block_number])['result']
+        block = self.rpc_node.rpc_request('chain_getBlock', [block_hash])['result']
+        extrinsics = block['block']['extrinsics']
+
+        tracked_included = 0
+        with self.tracked_lock:
+            for extrinsic_hash in map(hash_extrinsic_hex, extrinsics):
+                if (included := self.tracked.pop(extrinsic_hash, None)) is not None:
+                    run_metrics.record(f'inclusion-{included.operation}',
+                                       observed_at - included.submitted_at)
+                    tracked_included += 1
+                else:
+                    self.recent_inclusions[extrinsic_hash] = observed_at
+            while len(self.recent_inclusions) > RECENT_INCLUSIONS:
+                self.recent_inclusions.popitem(last=False)
+
+        timestamp = self._read_timestamp(block_hash)
+        block_time = None
+        if timestamp is not None and self.last_timestamp is not None:
+            block_time = timestamp - self.last_timestamp
+            run_metrics.record('block-time', block_time)
+        self.last_timestamp = timestamp
+
+        event_count = self._read_event_count(block_hash)
+        weight_fullness = self._read_weight_fullness(block_hash)
+
+        run_metrics.increment('blocks-observed')
+        run_metrics.increment('block-extrinsics', len(extrinsics))
+        if event_count is not None:
+            run_metrics.increment('block-events', event_count)
+
+        self.block_count += 1
+        self.extrinsics_total += len(extrinsics)
+        self.extrinsics_max = max(self.extrinsics_max, len(extrinsics))
+        if weight_fullness is not None:
+            self.fullness_total += weight_fullness
+            self.fullness_count += 1
+            self.fullness_max = max(self.fullness_max or 0.0, weight_fullness)
+        if block_time is not None:
+            self.block_time_max = max(self.block_time_max or 0.0, block_time)
+
+        if self.csv_writer is not None:
+            self.csv_writer.writerow({'number': block_number, 'hash': block_hash, 'observed_at': observed_at,
+                                      'timestamp': timestamp, 'block_time': block_time, 'extrinsics': len(extrinsics),
+                                      'events': event_count, 'weight_fullness': weight_fullness,
+                                      'tracked_included': tracked_included})
+            self.csv_file.flush()
+        logging.debug(f'Block #{block_number}: {len(extrinsics)} extrinsic/s, {event_count} event/s, '
+                      f'weight fullness {weight_fullness}')
+
+    def summary(self):
+        if not self.block_count:
+            return {'blocks': 0}
+
+        return {
+            'blocks': self.block_count,
+            'extrinsics_mean': self.extrinsics_total / self.block_count,
+            'extrinsics_max': self.extrinsics_max,
+            'weight_fullness_mean': self.fullness_total / self.fullness_count if self.fullness_count else None,
+            'weight_fullness_max': self.fullness_max,
+            'block_time_max': self.block_time_max,
+        }
+
+    def write_report(self):
+        summary = self.summary()
+        if self.report_prefix is not None:
+            logging.info(f'Block report written to {self.report_prefix}-blocks.csv')
+        if summary['blocks']:
+            logging.info(f'{summary["blocks"]} block/s observed, {summary["extrinsics_mean"]:.1f} extrinsic/s per block '
+                         f'on average, {summary["extrinsics_max"]} at most')
+            if summary['weight_fullness_mean'] is not None:
+                logging.info(f'Block weight fullness {summary["weight_fullness_mean"]:.1%} on average, '
+                             f'{summary["weight_fullness_max"]:.1%} at most')
+
+        return summary
+
+
+_monitor = None
+
+
+def set_chain_monitor(monitor):
+    global _monitor
+    _monitor = monitor
+
+
+def track(extrinsic_hash, operation, submitted_at=None):
+    # Extrinsics submitted deep inside the games are handed over here
+    # instead of passing the monitor down to every caller
+    if _monitor is not None:
+        _monitor.track(extrinsic_hash, operation, submitted_at)
@@ -0,0 +1,335 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+from script_utils import metrics
+
+
+DEFAULT_COORDINATOR_PORT = 7878
+PROTOCOL_VERSION = 1
+
+# Setup and assign messages list every account or pair of an agent's share
+# on one line, far beyond the 64KiB asyncio reads by default
+MAX_MESSAGE_SIZE = 256 * 1024 * 1024
+
+
+class DistributedException(Exception):
+    pass
+
+
+def parse_address(address, default_port=DEFAULT_COORDINATOR_PORT):
+    host, _, port = address.rpartition(':')
+    if not host:
+        return address or '0.0.0.0', default_port
+
+    try:
+        return host, int(port)
+    except ValueError:
+        raise DistributedException(f'Invalid address "{address}"')
+
+
+def get_default_agent_name():
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+
+async def send_message(writer, message):
+    writer.write(json.dumps(message, separators=(',', ':')).encode('utf-8') + b'\n')
+    await writer.drain()
+
+
+async def read_message(reader, timeout=None):
+    line = await asyncio.wait_for(reader.readline(), timeout)
+    if not line:
+        raise ConnectionError('connection closed')
+    return json.loads(line)
+
+
+def partition(items, parts):
+    chunk_size = -(-len(items) // parts) if parts else 0
+    return [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)] if chunk_size else []
+
+
+class AgentConnection:
+    def __init__(self, name, reader, writer, heartbeat_timeout):
+        self.name = name
+        self.reader = reader
+        self.writer = writer
+        self.heartbeat_timeout = heartbeat_timeout
+        self.alive = True
+        self.metrics = None
+        self.replies = asyncio.Queue()
+
+    async def listen(self):
+        try:
+            while True:
+                # Agents stream metrics periodically, silence means they died
+                message = await read_message(self.reader, self.heartbeat_timeout)
+                if message.get('type') == 'metrics':
+                    self.metrics = metrics.RunMetrics.from_dict(message['metrics'])
+                else:
+                    await self.replies.put(message)
+        except (ConnectionError, OSError, ValueError, asyncio.TimeoutError) as ex:
+            if self.alive:
+                logging.debug(f'Agent "{self.name}" connection ended: {ex!r}')
+        finally:
+            self.alive = False
+            self.writer.close()
+            await self.replies.put(None)
+
+    async def request(self, message):
+        if not self.alive:
+            raise ConnectionError(f'agent "{self.name}" is gone')
+
+        await send_message(self.writer, message)
+        if (reply := await self.replies.get()) is None:
+            raise ConnectionError(f'agent "{self.name}" disconnected')
+        return reply
+
+    def games_reported(self):
+        if self.metrics is None:
+            return 0
+        return self.metrics.counters.get('games-finished', 0) + self.metrics.counters.get('games-failed', 0)
+
+
+class Coordinator:
+    def __init__(self, address, agent_count, connect_timeout=300.0, heartbeat_timeout=60.0):
+        self.host, self.port = parse_address(address)
+        self.agent_count = agent_count
+        self.connect_timeout = connect_timeout
+        self.heartbeat_timeout = heartbeat_timeout
+
+        self.agents = []
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(
+            target=self.loop.run_forever, name='coordinator', daemon=True)
+        self.server = None
+        self.agents_connected = None
+        self.handlers = set()
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def start(self):
+        self.thread.start()
+        try:
+            self._run(self._start_server())
+        except OSError as ex:
+            raise DistributedException(f'Could not listen on {self.host}:{self.port}: {ex}')
+        logging.info(
+            f'Coordinator listening on {self.host}:{self.port} for {self.agent_count} agent/s')
+
+    async def _start_server(self):
+        self.agents_connected = asyncio.Event()
+        self.server = await asyncio.start_server(self._accept, self.host, self.port, limit=MAX_MESSAGE_SIZE)
+
+    async def _accept(self, reader, writer):
+        handler = asyncio.current_task()
+        self.handlers.add(handler)
+        try:
+            await self._handle_agent(reader, writer)
+        finally:
+            self.handlers.discard(handler)
+
+    async def _handle_agent(self, reader, writer):
+        try:
+            hello = await read_message(reader, self.heartbeat_timeout)
+        except (ConnectionError, OSError, ValueError, asyncio.TimeoutError) as ex:
+            logging.warning(f'Dropping agent connection without greeting: {ex!r}')
+            writer.close()
+            return
+
+        if hello.get('type') != 'hello' or hello.get('version') != PROTOCOL_VERSION:
+            logging.warning(f'Dropping agent with unsupported greeting {hello}')
+            writer.close()
+            return
+
+        if len(self.agents) >= self.agent_count:
+            logging.warning(f'Dropping agent "{hello.get("agent")}", all {self.agent_count} slot/s are taken')
+            writer.close()
+            return
+
+        agent = AgentConnection(hello.get('agent', str(len(self.agents))),
+                                reader, writer, self.heartbeat_timeout)
+        self.agents.append(agent)
+        logging.info(
+            f'Agent "{agent.name}" connected ({len(self.agents)}/{self.agent_count})')
+        if len(self.agents) == self.agent_count:
+            self.agents_connected.set()
+
+        await agent.listen()
+        logging.warning(f'Agent "{agent.name}" disconnected')
+
+    def wait_for_agents(self):
+        async def wait():
+            await asyncio.wait_for(self.agents_connected.wait(), self.connect_timeout)
+
+        try:
+            self._run(wait())
+        except asyncio.TimeoutError:
+            raise DistributedException(f'Only {len(self.agents)}/{self.agent_count} agent/s connected '
+                                       f'within {self.connect_timeout:g}s')
+
+    def live_agents(self):
+        return [agent for agent in self.agents if agent.alive]
+
+    def set_balances(self, account_names, balance):
+        return self._run(self._set_balances(account_names, balance))
+
+    async def _set_balances(self, account_names, balance):
+        results = {}
+        pending = list(account_names)
+
+        # Setting a trusted balance is idempotent, so a lost agent's share
+        # is simply handed to the agents still alive
+        while pending and (agents := self.live_agents()):
+            chunks = partition(pending, len(agents))
+            replies = await asyncio.gather(*[agent.request({'type': 'setup', 'accounts': chunk, 'balance': balance})
+                                             for agent, chunk in zip(agents, chunks)], return_exceptions=True)
+            pending = []
+            for agent, chunk, reply in zip(agents, chunks, replies):
+                if isinstance(reply, Exception):
+                    logging.error(
+                        f'Agent "{agent.name}" lost while setting {len(chunk)} balance/s: {reply}')
+                    pending.extend(chunk)
+                else:
+                    results.update(zip(chunk, reply['results']))
+
+        if pending:
+            logging.error(f'No agent left to set {len(pending)} balance/s')
+
+        return [results.get(name, False) for name in account_names]
+
+    def play(self, player_pairs_list, queued_ago):
+        return self._run(self._play(player_pairs_list, queued_ago))
+
+    async def _play(self, player_pairs_list, queued_ago):
+        agents = self.live_agents()
+        if not agents:
+            raise DistributedException('No agent left to play games')
+
+        run_metrics = metrics.get_run_metrics()
+        pair_chunks = partition(list(player_pairs_list), len(agents))
+        ago_chunks = partition(list(queued_ago), len(agents))
+        for agent, chunk in zip(agents, pair_chunks):
+            logging.info(f'Assigning {len(chunk)} game/s to agent "{agent.name}"')
+
+        replies = await asyncio.gather(*[agent.request({'type': 'assign', 'pairs': pairs, 'queued_ago': ago})
+                                         for agent, pairs, ago in zip(agents, pair_chunks, ago_chunks)],
+                                       return_exceptions=True)
+
+        results = []
+        for agent, chunk, reply in zip(agents, pair_chunks, replies):
+            if isinstance(reply, Exception):
+                # Games half played by a lost agent cannot be resumed elsewhere
+                lost_games = max(len(chunk) - agent.games_reported(), 0)
+                logging.error(
+                    f'Agent "{agent.name}" lost mid-run, {lost_games}/{len(chunk)} of its game/s unaccounted for')
+                run_metrics.increment('agents-lost')
+                run_metrics.increment('games-lost', lost_games)
+                results.extend([False] * len(chunk))
+            else:
+                results.extend(reply['results'])
+
+        return results
+
+    def merged_metrics(self):
+        merged = None
+        for agent in self.agents:
+            if agent.metrics is None:
+                continue
+            if merged is None:
+                merged = metrics.RunMetrics.from_dict(agent.metrics.to_dict())
+            else:
+                merged.merge(agent.metrics)
+
+        return merged
+
+    def close(self):
+        if not self.thread.is_alive():
+            return
+
+        async def stop():
+            for agent in self.live_agents():
+                try:
+                    await send_message(agent.writer, {'type': 'stop'})
+                except (ConnectionError, OSError):
+                    pass
+                agent.alive = False
+                agent.writer.close()
+            if self.server is not None:
+                self.server.close()
+                await self.server.wait_closed()
+            # Let the listeners see their connections end
+            if self.handlers:
+                await asyncio.wait(self.handlers, timeout=5.0)
+
+        self._run(stop())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+async def run_agent(address, handlers, name=None, metrics_interval=5.0, connect_timeout=300.0):
+    # handlers maps a request type to a coroutine function returning the reply
+    host, port = parse_address(address)
+    name = name or get_default_agent_name()
+
+    deadline = time.monotonic() + connect_timeout
+    while True:
+        try:
+            reader, writer = await asyncio.open_connection(host, port, limit=MAX_MESSAGE_SIZE)
+            break
+        except OSError as ex:
+            if time.monotonic() > deadline:
+                raise DistributedException(
+                    f'Could not reach coordinator {host}:{port}: {ex}')
+            await asyncio.sleep(1.0)
+
+    send_lock = asyncio.Lock()
+
+    async def send(message):
+        async with send_lock:
+            await send_message(writer, message)
+
+    async def send_metrics():
+        await send({'type': 'metrics', 'metrics': metrics.get_run_metrics().to_dict()})
+
+    async def stream_metrics():
+        try:
+            while True:
+                await asyncio.sleep(metrics_interval)
+                await send_metrics()
+        except (ConnectionError, OSError):
+            pass
+
+    await send({'type': 'hello', 'agent': name, 'version': PROTOCOL_VERSION})
+    logging.info(f'Agent "{name}" connected to coordinator {host}:{port}')
+
+    streamer = asyncio.ensure_future(stream_metrics())
+    try:
+        while True:
+            message = await read_message(reader)
+            if message.get('type') == 'stop':
+                logging.info('Coordinator finished the run')
+                break
+
+            if (handler := handlers.get(message.get('type'))) is None:
+                raise DistributedException(
+                    f'Unexpected coordinator message "{message.get("type")}"')
+
+            reply = await handler(message)
+            # The final snapshot must reach the coordinator before the reply
+            await send_metrics()
+            await send(reply)
+    except ConnectionError:
+        logging.error('Coordinator connection lost')
+    except ValueError as ex:
+        # Oversized or garbled messages leave the stream out of step
+        logging.error(f'Unreadable coordinator message: {ex}')
+        raise DistributedException(f'Unreadable coordinator message: {ex}')
+    finally:
+        streamer.cancel()
+        writer.close()
@@ -0,0 +1,259 @@
+#!/usr/bin/python3
+
+import argparse
+import glob
+import gzip
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+
+import script_utils as scu
+from script_utils import metrics
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+DEFAULT_EVENT_LOG_PATH = 'game-logs/events'
+
+COMPRESSION_SUFFIXES = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+
+
+class EventLogException(Exception):
+    pass
+
+
+def open_segment(path, compression):
+    if compression == 'gzip':
+        return gzip.open(path, 'wb', compresslevel=6)
+    elif compression == 'zstd':
+        if zstandard is None:
+            raise EventLogException(
+                'zstd compression requires the "zstandard" package')
+        return zstandard.ZstdCompressor().stream_writer(open(path, 'wb'))
+
+    return open(path, 'wb')
+
+
+def open_segment_reader(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt')
+    elif path.endswith('.zst'):
+        if zstandard is None:
+            raise EventLogException(
+                f'Reading {path} requires the "zstandard" package')
+        return zstandard.open(path, 'rt')
+
+    return open(path, 'r')
+
+
+class EventLog:
+    def __init__(self, path_prefix=DEFAULT_EVENT_LOG_PATH, compression=None, rotate_bytes=256 * 1024 * 1024,
+                 batch_size=1024, flush_interval=1.0):
+        if compression not in COMPRESSION_SUFFIXES:
+            raise EventLogException(f'Unknown compression "{compression}"')
+        if compression == 'zstd' and zstandard is None:
+            raise EventLogException(
+                'zstd compression requires the "zstandard" package')
+
+        self.path_prefix = path_prefix
+        self.compression = compression
+        self.rotate_bytes = rotate_bytes
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.events = queue.Queue()
+        self.segment = None
+        self.segment_index = 0
+        self.segment_bytes = 0
+        self.dropped_events = 0
+
+        prefix_dir = os.path.dirname(path_prefix)
+        if prefix_dir:
+            os.makedirs(prefix_dir, exist_ok=True)
+
+        self.writer = threading.Thread(
+            target=self._write_events, name='event-log-writer', daemon=True)
+        self.writer.start()
+
+    def segment_path(self, index):
+        return f'{self.path_prefix}-{index:05d}.jsonl{COMPRESSION_SUFFIXES[self.compression]}'
+
+    def emit(self, event):
+        self.events.put(event)
+
+    def _rotate(self):
+        if self.segment is not None:
+            self.segment.close()
+
+        # Never append to a segment left behind by an earlier run
+        while os.path.exists(self.segment_path(self.segment_index)):
+            self.segment_index += 1
+
+        path = self.segment_path(self.segment_index)
+        logging.debug(f'Writing events to {path}')
+        self.segment = open_segment(path, self.compression)
+        self.segment_bytes = 0
+
+    def _write_batch(self, batch):
+        if self.segment is None or self.segment_bytes >= self.rotate_bytes:
+            self._rotate()
+
+        data = ''.join(json.dumps(event, separators=(',', ':')) + '\n'
+                       for event in batch).encode('utf-8')
+        self.segment.write(data)
+        self.segment.flush()
+        self.segment_bytes += len(data)
+
+    def _write_events(self):
+        closing = False
+        while not closing:
+            try:
+                batch = [self.events.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.events.get_nowait())
+                except queue.Empty:
+                    break
+
+            if batch[-1] is None:
+                closing = True
+                batch.pop()
+
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except Exception as ex:
+                    self.dropped_events += len(batch)
+                    logging.error(
+                        f'Failed to write {len(batch)} event/s: {ex}')
+
+        if self.segment is not None:
+            self.segment.close()
+
+    def close(self):
+        self.events.put(None)
+        self.writer.join()
+        if self.dropped_events:
+            logging.error(
+                f'{self.dropped_events} event/s could not be written to the event log')
+
+
+class NullEventLog:
+    def emit(self, event):
+        pass
+
+    def close(self):
+        pass
+
+
+_event_log = NullEventLog()
+
+
+def get_event_log():
+    return _event_log
+
+
+def open_event_log(*args, **kwargs):
+    global _event_log
+    _event_log = EventLog(*args, **kwargs)
+    return _event_log
+
+
+def close_event_log():
+    global _event_log
+    _event_log.close()
+    _event_log = NullEventLog()
+
+
+def emit(operation, game=None, player=None, started_at=None, latency=None, outcome=metrics.OUTCOME_OK, **fields):
+    get_event_log().emit({'time': time.time(), 'game': game, 'player': player, 'operation': operation,
+                          'started_at': started_at, 'latency': latency, 'outcome': outcome, **fields})
+
+
+def iter_events(path_pattern):
+    paths = sorted(glob.glob(path_pattern)) or sorted(
+        glob.glob(f'{path_pattern}-*.jsonl*'))
+    for path in paths:
+        with open_segment_reader(path) as segment:
+            for line in segment:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def matches(event, args):
+    return ((args.game is None or event.get('game') == args.game) and
+            (args.player is None or event.get('player') == args.player) and
+            (args.operation is None or event.get('operation') == args.operation) and
+            (args.outcome is None or event.get('outcome') == args.outcome))
+
+
+def summarize(events):
+    run_metrics = metrics.RunMetrics()
+    first_time = None
+    last_time = None
+    games = {}
+
+    for event in events:
+        if event.get('latency') is not None:
+            run_metrics.record(event['operation'], event['latency'],
+                               event.get('outcome', metrics.OUTCOME_OK))
+        else:
+            run_metrics.increment(
+                f'{event["operation"]}-{event.get("outcome", metrics.OUTCOME_OK)}')
+
+        if event['operation'] == 'game-end':
+            games[event.get('outcome', metrics.OUTCOME_OK)] = games.get(
+                event.get('outcome', metrics.OUTCOME_OK), 0) + 1
+
+        first_time = event['time'] if first_time is None else min(first_time, event['time'])
+        last_time = event['time'] if last_time is None else max(last_time, event['time'])
+
+    if first_time is not None:
+        run_metrics.started_at = first_time
+
+    summary = run_metrics.summary(finished_at=last_time)
+    summary['games'] = games
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=['query', 'summary'],
+                        help='Print the matching events or a per-operation summary of them')
+    parser.add_argument('path', help=f'Event log segment, glob or prefix, e.g. "{DEFAULT_EVENT_LOG_PATH}"')
+    parser.add_argument('--game', required=False,
+                        help='Only events of this game id', type=str)
+    parser.add_argument('--player', required=False,
+                        help='Only events of this player', type=str)
+    parser.add_argument('--operation', required=False,
+                        help='Only events of this operation', type=str)
+    parser.add_argument('--outcome', required=False,
+                        help='Only events with this outcome', type=str)
+    parser.add_argument('--verbose', required=False,
+                        help='Show additional logging messages', action='store_true')
+
+    args = parser.parse_args()
+
+    scu.setup_logging(verbose=args.verbose)
+
+    try:
+        events = (event for event in iter_events(args.path) if matches(event, args))
+        if args.command == 'query':
+            for event in events:
+                sys.stdout.write(json.dumps(event) + '\n')
+        else:
+            json.dump(summarize(events), sys.stdout, indent=2)
+            sys.stdout.write('\n')
+    except (EventLogException, OSError) as ex:
+        logging.error(f'Failed to read event log: {ex}')
+        sys.exit(1)
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+# Stand-in for "integritee-cli" forwarding its arguments to a running
+# "python -m script_utils.simulator serve". Only the standard library is
+# imported so that forking it costs about as much as forking the real CLI.
+
+import json
+import os
+import socket
+import sys
+
+
+DEFAULT_ADDRESS = '127.0.0.1:7879'
+
+
+def main():
+    host, _, port = os.environ.get('FAKE_CLI_ADDRESS', DEFAULT_ADDRESS).rpartition(':')
+
+    try:
+        with socket.create_connection((host or '127.0.0.1', int(port))) as connection:
+            connection.sendall(json.dumps({'argv': sys.argv[1:]}).encode('utf-8') + b'\n')
+            with connection.makefile('rb') as reply_file:
+                reply = json.loads(reply_file.readline())
+    except (OSError, ValueError) as ex:
+        print(f'fake integritee-cli: simulator unreachable: {ex}', file=sys.stderr)
+        return 2
+
+    if reply.get('output'):
+        sys.stdout.write(reply['output'])
+        sys.stdout.flush()
+    return reply.get('returncode', 1)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,203 @@
+import hashlib
+import logging
+import time
+
+from script_utils import metrics, tracing
+
+
+class FundingException(Exception):
+    pass
+
+
+class PendingExtrinsic:
+    def __init__(self, extrinsic_hash, account_names, nonce, submitted_at):
+        self.extrinsic_hash = extrinsic_hash
+        self.account_names = account_names
+        self.nonce = nonce
+        self.submitted_at = submitted_at
+
+
+def hash_extrinsic_hex(extrinsic_hex):
+    extrinsic_bytes = bytes.fromhex(extrinsic_hex.replace('0x', '', 1))
+    return '0x' + hashlib.blake2b(extrinsic_bytes, digest_size=32).hexdigest()
+
+
+def get_next_nonce(rpc_node, address):
+    # Unlike the System.Account storage this accounts for the transaction pool
+    return rpc_node.rpc_request('system_accountNextIndex', [address])['result']
+
+
+def get_best_block_number(rpc_node):
+    header = rpc_node.rpc_request('chain_getHeader', [])['result']
+    return int(header['number'], 16)
+
+
+def get_block_extrinsic_hashes(rpc_node, block_number):
+    block_hash = rpc_node.rpc_request(
+        'chain_getBlockHash', [block_number])['result']
+    block = rpc_node.rpc_request('chain_getBlock', [block_hash])['result']
+
+    return block_hash, [hash_extrinsic_hex(xt) for xt in block['block']['extrinsics']]
+
+
+def get_extrinsic_failures(rpc_node, block_hash):
+    # Included is not executed: a failed batch_all reverts all of its
+    # transfers, a plain batch stops at the first failing one. Maps the index
+    # of every failed extrinsic in the block to the number of its leading
+    # calls that went through.
+    failures = {}
+    for event in rpc_node.get_events(block_hash):
+        record = event.value
+        if (extrinsic_idx := record.get('extrinsic_idx')) is None:
+            continue
+        event_name = (record['event']['module_id'], record['event']['event_id'])
+        if event_name == ('System', 'ExtrinsicFailed'):
+            failures[extrinsic_idx] = 0
+        elif event_name == ('Utility', 'BatchInterrupted'):
+            # {index, error} in newer runtimes, (index, error) in older ones
+            attributes = record['event']['attributes']
+            interrupted_at = attributes['index'] if isinstance(attributes, dict) else attributes[0]
+            failures[extrinsic_idx] = min(failures.get(extrinsic_idx, interrupted_at), interrupted_at)
+    return failures
+
+
+def compose_transfer_calls(rpc_node, account_addresses, amounts, batch_size=None):
+    transfer_calls = [rpc_node.compose_call(
+        call_module='Balances',
+        call_function='transfer',
+        call_params={
+            'dest': address,
+            'value': amount
+        }
+    ) for address, amount in zip(account_addresses, amounts)]
+
+    if not batch_size or batch_size <= 1:
+        return [(call, [i]) for i, call in enumerate(transfer_calls)]
+
+    batched_calls = []
+    for start in range(0, len(transfer_calls), batch_size):
+        chunk = transfer_calls[start:start + batch_size]
+        batch_call = rpc_node.compose_call(
+            call_module='Utility',
+            call_function='batch_all',
+            call_params={
+                'calls': chunk
+            }
+        )
+        batched_calls.append(
+            (batch_call, list(range(start, start + len(chunk)))))
+
+    return batched_calls
+
+
+def submit_with_nonce(rpc_node, call, keypair, nonce):
+    extrinsic = rpc_node.create_signed_extrinsic(
+        call=call, keypair=keypair, nonce=nonce)
+    extrinsic_hex = extrinsic.data.to_hex()
+
+    response = rpc_node.rpc_request('author_submitExtrinsic', [extrinsic_hex])
+    if 'error' in response:
+        raise FundingException(response['error'])
+
+    return response.get('result') or hash_extrinsic_hex(extrinsic_hex)
+
+
+def fund_accounts(rpc_node, funder_keypair, account_names, account_addresses, amounts,
+                  batch_size=None, max_pending=256, poll_interval=1.0, inclusion_timeout=120.0, chain_monitor=None):
+    calls = compose_transfer_calls(
+        rpc_node, account_addresses, amounts, batch_size)
+
+    logging.info(
+        f'Funding {len(account_names)} account/s with {len(calls)} extrinsic/s, at most {max_pending} pending')
+
+    nonce = get_next_nonce(rpc_node, funder_keypair.ss58_address)
+    next_block = get_best_block_number(rpc_node) + 1
+
+    pending = {}
+    events_available = True
+    funded_accounts = []
+    failed_accounts = []
+    call_queue = [(call, indexes, False) for call, indexes in reversed(calls)]
+
+    while call_queue or pending:
+        while call_queue and len(pending) < max_pending:
+            call, indexes, retried = call_queue.pop()
+            names = [account_names[i] for i in indexes]
+            try:
+                with tracing.span('submit_transfer', 'funding', nonce=nonce, accounts=len(names)):
+                    extrinsic_hash = submit_with_nonce(
+                        rpc_node, call, funder_keypair, nonce)
+            except Exception as ex:
+                if retried:
+                    logging.error(f'Failed to transfer funds to {names}: {ex}')
+                    metrics.get_run_metrics().record(
+                        'transfer', 0.0, metrics.OUTCOME_ERROR)
+                    failed_accounts.extend(names)
+                else:
+                    # The local nonce may have drifted, resync it and retry once
+                    logging.warning(
+                        f'Transfer submission for {names} rejected ({ex}), resyncing nonce...')
+                    call_queue.append((call, indexes, True))
+                    nonce = get_next_nonce(
+                        rpc_node, funder_keypair.ss58_address)
+                continue
+
+            logging.debug(
+                f'Submitted transfer {extrinsic_hash} with nonce {nonce} for {names}')
+            pending[extrinsic_hash] = PendingExtrinsic(
+                extrinsic_hash, names, nonce, time.monotonic())
+            if chain_monitor is not None:
+                chain_monitor.track(extrinsic_hash, 'transfer',
+                                    pending[extrinsic_hash].submitted_at)
+            nonce += 1
+
+        best_block = get_best_block_number(rpc_node)
+        if best_block < next_block:
+            time.sleep(poll_interval)
+        else:
+            while next_block <= best_block:
+                block_hash, extrinsic_hashes = get_block_extrinsic_hashes(rpc_node, next_block)
+                included_transfers = [(extrinsic_idx, pending.pop(extrinsic_hash))
+                                      for extrinsic_idx, extrinsic_hash in enumerate(extrinsic_hashes)
+                                      if extrinsic_hash in pending]
+
+                failures = {}
+                if included_transfers and events_available:
+                    try:
+                        failures = get_extrinsic_failures(rpc_node, block_hash)
+                    except Exception as ex:
+                        logging.warning(f'Block events unavailable, included transfers are taken as executed: {ex!r}')
+                        events_available = False
+
+                for extrinsic_idx, included in included_transfers:
+                    latency = time.monotonic() - included.submitted_at
+                    if (succeeded := failures.get(extrinsic_idx)) is None:
+                        logging.debug(
+                            f'Transfer {included.extrinsic_hash} included in block #{next_block}')
+                        metrics.get_run_metrics().record('transfer', latency)
+                        funded_accounts.extend(included.account_names)
+                    else:
+                        logging.error(f'Transfer {included.extrinsic_hash} to '
+                                      f'{included.account_names[succeeded:]} failed in block #{next_block}')
+                        metrics.get_run_metrics().record('transfer', latency, metrics.OUTCOME_ERROR)
+                        funded_accounts.extend(included.account_names[:succeeded])
+                        failed_accounts.extend(included.account_names[succeeded:])
+                next_block += 1
+
+            logging.info(
+                f'Funded {len(funded_accounts)}/{len(account_names)} account/s, {len(pending)} transfer/s pending')
+
+        now = time.monotonic()
+        for extrinsic_hash, waiting in list(pending.items()):
+            if now - waiting.submitted_at > inclusion_timeout:
+                logging.error(
+                    f'Transfer {extrinsic_hash} to {waiting.account_names} not included after {inclusion_timeout}s')
+                metrics.get_run_metrics().record(
+                    'transfer', now - waiting.submitted_at, metrics.OUTCOME_TIMEOUT)
+                failed_accounts.extend(waiting.account_names)
+                del pending[extrinsic_hash]
+
+    if failed_accounts:
+        logging.error(f'Failed to fund {len(failed_accounts)} account/s')
+
+    return funded_accounts, failed_accounts
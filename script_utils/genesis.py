@@ -0,0 +1,135 @@
+import json
+import logging
+import os
+import subprocess
+import time
+
+from script_utils import accounts
+
+
+GENERATED_CHAIN_SPEC_PATH = 'chain-spec.generated.json'
+DEFAULT_MANIFEST_PATH = 'genesis-accounts.json'
+
+# Where the node containers find the spec
+CONTAINER_CHAIN_SPEC_PATH = '/ajuna/chain-spec.json'
+
+# Far more than a run tops accounts up to, so fees paid across many runs
+# never make them look unfunded
+DEFAULT_ENDOWMENT = 1_000_000_000_000
+
+
+class GenesisException(Exception):
+    pass
+
+
+def build_base_spec(docker_exec, node_image, chain='dev'):
+    cmd = [docker_exec, 'run', '--rm', node_image, './node-solo', 'build-spec', '--chain', chain,
+           '--disable-default-bootnode']
+    logging.info(f'Exporting the "{chain}" chain spec of {node_image}...')
+    process = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if process.returncode != 0:
+        raise GenesisException(f'Could not export the chain spec: {process.stderr.strip()}')
+
+    try:
+        return json.loads(process.stdout)
+    except ValueError as ex:
+        raise GenesisException(f'The node printed an invalid chain spec: {ex}')
+
+
+def load_spec(spec_path):
+    try:
+        with open(spec_path) as spec_file:
+            return json.load(spec_file)
+    except (OSError, ValueError) as ex:
+        raise GenesisException(f'Could not read chain spec "{spec_path}": {ex}')
+
+
+def find_balances(spec):
+    # The genesis config moved around between Substrate versions, e.g.
+    # genesis.runtime.balances or genesis.runtimeGenesis.patch.balances
+    pending = [spec.get('genesis', {})]
+    while pending:
+        section = pending.pop()
+        if not isinstance(section, dict):
+            continue
+        if 'raw' in section:
+            raise GenesisException('Raw chain specs cannot be endowed, export it without "--raw"')
+        balances = section.get('balances')
+        if isinstance(balances, dict) and isinstance(balances.get('balances'), list):
+            return balances['balances']
+        pending.extend(section.values())
+
+    raise GenesisException('The chain spec has no genesis balances to extend')
+
+
+def endow_accounts(spec, addresses, endowment=DEFAULT_ENDOWMENT):
+    balances = find_balances(spec)
+
+    # Accounts such as Alice keep their own endowment
+    endowed = {address for address, _ in balances}
+    balances.extend([address, endowment] for address in addresses if address not in endowed)
+    return spec
+
+
+def write_json(data, path):
+    path_dir = os.path.dirname(path)
+    if path_dir:
+        os.makedirs(path_dir, exist_ok=True)
+
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as json_file:
+        json.dump(data, json_file, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def generate_chain_spec(base_spec, account_count, endowment=DEFAULT_ENDOWMENT, pool_path=accounts.DEFAULT_POOL_PATH,
+                        processes=None, spec_path=GENERATED_CHAIN_SPEC_PATH, manifest_path=DEFAULT_MANIFEST_PATH):
+    start = time.monotonic()
+    account_names = accounts.get_account_names(account_count)
+
+    # The same pool launch_tests.py reads, so it does not derive them again
+    account_pool = accounts.AccountPool.load(pool_path)
+    account_pool.derive(account_names, processes)
+    account_pool.save()
+
+    endow_accounts(base_spec, [account_pool.get_address(name) for name in account_names], endowment)
+    write_json(base_spec, spec_path)
+    write_json({'base_name': accounts.ACCOUNT_BASE_NAME, 'count': account_count, 'endowment': endowment,
+                'chain_spec': os.path.abspath(spec_path)}, manifest_path)
+
+    logging.info(f'Chain spec {spec_path} endows {account_count} account/s with {endowment} at genesis, '
+                 f'generated in {time.monotonic() - start:.1f}s')
+    return spec_path
+
+
+def load_manifest(manifest_path):
+    if manifest_path is None or not os.path.exists(manifest_path):
+        return None
+
+    try:
+        with open(manifest_path) as manifest_file:
+            manifest = json.load(manifest_file)
+    except (OSError, ValueError) as ex:
+        logging.warning(f'Ignoring unreadable genesis manifest {manifest_path}: {ex}')
+        return None
+
+    if manifest.get('base_name') != accounts.ACCOUNT_BASE_NAME:
+        logging.warning(f'Ignoring genesis manifest {manifest_path} of "{manifest.get("base_name")}" accounts')
+        return None
+    return manifest
+
+
+def count_prefunded(rpc_node, account_pool, manifest, account_names, balance):
+    # The manifest may outlive the chain it was made for, so the first and
+    # last account of the range are checked on chain instead of trusting it
+    prefunded = min(manifest['count'], len(account_names))
+    if prefunded == 0 or manifest['endowment'] < balance:
+        return 0
+
+    samples = [account_pool.get_address(account_names[0]), account_pool.get_address(account_names[prefunded - 1])]
+    free_balances = accounts.query_free_balances(rpc_node, samples)
+    if any(free_balances[address] < balance for address in samples):
+        logging.warning('The node does not run the genesis of the manifest, funding accounts on chain')
+        return 0
+
+    return prefunded
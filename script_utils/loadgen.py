@@ -0,0 +1,134 @@
+import asyncio
+import logging
+
+from script_utils import metrics
+
+
+class ProfileParseException(Exception):
+    pass
+
+
+class StepProfile:
+    def __init__(self, rates, step_duration):
+        self.rates = rates
+        self.step_duration = step_duration
+        self.duration = len(rates) * step_duration
+
+    def rate_at(self, t):
+        step = min(int(t // self.step_duration), len(self.rates) - 1)
+        return self.rates[step]
+
+
+class LinearRampProfile:
+    def __init__(self, start_rate, end_rate, duration):
+        self.start_rate = start_rate
+        self.end_rate = end_rate
+        self.duration = duration
+
+    def rate_at(self, t):
+        progress = min(max(t / self.duration, 0.0), 1.0)
+        return self.start_rate + (self.end_rate - self.start_rate) * progress
+
+
+class SpikeProfile:
+    def __init__(self, base_rate, peak_rate, duration, spike_at, spike_length):
+        self.base_rate = base_rate
+        self.peak_rate = peak_rate
+        self.duration = duration
+        self.spike_at = spike_at
+        self.spike_length = spike_length
+
+    def rate_at(self, t):
+        if self.spike_at <= t < self.spike_at + self.spike_length:
+            return self.peak_rate
+        return self.base_rate
+
+
+def parse_profile(spec):
+    # "step:rates=5/10/20,step=30", "ramp:start=1,end=50,duration=120" or
+    # "spike:base=5,peak=50,duration=120,at=60,length=10"
+    try:
+        kind, _, raw_params = spec.partition(':')
+        params = dict(param.split('=', 1)
+                      for param in raw_params.split(',') if param)
+
+        if kind == 'step':
+            rates = [float(rate) for rate in params['rates'].split('/')]
+            return StepProfile(rates, float(params['step']))
+        elif kind == 'ramp':
+            return LinearRampProfile(float(params['start']), float(params['end']), float(params['duration']))
+        elif kind == 'spike':
+            return SpikeProfile(float(params['base']), float(params['peak']), float(params['duration']),
+                                float(params['at']), float(params['length']))
+    except (KeyError, ValueError) as ex:
+        raise ProfileParseException(f'Invalid rate profile "{spec}": {ex}')
+
+    raise ProfileParseException(f'Unknown rate profile kind "{kind}"')
+
+
+def arrival_offsets(profile, idle_step=0.1):
+    t = 0.0
+    while t < profile.duration:
+        rate = profile.rate_at(t)
+        if rate <= 0:
+            t += idle_step
+            continue
+
+        yield t
+        t += 1.0 / rate
+
+
+async def run_open_loop(profile, dispatch, done=None, lag_tolerance=0.05):
+    # dispatch(intended_at) returns the coroutine serving one arrival, or None
+    # when there is nothing to serve it with. Arrivals never wait on earlier
+    # ones, so latency measured from intended_at includes any queueing.
+    loop = asyncio.get_running_loop()
+    run_metrics = metrics.get_run_metrics()
+
+    start = loop.time()
+    tasks = set()
+    scheduled = 0
+    dropped = 0
+    behind = 0
+    max_lag = 0.0
+
+    for offset in arrival_offsets(profile):
+        if done is not None and done():
+            break
+
+        intended_at = start + offset
+        if (delay := intended_at - loop.time()) > 0:
+            await asyncio.sleep(delay)
+
+        scheduled += 1
+        lag = loop.time() - intended_at
+        max_lag = max(max_lag, lag)
+        run_metrics.record('schedule-lag', lag)
+        if lag > lag_tolerance:
+            behind += 1
+
+        if (work := dispatch(intended_at)) is None:
+            dropped += 1
+            continue
+
+        task = asyncio.ensure_future(work)
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    run_metrics.increment('open-loop-scheduled', scheduled)
+    run_metrics.increment('open-loop-dropped', dropped)
+    run_metrics.increment('open-loop-behind-schedule', behind)
+
+    if behind:
+        logging.warning(f'Load generator fell behind schedule on {behind}/{scheduled} arrival/s, '
+                        f'max lag {max_lag * 1000:.1f}ms')
+    if dropped:
+        logging.warning(
+            f'{dropped}/{scheduled} arrival/s dropped, nothing was ready to serve them')
+
+    logging.info(f'Open loop run finished, {scheduled - dropped}/{scheduled} arrival/s served')
+
+    return scheduled, dropped, behind
@@ -0,0 +1,279 @@
+import csv
+import json
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+OUTCOME_OK = 'ok'
+OUTCOME_ERROR = 'error'
+OUTCOME_TIMEOUT = 'timeout'
+
+REPORT_PERCENTILES = [50.0, 90.0, 99.0, 99.9]
+
+
+class LatencyHistogram:
+    # Log-linear buckets in microseconds: exact below SUB_BUCKETS, then every
+    # power of two is split in SUB_BUCKETS // 2 linear slots (~1.6% precision)
+    SUB_BUCKETS = 128
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    @staticmethod
+    def bucket_index(value):
+        if value < LatencyHistogram.SUB_BUCKETS:
+            return value
+
+        half = LatencyHistogram.SUB_BUCKETS // 2
+        shift = value.bit_length() - half.bit_length()
+        return shift * half + (value >> shift)
+
+    @staticmethod
+    def bucket_upper_bound(index):
+        if index < LatencyHistogram.SUB_BUCKETS:
+            return index
+
+        half = LatencyHistogram.SUB_BUCKETS // 2
+        shift = index // half - 1
+        top = index - shift * half
+        return ((top + 1) << shift) - 1
+
+    def record(self, value_us, count=1):
+        value_us = max(int(value_us), 0)
+        index = LatencyHistogram.bucket_index(value_us)
+
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.count += count
+        self.total += value_us * count
+        self.min = value_us if self.min is None else min(self.min, value_us)
+        self.max = max(self.max, value_us)
+
+    def merge(self, other):
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percentile):
+        if self.count == 0:
+            return 0
+
+        target = max(math.ceil(percentile / 100.0 * self.count), 1)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(LatencyHistogram.bucket_upper_bound(index), self.max)
+
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    def to_dict(self):
+        return {'counts': {str(k): v for k, v in self.counts.items()}, 'count': self.count,
+                'total': self.total, 'min': self.min, 'max': self.max}
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls()
+        histogram.counts = {int(k): v for k, v in data['counts'].items()}
+        histogram.count = data['count']
+        histogram.total = data['total']
+        histogram.min = data['min']
+        histogram.max = data['max']
+        return histogram
+
+
+class OperationMetrics:
+    def __init__(self):
+        self.latencies = LatencyHistogram()
+        self.errors = 0
+        self.timeouts = 0
+
+    def record(self, latency, outcome=OUTCOME_OK):
+        if outcome == OUTCOME_TIMEOUT:
+            self.timeouts += 1
+        elif outcome == OUTCOME_ERROR:
+            self.errors += 1
+        else:
+            self.latencies.record(latency * 1_000_000)
+
+    def merge(self, other):
+        self.latencies.merge(other.latencies)
+        self.errors += other.errors
+        self.timeouts += other.timeouts
+
+    def summary(self, duration):
+        summary = {
+            'count': self.latencies.count,
+            'errors': self.errors,
+            'timeouts': self.timeouts,
+            'throughput': self.latencies.count / duration if duration > 0 else 0.0,
+            'mean_ms': self.latencies.mean() / 1000.0,
+        }
+        for percentile in REPORT_PERCENTILES:
+            summary[f'p{percentile:g}_ms'] = self.latencies.percentile(
+                percentile) / 1000.0
+        summary['max_ms'] = self.latencies.max / 1000.0
+
+        return summary
+
+    def to_dict(self):
+        return {'latencies': self.latencies.to_dict(), 'errors': self.errors, 'timeouts': self.timeouts}
+
+    @classmethod
+    def from_dict(cls, data):
+        operation_metrics = cls()
+        operation_metrics.latencies = LatencyHistogram.from_dict(
+            data['latencies'])
+        operation_metrics.errors = data['errors']
+        operation_metrics.timeouts = data['timeouts']
+        return operation_metrics
+
+
+class RunMetrics:
+    # Background threads such as the chain and resource monitors record into
+    # the same metrics the event loop reports, snapshots and windows, so
+    # every access goes through the lock
+    def __init__(self):
+        self.started_at = time.time()
+        self.operations = {}
+        self.counters = {}
+        self.window = None
+        self.lock = threading.RLock()
+
+    def get_operation(self, operation):
+        if operation not in self.operations:
+            self.operations[operation] = OperationMetrics()
+        return self.operations[operation]
+
+    def record(self, operation, latency, outcome=OUTCOME_OK):
+        with self.lock:
+            self.get_operation(operation).record(latency, outcome)
+            if self.window is not None:
+                self.window.record(operation, latency, outcome)
+
+    def increment(self, counter, count=1):
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + count
+            if self.window is not None:
+                self.window.increment(counter, count)
+
+    def take_window(self):
+        # Everything recorded since the previous call, for time bucketed trends
+        with self.lock:
+            window, self.window = self.window, RunMetrics()
+        return window
+
+    def stop_windows(self):
+        with self.lock:
+            self.window = None
+
+    @contextmanager
+    def measure(self, operation, timeout_exceptions=(TimeoutError,)):
+        start = time.perf_counter()
+        try:
+            yield
+        except timeout_exceptions:
+            self.record(operation, time.perf_counter() -
+                        start, OUTCOME_TIMEOUT)
+            raise
+        except Exception:
+            self.record(operation, time.perf_counter() - start, OUTCOME_ERROR)
+            raise
+        else:
+            self.record(operation, time.perf_counter() - start)
+
+    def merge(self, other):
+        with self.lock, other.lock:
+            self.started_at = min(self.started_at, other.started_at)
+            for operation, operation_metrics in other.operations.items():
+                self.get_operation(operation).merge(operation_metrics)
+            for counter, count in other.counters.items():
+                self.increment(counter, count)
+
+    def summary(self, finished_at=None):
+        with self.lock:
+            duration = (finished_at or time.time()) - self.started_at
+            return {
+                'started_at': self.started_at,
+                'duration': duration,
+                'operations': {operation: self.operations[operation].summary(duration)
+                               for operation in sorted(self.operations)},
+                'counters': dict(sorted(self.counters.items())),
+            }
+
+    def to_dict(self):
+        with self.lock:
+            return {'started_at': self.started_at,
+                    'operations': {k: v.to_dict() for k, v in self.operations.items()},
+                    'counters': dict(self.counters)}
+
+    @classmethod
+    def from_dict(cls, data):
+        run_metrics = cls()
+        run_metrics.started_at = data['started_at']
+        run_metrics.operations = {k: OperationMetrics.from_dict(v)
+                                  for k, v in data['operations'].items()}
+        run_metrics.counters = dict(data.get('counters', {}))
+        return run_metrics
+
+    def write_report(self, report_prefix):
+        summary = self.summary()
+
+        report_dir = os.path.dirname(report_prefix)
+        if report_dir:
+            os.makedirs(report_dir, exist_ok=True)
+
+        with open(f'{report_prefix}.json', 'w') as json_file:
+            json.dump(summary, json_file, indent=2)
+
+        with open(f'{report_prefix}.csv', 'w', newline='') as csv_file:
+            writer = None
+            for operation, operation_summary in summary['operations'].items():
+                row = {'operation': operation, **operation_summary}
+                if writer is None:
+                    writer = csv.DictWriter(csv_file, fieldnames=list(row))
+                    writer.writeheader()
+                writer.writerow(row)
+
+        logging.info(
+            f'Run report written to {report_prefix}.json and {report_prefix}.csv')
+
+        return summary
+
+
+def log_summary(summary):
+    for operation, operation_summary in summary['operations'].items():
+        logging.info(f'{operation}: {operation_summary["count"]} ok, {operation_summary["errors"]} errors, '
+                     f'{operation_summary["timeouts"]} timeouts, {operation_summary["throughput"]:.2f} op/s, '
+                     f'p50 {operation_summary["p50_ms"]:.1f}ms, p99 {operation_summary["p99_ms"]:.1f}ms, '
+                     f'max {operation_summary["max_ms"]:.1f}ms')
+
+    for counter, count in summary.get('counters', {}).items():
+        logging.info(f'{counter}: {count}')
+
+
+_run_metrics = RunMetrics()
+
+
+def get_run_metrics():
+    return _run_metrics
+
+
+def reset_run_metrics():
+    global _run_metrics
+    _run_metrics = RunMetrics()
+    return _run_metrics
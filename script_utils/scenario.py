@@ -0,0 +1,125 @@
+import json
+import os
+
+from script_utils import loadgen
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+try:
+    import tomllib
+except ImportError:
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+
+OPERATIONS = ['game', 'queue-game', 'get-board', 'set-balance']
+
+
+class ScenarioException(Exception):
+    pass
+
+
+class Phase:
+    def __init__(self, name, mix, duration=60.0, concurrency=16, rate=None, profile=None, think_time=0.0):
+        self.name = name
+        self.mix = mix
+        self.duration = duration
+        self.concurrency = concurrency
+        self.rate = rate
+        self.profile = profile
+        self.think_time = think_time
+
+    def get_rate_profile(self):
+        # Phases with a rate or profile are open loop, otherwise every one
+        # of the "concurrency" workers issues operations back to back
+        if self.profile is not None:
+            return loadgen.parse_profile(self.profile)
+        elif self.rate is not None:
+            return loadgen.StepProfile([self.rate], self.duration)
+        return None
+
+
+class Scenario:
+    def __init__(self, name, phases, accounts=None):
+        self.name = name
+        self.phases = phases
+        # Enough idle accounts for every worker of the widest phase to play
+        self.accounts = accounts or 2 * max(phase.concurrency for phase in phases)
+
+
+def parse_phase(index, data):
+    name = data.get('name', f'phase-{index}')
+    mix = data.get('mix')
+    if not isinstance(mix, dict) or not mix:
+        raise ScenarioException(f'Phase "{name}" needs a non-empty "mix" of operation weights')
+
+    for operation, weight in mix.items():
+        if operation not in OPERATIONS:
+            raise ScenarioException(
+                f'Phase "{name}" uses unknown operation "{operation}", expected one of {OPERATIONS}')
+        if not isinstance(weight, (int, float)) or weight < 0:
+            raise ScenarioException(f'Phase "{name}" has invalid weight {weight!r} for "{operation}"')
+    if sum(mix.values()) <= 0:
+        raise ScenarioException(f'Phase "{name}" has no operation with a positive weight')
+
+    try:
+        phase = Phase(name, {operation: float(weight) for operation, weight in mix.items()},
+                      duration=float(data.get('duration', 60.0)),
+                      concurrency=int(data.get('concurrency', 16)),
+                      rate=float(data['rate']) if 'rate' in data else None,
+                      profile=data.get('profile'),
+                      think_time=float(data.get('think_time', 0.0)))
+        phase.get_rate_profile()
+    except (TypeError, ValueError, loadgen.ProfileParseException) as ex:
+        raise ScenarioException(f'Phase "{name}" is invalid: {ex}')
+
+    if phase.concurrency < 1:
+        raise ScenarioException(f'Phase "{name}" needs a concurrency of at least 1')
+
+    return phase
+
+
+def parse_scenario(data, default_name='scenario'):
+    if not isinstance(data, dict) or not data.get('phases'):
+        raise ScenarioException('A scenario needs a non-empty "phases" list')
+
+    phases = [parse_phase(i, phase) for i, phase in enumerate(data['phases'])]
+    try:
+        accounts = int(data['accounts']) if 'accounts' in data else None
+    except (TypeError, ValueError) as ex:
+        raise ScenarioException(f'Invalid "accounts": {ex}')
+
+    return Scenario(data.get('name', default_name), phases, accounts)
+
+
+def load_scenario(scenario_path):
+    extension = os.path.splitext(scenario_path)[1].lower()
+    default_name = os.path.splitext(os.path.basename(scenario_path))[0]
+
+    try:
+        if extension in ('.yaml', '.yml'):
+            if yaml is None:
+                raise ScenarioException('YAML scenarios require the "PyYAML" package')
+            with open(scenario_path) as scenario_file:
+                data = yaml.safe_load(scenario_file)
+        elif extension == '.toml':
+            if tomllib is None:
+                raise ScenarioException('TOML scenarios require Python 3.11 or the "tomli" package')
+            with open(scenario_path, 'rb') as scenario_file:
+                data = tomllib.load(scenario_file)
+        elif extension == '.json':
+            with open(scenario_path) as scenario_file:
+                data = json.load(scenario_file)
+        else:
+            raise ScenarioException(f'Unknown scenario format "{extension}", use .yaml, .toml or .json')
+    except ScenarioException:
+        raise
+    except Exception as ex:
+        raise ScenarioException(f'Could not read scenario "{scenario_path}": {ex}')
+
+    return parse_scenario(data, default_name)
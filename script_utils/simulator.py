@@ -0,0 +1,696 @@
+#!/usr/bin/python3
+
+import argparse
+import asyncio
+import collections
+import hashlib
+import http.server
+import json
+import logging
+import os
+import random
+import resource
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+
+import script_utils as scu
+from script_utils import distributed, metrics, transport
+from script_utils.board_bench import generate_board_string
+from script_utils.chain_monitor import TIMESTAMP_NOW_KEY
+from script_utils.funding import hash_extrinsic_hex
+
+
+FAKE_MRENCLAVE = 'S1mu1atedWorkerMrenc1ave111111111111111111111'
+FAKE_CLI_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_cli.py')
+
+DEFAULT_SIM_CONFIG = 'latency=0.05,jitter=0.02'
+DEFAULT_CLI_ADDRESS = '127.0.0.1:7879'
+DEFAULT_NODE_ADDRESS = '127.0.0.1:9933'
+
+# Options of the CLI taking a value before the subcommand
+CLI_OPTIONS_WITH_VALUE = {'-p', '-P', '-u', '-U'}
+
+SIMULATED_OPERATIONS = ['list-workers', 'queue-game', 'get-board', 'drop-bomb', 'drop-stone', 'set-balance', 'balance']
+
+FAULT_FAILURE = 'failure'
+FAULT_HANG = 'hang'
+
+
+class SimulatorException(Exception):
+    pass
+
+
+class SimulatorConfig:
+    def __init__(self, latency=0.0, jitter=0.0, failure_rate=0.0, hang_rate=0.0, hang_time=3600.0,
+                 operation_latency=None, seed=None, capacity=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.hang_rate = hang_rate
+        self.hang_time = hang_time
+        self.operation_latency = operation_latency or {}
+        self.seed = seed
+        # Calls served at once, the others queue and see their latency grow
+        self.capacity = capacity
+
+    def draw(self, operation, rng):
+        latency = self.operation_latency.get(operation, self.latency)
+        delay = max(0.0, latency + rng.uniform(-self.jitter, self.jitter)) if self.jitter else latency
+
+        draw = rng.random()
+        if draw < self.hang_rate:
+            return delay, FAULT_HANG
+        elif draw < self.hang_rate + self.failure_rate:
+            return delay, FAULT_FAILURE
+        return delay, None
+
+
+def parse_sim_config(spec):
+    # e.g. "latency=0.05,jitter=0.02,failure=0.01,hang=0.001,capacity=64,get-board=0.01"
+    fields = {'latency': 'latency', 'jitter': 'jitter', 'failure': 'failure_rate',
+              'hang': 'hang_rate', 'hang-time': 'hang_time'}
+    options = {}
+    operation_latency = {}
+
+    for item in filter(None, (item.strip() for item in spec.split(','))):
+        key, _, value = item.partition('=')
+        try:
+            if key in ('seed', 'capacity'):
+                options[key] = int(value)
+            elif key in fields:
+                options[fields[key]] = float(value)
+            elif key in SIMULATED_OPERATIONS:
+                operation_latency[key] = float(value)
+            else:
+                raise SimulatorException(
+                    f'Unknown simulator option "{key}", expected one of {sorted(fields) + ["seed", "capacity"] + SIMULATED_OPERATIONS}')
+        except ValueError:
+            raise SimulatorException(f'Invalid value "{value}" for simulator option "{key}"')
+
+    return SimulatorConfig(operation_latency=operation_latency, **options)
+
+
+def parse_cli_argv(argv):
+    # Mirrors the argument layout of scu.get_base_cli_cmd and
+    # scu.get_trusted_cli_subcommand
+    i = 0
+    while i < len(argv) and argv[i] in CLI_OPTIONS_WITH_VALUE:
+        i += 2
+    command = list(argv[i:])
+    if not command:
+        raise SimulatorException('No subcommand given')
+
+    if command[0] != 'trusted':
+        return command[0], command[1] if len(command) > 1 else None, command[2:]
+
+    signer = None
+    i = 1
+    while i < len(command) and command[i].startswith('--'):
+        if command[i] == '--xt-signer' and i + 1 < len(command):
+            signer = command[i + 1]
+        i += 2 if command[i] in ('--xt-signer', '--mrenclave') else 1
+    if i >= len(command):
+        raise SimulatorException('No trusted subcommand given')
+
+    # The account is repeated after the trusted subcommand
+    operation, rest = command[i], command[i + 1:]
+    return operation, rest[0] if rest else signer, rest[1:]
+
+
+def render_board(board, players):
+    rows = ', '.join('[' + ', '.join(row) + ']' for row in board.board_matrix)
+    return f'BoardState {{ board: [{rows}], players: [{", ".join(players)}] }}\n'
+
+
+class SimulatedGame:
+    def __init__(self, board, players):
+        self.board = board
+        self.players = players
+
+
+class GameSimulator:
+    # Game state of a worker as seen through the CLI. Queued players are
+    # paired in arrival order and share one board until they queue again.
+    # With a node simulator "queue-game" submits an extrinsic to it.
+    def __init__(self, seed=None, node=None):
+        self.rng = random.Random(seed)
+        self.node = node
+        self.lock = threading.Lock()
+        self.waiting = None
+        self.games = {}
+        self.balances = {}
+        self.games_created = 0
+        self.handlers = {
+            'list-workers': self._list_workers,
+            'queue-game': self._queue_game,
+            'get-board': self._get_board,
+            'drop-bomb': self._drop_bomb,
+            'drop-stone': self._drop_stone,
+            'set-balance': self._set_balance,
+            'balance': self._balance,
+        }
+
+    def handle(self, operation, signer, args=()):
+        if (handler := self.handlers.get(operation)) is None:
+            return 1, f'error: unrecognized subcommand "{operation}"\n'
+
+        with self.lock:
+            try:
+                return handler(signer, [str(arg) for arg in args])
+            except (ValueError, IndexError) as ex:
+                return 1, f'error: invalid arguments for "{operation}": {ex}\n'
+
+    def _new_board(self):
+        # Only boards on which both players can place their bombs and stones,
+        # like the boards the worker hands out
+        while True:
+            board = scu.BoardParser(generate_board_string(self.rng))
+            planner = board.copy()
+            planner.compute_bomb_orders(update_matrix=True)
+            stone_orders = planner.compute_stone_orders('1', '2', update_matrix=True)
+            if all(len(orders) == 4 for orders in stone_orders.values()):
+                return board
+
+    def _list_workers(self, signer, args):
+        return 0, (f'number of workers registered: 1\nEnclave 1\n   AccountId: {FAKE_MRENCLAVE}\n'
+                   f'   MRENCLAVE: {FAKE_MRENCLAVE}\n   URL: wss://127.0.0.1:2011\n')
+
+    def _queue_game(self, signer, args):
+        self.games.pop(signer, None)
+        if self.waiting is None or self.waiting == signer:
+            self.waiting = signer
+        else:
+            game = SimulatedGame(self._new_board(), [self.waiting, signer])
+            self.games[self.waiting] = self.games[signer] = game
+            self.waiting = None
+            self.games_created += 1
+
+        if self.node is None:
+            return 0, f'0x{self.rng.getrandbits(256):064x}\n'
+        extrinsic = '0x' + f'queue-game {signer} {self.rng.getrandbits(64)}'.encode('utf-8').hex()
+        return 0, f'{self.node.handle("author_submitExtrinsic", [extrinsic])}\n'
+
+    def _get_board(self, signer, args):
+        if (game := self.games.get(signer)) is None:
+            return 0, f'could not fetch board for {signer}\n'
+        return 0, render_board(game.board, game.players)
+
+    def _drop_bomb(self, signer, args):
+        if (game := self.games.get(signer)) is None:
+            return 1, f'error: {signer} is not playing\n'
+        col, row = int(args[0]), int(args[1])
+        if not (0 <= row < scu.BoardParser.SIZE and 0 <= col < scu.BoardParser.SIZE):
+            return 1, f'error: ({col}, {row}) is off the board\n'
+        game.board.apply_bomb(row, col)
+        return 0, ''
+
+    def _drop_stone(self, signer, args):
+        if (game := self.games.get(signer)) is None:
+            return 1, f'error: {signer} is not playing\n'
+        if not game.board.apply_stone(args[0], int(args[1])):
+            return 1, f'error: no room for a stone at {args[0]} {args[1]}\n'
+        return 0, ''
+
+    def _set_balance(self, signer, args):
+        self.balances[signer] = int(args[0])
+        return 0, ''
+
+    def _balance(self, signer, args):
+        return 0, f'{self.balances.get(signer, 0)}\n'
+
+
+class SimulatedTransport:
+    name = 'sim'
+
+    def __init__(self, simulator, config):
+        self.simulator = simulator
+        self.config = config
+        self.mrenclave = FAKE_MRENCLAVE
+        self.rng = random.Random(config.seed)
+        self.capacity = None
+
+    def get_capacity(self):
+        # Semaphores belong to an event loop and runs start several of them
+        loop = asyncio.get_running_loop()
+        if self.capacity is None or self.capacity[0] is not loop:
+            self.capacity = loop, asyncio.Semaphore(self.config.capacity)
+        return self.capacity[1]
+
+    async def serve(self, operation, signer, args, delay, fault):
+        await asyncio.sleep(delay)
+        if fault == FAULT_FAILURE:
+            return 1, 'error: simulated failure\n'
+        return self.simulator.handle(operation, signer, args)
+
+    async def execute(self, operation, signer, args=(), stdout=subprocess.PIPE, timeout=60.0, affinity=None, metric=None):
+        args = [str(arg) for arg in args]
+        with metrics.get_run_metrics().measure(metric or operation, timeout_exceptions=(subprocess.TimeoutExpired,)):
+            delay, fault = self.config.draw(operation, self.rng)
+            if fault == FAULT_HANG:
+                await asyncio.sleep(timeout)
+                raise subprocess.TimeoutExpired(operation, timeout)
+
+            try:
+                if self.config.capacity is None:
+                    returncode, output = await self.serve(operation, signer, args, delay, fault)
+                else:
+                    async with self.get_capacity():
+                        returncode, output = await asyncio.wait_for(
+                            self.serve(operation, signer, args, delay, fault), timeout)
+            except asyncio.TimeoutError:
+                raise subprocess.TimeoutExpired(operation, timeout)
+
+            if returncode != 0:
+                raise subprocess.CalledProcessError(
+                    cmd=' '.join([operation, str(signer), *args]), returncode=returncode, output=output)
+
+        transport.write_output(stdout, output)
+        # Like the CLI transport, output is only captured when piped
+        return output if stdout == subprocess.PIPE else None
+
+    def close(self):
+        pass
+
+
+class SimulatedBackend:
+    # Applies the simulated latency, faults and capacity on the threads of the
+    # servers standing in for the CLI and the worker RPC
+    def __init__(self, simulator, config):
+        self.simulator = simulator
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.rng_lock = threading.Lock()
+        self.capacity = threading.BoundedSemaphore(config.capacity) if config.capacity is not None else None
+
+    def run(self, operation, signer, args):
+        with self.rng_lock:
+            delay, fault = self.config.draw(operation, self.rng)
+
+        if fault == FAULT_HANG:
+            time.sleep(self.config.hang_time)
+        if self.capacity is None:
+            return self.serve(operation, signer, args, delay, fault)
+        with self.capacity:
+            return self.serve(operation, signer, args, delay, fault)
+
+    def serve(self, operation, signer, args, delay, fault):
+        time.sleep(delay)
+        if fault == FAULT_FAILURE:
+            return 1, 'error: simulated failure\n'
+        return self.simulator.handle(operation, signer, args)
+
+
+class CliRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            returncode, output = self.server.backend.run(*parse_cli_argv(request['argv']))
+        except (ValueError, KeyError, SimulatorException) as ex:
+            returncode, output = 2, f'error: {ex}\n'
+
+        try:
+            self.wfile.write(json.dumps({'returncode': returncode, 'output': output}).encode('utf-8') + b'\n')
+        except OSError:
+            pass
+
+
+class CliServer(socketserver.ThreadingTCPServer):
+    # Answers the fake CLI, one connection per forked CLI process
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 1024
+
+    def __init__(self, address, backend):
+        super().__init__(address, CliRequestHandler)
+        self.backend = backend
+
+
+class WorkerRpcServer:
+    # Worker direct RPC over websockets speaking the plain JSON stand-in codec
+    # of the transport. Watched calls go through the statuses of a trusted
+    # operation before their final one, like they do on the worker.
+    def __init__(self, address, backend):
+        try:
+            from websockets.sync.server import serve as serve_websockets
+        except ImportError:
+            raise SimulatorException('The worker RPC simulator needs the "websockets" package')
+
+        self.backend = backend
+        host, port = distributed.parse_address(address, 2011)
+        self.server = serve_websockets(self.handle_connection, host, port, compression=None)
+
+    def handle_connection(self, connection):
+        for message in connection:
+            try:
+                request = json.loads(message)
+                operation = request['params'][0]
+                returncode, output = self.backend.run(operation['operation'], operation['signer'], operation['args'])
+            except (ValueError, KeyError, IndexError, TypeError, SimulatorException) as ex:
+                connection.send(json.dumps({'jsonrpc': '2.0', 'error': {'code': -32602, 'message': str(ex)},
+                                            'id': request.get('id') if isinstance(request, dict) else None}))
+                continue
+
+            if request['method'] == 'state_executeGetter':
+                updates = []
+            else:
+                updates = [('Submitted', f'0x{random.getrandbits(256):064x}'), ('Ready', None)]
+            if returncode == 0:
+                updates.append(('InSidechainBlock', output))
+            else:
+                updates.append(('Invalid', output))
+
+            for i, (status, value) in enumerate(updates):
+                connection.send(json.dumps({'jsonrpc': '2.0', 'id': request['id'], 'result': {
+                    'value': value, 'status': status, 'do_watch': i < len(updates) - 1}}))
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def shutdown(self):
+        self.server.shutdown()
+
+
+class NodeRpcError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+class NodeSimulator:
+    # Just enough of the node RPC to submit raw extrinsics and watch them
+    # being included, block by block. Nothing is decoded or executed.
+    def __init__(self, block_time=6.0, max_block_extrinsics=None, history=4096):
+        self.block_time = block_time
+        self.max_block_extrinsics = max_block_extrinsics
+        self.lock = threading.Lock()
+        self.pending = []
+        self.submitted = 0
+        self.blocks = {}
+        self.block_numbers = collections.deque(maxlen=history)
+        self.stopping = threading.Event()
+        self.thread = None
+        self.methods = {
+            'system_health': lambda params: {'peers': 0, 'isSyncing': False, 'shouldHavePeers': False},
+            'system_chain': lambda params: 'Simulated',
+            'chain_getHeader': self._get_header,
+            'chain_getBlockHash': self._get_block_hash,
+            'chain_getFinalizedHead': lambda params: self._latest()['hash'],
+            'chain_getBlock': self._get_block,
+            'state_getStorage': self._get_storage,
+            'author_submitExtrinsic': self._submit_extrinsic,
+            # Extrinsics are not decoded, so all of them are taken to be
+            # signed by the one account funding the others
+            'system_accountNextIndex': lambda params: self.submitted,
+        }
+        self._add_block([])
+
+    def _latest(self):
+        return self.blocks[self.block_numbers[-1]]
+
+    def _add_block(self, extrinsics):
+        number = self.block_numbers[-1] + 1 if self.block_numbers else 0
+        parent_hash = self.blocks[number - 1]['hash'] if number else '0x' + '00' * 32
+        block_hash = '0x' + hashlib.blake2b(f'{parent_hash}{number}{extrinsics}'.encode('ascii'),
+                                            digest_size=32).hexdigest()
+
+        if len(self.block_numbers) == self.block_numbers.maxlen:
+            del self.blocks[self.block_numbers[0]]
+        self.block_numbers.append(number)
+        self.blocks[number] = {'number': number, 'hash': block_hash, 'parent_hash': parent_hash,
+                               'timestamp': int(time.time() * 1000), 'extrinsics': extrinsics}
+
+    def produce_block(self):
+        with self.lock:
+            included = self.pending[:self.max_block_extrinsics]
+            del self.pending[:len(included)]
+            self._add_block(included)
+
+    def _produce_blocks(self):
+        while not self.stopping.wait(self.block_time):
+            self.produce_block()
+
+    def start(self):
+        self.thread = threading.Thread(
+            target=self._produce_blocks, name='node-simulator', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def _find_block(self, block_hash):
+        if block_hash is None:
+            return self._latest()
+        for number in reversed(self.block_numbers):
+            if self.blocks[number]['hash'] == block_hash:
+                return self.blocks[number]
+        return None
+
+    @staticmethod
+    def _header(block):
+        return {'number': hex(block['number']), 'parentHash': block['parent_hash'],
+                'stateRoot': block['hash'], 'extrinsicsRoot': block['hash'], 'digest': {'logs': []}}
+
+    def _get_header(self, params):
+        block = self._find_block(params[0] if params else None)
+        return self._header(block) if block is not None else None
+
+    def _get_block_hash(self, params):
+        if not params or params[0] is None:
+            return self._latest()['hash']
+        block = self.blocks.get(int(params[0]))
+        return block['hash'] if block is not None else None
+
+    def _get_block(self, params):
+        if (block := self._find_block(params[0] if params else None)) is None:
+            return None
+        return {'block': {'header': self._header(block), 'extrinsics': block['extrinsics']},
+                'justifications': None}
+
+    def _get_storage(self, params):
+        if params[0] != TIMESTAMP_NOW_KEY:
+            return None
+        if (block := self._find_block(params[1] if len(params) > 1 else None)) is None:
+            return None
+        return '0x' + block['timestamp'].to_bytes(8, 'little').hex()
+
+    def _submit_extrinsic(self, params):
+        try:
+            extrinsic_hash = hash_extrinsic_hex(params[0])
+        except (ValueError, IndexError, AttributeError):
+            raise NodeRpcError(1002, 'Invalid extrinsic')
+        self.pending.append(params[0])
+        self.submitted += 1
+        return extrinsic_hash
+
+    def handle(self, method, params):
+        if (handler := self.methods.get(method)) is None:
+            raise NodeRpcError(-32601, f'Method not found: {method}')
+        with self.lock:
+            return handler(params or [])
+
+
+class NodeRpcHandler(http.server.BaseHTTPRequestHandler):
+    def do_POST(self):
+        request_id = None
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            request_id = request.get('id')
+            response = {'jsonrpc': '2.0', 'id': request_id,
+                        'result': self.server.node.handle(request['method'], request.get('params'))}
+        except NodeRpcError as ex:
+            response = {'jsonrpc': '2.0', 'id': request_id, 'error': {'code': ex.code, 'message': str(ex)}}
+        except (ValueError, KeyError, TypeError) as ex:
+            response = {'jsonrpc': '2.0', 'id': request_id, 'error': {'code': -32700, 'message': str(ex)}}
+
+        body = json.dumps(response).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug(f'Node simulator: {format % args}')
+
+
+class NodeRpcServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, node):
+        super().__init__(address, NodeRpcHandler)
+        self.node = node
+
+
+def serve(cli_address, node_address, config, block_time, worker_address=None):
+    node = node_server = None
+    if node_address is not None:
+        node = NodeSimulator(block_time)
+        node.start()
+        node_server = NodeRpcServer(distributed.parse_address(node_address, 9933), node)
+        threading.Thread(target=node_server.serve_forever, name='node-rpc', daemon=True).start()
+        logging.info(f'Node RPC simulator listening on http://{node_address}, one block every {block_time:g}s')
+
+    simulator = GameSimulator(config.seed, node)
+    backend = SimulatedBackend(simulator, config)
+    cli_server = CliServer(distributed.parse_address(cli_address, 7879), backend)
+    threading.Thread(target=cli_server.serve_forever, name='cli-simulator', daemon=True).start()
+    logging.info(f'Fake integritee-cli backend listening on {cli_address}, '
+                 f'run "{FAKE_CLI_PATH}" with FAKE_CLI_ADDRESS={cli_address}')
+
+    worker_server = None
+    if worker_address is not None:
+        worker_server = WorkerRpcServer(worker_address, backend)
+        threading.Thread(target=worker_server.serve_forever, name='worker-rpc', daemon=True).start()
+        logging.info(f'Worker RPC simulator listening on ws://{worker_address}')
+
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        cli_server.shutdown()
+        if worker_server is not None:
+            worker_server.shutdown()
+        if node is not None:
+            node_server.shutdown()
+            node.stop()
+        logging.info(f'{simulator.games_created} game/s simulated')
+
+
+def get_free_address():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return f'127.0.0.1:{probe.getsockname()[1]}'
+
+
+def start_cli_backend(sim_config):
+    # A process of its own so the backend does not share the GIL with the
+    # tester being measured
+    address = get_free_address()
+    backend = subprocess.Popen([sys.executable, '-m', 'script_utils.simulator', 'serve', '--cli-address', address,
+                                '--no-node', '--sim-config', sim_config],
+                               cwd=os.path.dirname(os.path.dirname(FAKE_CLI_PATH)))
+
+    host, port = distributed.parse_address(address)
+    deadline = time.monotonic() + 30.0
+    while True:
+        try:
+            socket.create_connection((host, port)).close()
+            return backend, address
+        except OSError:
+            if time.monotonic() > deadline or backend.poll() is not None:
+                backend.kill()
+                raise SimulatorException('Fake integritee-cli backend did not start')
+            time.sleep(0.1)
+
+
+def get_cpu_time():
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+
+async def run_bench(cli_transport, operation, concurrency, duration):
+    players = [f'//Bench_{i}' for i in range(concurrency * 2)]
+    args = [1_000_000] if operation == 'set-balance' else []
+    for player in players:
+        await cli_transport.execute('queue-game', player)
+    metrics.reset_run_metrics()
+
+    async def issue_back_to_back(player, deadline):
+        while time.monotonic() < deadline:
+            try:
+                await cli_transport.execute(operation, player, args)
+            except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
+                pass
+
+    cpu_start = get_cpu_time()
+    start = time.monotonic()
+    await asyncio.gather(*[issue_back_to_back(player, start + duration) for player in players[:concurrency]])
+
+    return time.monotonic() - start, get_cpu_time() - cpu_start
+
+
+def bench(transport_name, operation, concurrency, duration, sim_config):
+    config = parse_sim_config(sim_config)
+    backend = None
+    if transport_name == SimulatedTransport.name:
+        cli_transport = SimulatedTransport(GameSimulator(config.seed), config)
+    else:
+        backend, address = start_cli_backend(sim_config)
+        os.environ['FAKE_CLI_ADDRESS'] = address
+        cli_transport = transport.CliTransport(FAKE_CLI_PATH, FAKE_MRENCLAVE)
+        scu.raise_open_files_limit()
+
+    logging.info(f'Issuing "{operation}" back to back from {concurrency} task/s over the '
+                 f'"{transport_name}" transport for {duration:g}s...')
+    try:
+        elapsed, cpu_time = asyncio.run(run_bench(cli_transport, operation, concurrency, duration))
+    finally:
+        cli_transport.close()
+        if backend is not None:
+            backend.terminate()
+            backend.wait()
+
+    summary = metrics.get_run_metrics().summary()['operations'].get(operation)
+    if summary is None or not summary['count']:
+        logging.error(f'No "{operation}" succeeded')
+        return None
+
+    rate = summary['count'] / elapsed
+    logging.info(f'{summary["count"]} "{operation}" in {elapsed:.1f}s: {rate:.1f} op/s, '
+                 f'p50 {summary["p50_ms"]:.2f}ms, p99 {summary["p99_ms"]:.2f}ms, '
+                 f'{cpu_time / summary["count"] * 1000:.3f}ms of tester CPU per operation')
+    logging.info(f'Runs approaching {rate:.0f} op/s at this concurrency are bound by the tester, not the system under test')
+    return rate
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=['serve', 'bench'],
+                        help='Serve the fake CLI backend and node RPC, or measure the maximum operation rate of the tester')
+    parser.add_argument('--sim-config', required=False,
+                        help=f'Simulated latency, jitter, failure and hang rates, e.g. "{DEFAULT_SIM_CONFIG},failure=0.01,get-board=0.01", '
+                        f'defaults to "{DEFAULT_SIM_CONFIG}" for "serve" and "latency=0" for "bench"', type=str)
+    parser.add_argument('--cli-address', required=False, default=DEFAULT_CLI_ADDRESS,
+                        help=f'Address the fake CLI backend listens on, defaults to "{DEFAULT_CLI_ADDRESS}"', type=str)
+    parser.add_argument('--node-address', required=False, default=DEFAULT_NODE_ADDRESS,
+                        help=f'Address the node JSON-RPC over HTTP listens on, defaults to "{DEFAULT_NODE_ADDRESS}"', type=str)
+    parser.add_argument('--worker-address', required=False,
+                        help='Also serve the worker direct RPC over websockets on this address, e.g. "127.0.0.1:2011"', type=str)
+    parser.add_argument('--no-node', required=False,
+                        help='Do not serve the node RPC', action='store_true')
+    parser.add_argument('--block-time', required=False, default=6.0,
+                        help='Seconds between simulated blocks, defaults to 6', type=float)
+    parser.add_argument('--transport', required=False, default=SimulatedTransport.name,
+                        choices=[SimulatedTransport.name, transport.CliTransport.name],
+                        help='Benchmark the in-process simulator or forking the fake CLI, defaults to "sim"', type=str)
+    parser.add_argument('--operation', required=False, default='get-board', choices=['get-board', 'set-balance', 'queue-game'],
+                        help='Operation issued by the benchmark, defaults to "get-board"', type=str)
+    parser.add_argument('--concurrency', required=False, default=64,
+                        help='Operations kept in flight by the benchmark, defaults to 64', type=int)
+    parser.add_argument('--duration', required=False, default=10.0,
+                        help='Seconds the benchmark runs, defaults to 10', type=float)
+    parser.add_argument('--verbose', required=False,
+                        help='Show additional logging messages', action='store_true')
+
+    args = parser.parse_args()
+
+    scu.setup_logging(verbose=args.verbose)
+
+    try:
+        if args.command == 'serve':
+            serve(args.cli_address, None if args.no_node else args.node_address,
+                  parse_sim_config(args.sim_config or DEFAULT_SIM_CONFIG), args.block_time, args.worker_address)
+        elif bench(args.transport, args.operation, args.concurrency, args.duration,
+                   args.sim_config or 'latency=0') is None:
+            sys.exit(1)
+    except SimulatorException as ex:
+        logging.error(str(ex))
+        sys.exit(1)
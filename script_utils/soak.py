@@ -0,0 +1,157 @@
+import csv
+import json
+import logging
+import os
+import time
+
+from script_utils import metrics
+
+
+CHECKPOINT_VERSION = 1
+
+TREND_FIELDS = ['bucket', 'started_at', 'duration', 'operation', 'count', 'errors', 'timeouts', 'throughput',
+                'mean_ms', 'p50_ms', 'p90_ms', 'p99_ms', 'max_ms']
+
+# A bucket whose p99 grew or throughput shrank by more than this relative to
+# the first bucket counts as degraded
+DEGRADATION_THRESHOLD = 0.5
+
+# Operations with fewer samples in a bucket are too noisy to compare
+MIN_TREND_COUNT = 20
+
+
+class SoakException(Exception):
+    pass
+
+
+class SoakRun:
+    def __init__(self, duration, games, report_prefix, checkpoint_path, bucket_length=300.0):
+        self.duration = duration
+        self.games = games
+        self.report_prefix = report_prefix
+        self.checkpoint_path = checkpoint_path
+        self.bucket_length = bucket_length
+
+        self.elapsed_before = 0.0
+        self.resumed_at = time.monotonic()
+        self.bucket = 0
+        self.baseline = None
+        self.games_finished = 0
+        self.games_failed = 0
+
+    @property
+    def trends_path(self):
+        return f'{self.report_prefix}-trends.csv'
+
+    @property
+    def elapsed(self):
+        return self.elapsed_before + time.monotonic() - self.resumed_at
+
+    @property
+    def remaining(self):
+        return max(self.duration - self.elapsed, 0.0)
+
+    def add_game(self, finished):
+        if finished:
+            self.games_finished += 1
+        else:
+            self.games_failed += 1
+
+    def close_bucket(self, window):
+        if window is None:
+            return
+
+        summary = window.summary()
+        rows = [{'bucket': self.bucket, 'started_at': window.started_at, 'duration': summary['duration'],
+                 'operation': operation, **operation_summary}
+                for operation, operation_summary in summary['operations'].items()]
+        # Counters such as finished games become rows of their own
+        rows.extend({'bucket': self.bucket, 'started_at': window.started_at, 'duration': summary['duration'],
+                     'operation': f'#{counter}', 'count': count,
+                     'throughput': count / summary['duration'] if summary['duration'] > 0 else 0.0}
+                    for counter, count in summary['counters'].items())
+
+        write_header = not os.path.exists(self.trends_path)
+        with open(self.trends_path, 'a', newline='') as trends_file:
+            writer = csv.DictWriter(trends_file, fieldnames=TREND_FIELDS, extrasaction='ignore')
+            if write_header:
+                writer.writeheader()
+            writer.writerows(rows)
+
+        self.compare_bucket(summary['operations'])
+        self.bucket += 1
+
+    def compare_bucket(self, operations):
+        # Only the first bucket is kept to compare against, so memory does
+        # not grow with the length of the run
+        comparable = {operation: {'p99_ms': s['p99_ms'], 'throughput': s['throughput']}
+                      for operation, s in operations.items() if s['count'] >= MIN_TREND_COUNT}
+        if self.baseline is None:
+            if comparable:
+                self.baseline = comparable
+            return
+
+        for operation, first in self.baseline.items():
+            if (current := comparable.get(operation)) is None:
+                continue
+
+            if current['p99_ms'] > first['p99_ms'] * (1 + DEGRADATION_THRESHOLD):
+                logging.warning(f'Bucket {self.bucket}: {operation} p99 {current["p99_ms"]:.1f}ms, '
+                                f'{first["p99_ms"]:.1f}ms in the first bucket')
+                metrics.get_run_metrics().increment('degraded-buckets')
+            elif current['throughput'] < first['throughput'] * (1 - DEGRADATION_THRESHOLD):
+                logging.warning(f'Bucket {self.bucket}: {operation} at {current["throughput"]:.2f} op/s, '
+                                f'{first["throughput"]:.2f} op/s in the first bucket')
+                metrics.get_run_metrics().increment('degraded-buckets')
+
+    def write_checkpoint(self, run_metrics, finished=False):
+        checkpoint = {
+            'version': CHECKPOINT_VERSION,
+            'finished': finished,
+            'duration': self.duration,
+            'games': self.games,
+            'report_prefix': self.report_prefix,
+            'bucket_length': self.bucket_length,
+            'elapsed': self.elapsed,
+            'bucket': self.bucket,
+            'baseline': self.baseline,
+            'games_finished': self.games_finished,
+            'games_failed': self.games_failed,
+            'metrics': run_metrics.to_dict(),
+        }
+
+        checkpoint_dir = os.path.dirname(self.checkpoint_path)
+        if checkpoint_dir:
+            os.makedirs(checkpoint_dir, exist_ok=True)
+
+        # Never leave a half written checkpoint behind if the run dies here
+        temporary_path = f'{self.checkpoint_path}.tmp'
+        with open(temporary_path, 'w') as checkpoint_file:
+            json.dump(checkpoint, checkpoint_file)
+        os.replace(temporary_path, self.checkpoint_path)
+        logging.debug(f'Soak checkpoint written to {self.checkpoint_path}')
+
+    @classmethod
+    def resume(cls, checkpoint_path):
+        try:
+            with open(checkpoint_path) as checkpoint_file:
+                checkpoint = json.load(checkpoint_file)
+        except (OSError, ValueError) as ex:
+            raise SoakException(f'Could not read checkpoint "{checkpoint_path}": {ex}')
+
+        if checkpoint.get('version') != CHECKPOINT_VERSION:
+            raise SoakException(f'Checkpoint "{checkpoint_path}" has unsupported version {checkpoint.get("version")}')
+        if checkpoint['finished']:
+            raise SoakException(f'The soak run of "{checkpoint_path}" already finished')
+
+        soak_run = cls(checkpoint['duration'], checkpoint['games'], checkpoint['report_prefix'], checkpoint_path,
+                       checkpoint['bucket_length'])
+        soak_run.elapsed_before = checkpoint['elapsed']
+        soak_run.bucket = checkpoint['bucket']
+        soak_run.baseline = checkpoint['baseline']
+        soak_run.games_finished = checkpoint['games_finished']
+        soak_run.games_failed = checkpoint['games_failed']
+
+        logging.info(f'Resuming soak run after {soak_run.elapsed_before:.0f}s of {soak_run.duration:.0f}s, '
+                     f'{soak_run.games_finished} game/s finished so far')
+        return soak_run, metrics.RunMetrics.from_dict(checkpoint['metrics'])
@@ -0,0 +1,432 @@
+#!/usr/bin/python3
+
+import argparse
+import csv
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import script_utils as scu
+from script_utils import metrics, tracing
+
+
+DEFAULT_NODE_METRICS_URL = 'http://127.0.0.1:9615/metrics'
+DEFAULT_TELEMETRY_INTERVAL = 5.0
+
+# Node series worth following during a run, histogram buckets are left out
+DEFAULT_PROMETHEUS_PREFIXES = ['substrate_block_height', 'substrate_ready_transactions_number',
+                               'substrate_sub_txpool', 'substrate_proposer', 'substrate_tasks_',
+                               'substrate_database_cache', 'process_']
+
+SAMPLE_FIELDS = ['time', 'offset', 'source', 'metric', 'value']
+
+# Counters, by the Prometheus convention, end in "_total" and are also
+# reported as a rate between samples
+COUNTER_SUFFIX = '_total'
+RATE_SUFFIX = '_per_second'
+
+_PROMETHEUS_SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{[^}]*\})?\s+(\S+)')
+
+
+def read_file(path):
+    with open(path) as source_file:
+        return source_file.read()
+
+
+class ProcessTreeSampler:
+    # CPU, memory, file descriptors and context switches of a process and all
+    # of its descendants, such as the forked CLI processes, from /proc
+    def __init__(self, root_pid=None, proc_root='/proc', clock_ticks=None, page_size=None):
+        self.root_pid = root_pid or os.getpid()
+        self.proc_root = proc_root
+        self.clock_ticks = clock_ticks or os.sysconf('SC_CLK_TCK')
+        self.page_size = page_size or os.sysconf('SC_PAGE_SIZE')
+        self.source = 'tester'
+
+    def read_stat(self, pid):
+        stat = read_file(os.path.join(self.proc_root, str(pid), 'stat'))
+        # The command name may contain spaces and parentheses itself
+        fields = stat[stat.rindex(')') + 2:].split()
+        return {'ppid': int(fields[1]), 'utime': int(fields[11]), 'stime': int(fields[12]),
+                'cutime': int(fields[13]), 'cstime': int(fields[14]), 'rss': int(fields[21])}
+
+    def read_context_switches(self, pid):
+        switches = {}
+        for line in read_file(os.path.join(self.proc_root, str(pid), 'status')).splitlines():
+            key, _, value = line.partition(':')
+            if key in ('voluntary_ctxt_switches', 'nonvoluntary_ctxt_switches'):
+                switches[key] = int(value)
+        return switches
+
+    def count_fds(self, pid):
+        try:
+            return len(os.listdir(os.path.join(self.proc_root, str(pid), 'fd')))
+        except OSError:
+            return 0
+
+    def sample(self):
+        stats = {}
+        for entry in os.listdir(self.proc_root):
+            if not entry.isdigit():
+                continue
+            try:
+                stats[int(entry)] = self.read_stat(entry)
+            except (OSError, ValueError, IndexError):
+                # Processes come and go while /proc is walked
+                continue
+
+        if self.root_pid not in stats:
+            raise FileNotFoundError(f'process {self.root_pid} not found in {self.proc_root}')
+
+        children = {}
+        for pid, stat in stats.items():
+            children.setdefault(stat['ppid'], []).append(pid)
+        tree = [self.root_pid]
+        for pid in tree:
+            tree.extend(children.get(pid, []))
+
+        # Children already reaped are accounted to the root's cutime/cstime
+        root = stats[self.root_pid]
+        ticks = root['cutime'] + root['cstime']
+        sample = {'processes': len(tree), 'rss_bytes': 0, 'open_fds': 0,
+                  'voluntary_ctxt_switches_total': 0, 'nonvoluntary_ctxt_switches_total': 0}
+        for pid in tree:
+            ticks += stats[pid]['utime'] + stats[pid]['stime']
+            sample['rss_bytes'] += stats[pid]['rss'] * self.page_size
+            sample['open_fds'] += self.count_fds(pid)
+            try:
+                for key, value in self.read_context_switches(pid).items():
+                    sample[f'{key}_total'] += value
+            except OSError:
+                continue
+        sample['cpu_seconds_total'] = ticks / self.clock_ticks
+
+        return {self.source: sample}
+
+
+def parse_prometheus(text, prefixes=None):
+    samples = {}
+    for line in text.splitlines():
+        if not line or line.startswith('#') or not (match := _PROMETHEUS_SAMPLE.match(line)):
+            continue
+
+        name, labels, value = match.groups()
+        if name.endswith('_bucket') or (prefixes and not name.startswith(tuple(prefixes))):
+            continue
+        try:
+            samples[f'{name}{labels or ""}'] = float(value)
+        except ValueError:
+            continue
+
+    return samples
+
+
+class PrometheusSampler:
+    # Also reads "file://" URLs, e.g. a saved scrape
+    def __init__(self, url=DEFAULT_NODE_METRICS_URL, prefixes=DEFAULT_PROMETHEUS_PREFIXES, timeout=2.0, source='node'):
+        self.url = url
+        self.prefixes = prefixes
+        self.timeout = timeout
+        self.source = source
+
+    def sample(self):
+        with urllib.request.urlopen(self.url, timeout=self.timeout) as response:
+            text = response.read().decode('utf-8', errors='replace')
+        return {self.source: parse_prometheus(text, self.prefixes)}
+
+
+def get_container_ids(docker_exec, container_names):
+    container_ids = {}
+    for name in container_names:
+        process = subprocess.run([docker_exec, 'inspect', '--format', '{{.Id}}', name],
+                                 stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        if process.returncode == 0 and process.stdout.strip():
+            container_ids[name] = process.stdout.strip()
+        else:
+            logging.info(f'Container "{name}" not found, its resources are not sampled')
+    return container_ids
+
+
+def get_compose_project(project_dir='.'):
+    # Compose names a project after the directory of its compose file, where
+    # launch_infrastructure.py keeps both the default and generated ones
+    name = os.environ.get('COMPOSE_PROJECT_NAME') or os.path.basename(os.path.abspath(project_dir))
+    return re.sub(r'[^a-z0-9_-]', '', name.lower())
+
+
+def get_project_container_ids(docker_exec, project):
+    # Every running service of the project by name, "node" and "worker" or
+    # the "node-<i>" and "worker-<i>" of a generated topology
+    process = subprocess.run([docker_exec, 'ps', '--no-trunc', '--filter', f'label=com.docker.compose.project={project}',
+                              '--format', '{{.Label "com.docker.compose.service"}} {{.ID}}'],
+                             stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    container_ids = dict(line.split() for line in process.stdout.splitlines() if len(line.split()) == 2) \
+        if process.returncode == 0 else {}
+    if not container_ids:
+        logging.info(f'No container of compose project "{project}" running, their resources are not sampled')
+    return container_ids
+
+
+class CgroupSampler:
+    # Containers run in cgroups of their own, whose accounting can be read
+    # from the host without entering them. Both the unified (v2) and the
+    # per-controller (v1) hierarchy are understood.
+    def __init__(self, container_ids, cgroup_root='/sys/fs/cgroup'):
+        self.cgroup_root = cgroup_root
+        self.container_ids = container_ids
+
+    def find_dirs(self, container_id, controller=None):
+        root = self.cgroup_root if controller is None else os.path.join(self.cgroup_root, controller)
+        return [path for path in (os.path.join(root, 'system.slice', f'docker-{container_id}.scope'),
+                                  os.path.join(root, 'docker', container_id))
+                if os.path.isdir(path)]
+
+    def read_container(self, container_id):
+        sample = {}
+        for cgroup_dir in self.find_dirs(container_id):
+            cpu_stat = os.path.join(cgroup_dir, 'cpu.stat')
+            if os.path.exists(cpu_stat):
+                for line in read_file(cpu_stat).splitlines():
+                    key, _, value = line.partition(' ')
+                    if key == 'usage_usec':
+                        sample['cpu_seconds_total'] = int(value) / 1_000_000
+                    elif key == 'nr_throttled':
+                        sample['cpu_throttled_total'] = int(value)
+            self.read_value(sample, 'memory_bytes', cgroup_dir, 'memory.current')
+            self.read_value(sample, 'pids', cgroup_dir, 'pids.current')
+
+        if not sample:
+            for cgroup_dir in self.find_dirs(container_id, 'cpuacct') + self.find_dirs(container_id, 'cpu,cpuacct'):
+                if self.read_value(sample, 'cpu_seconds_total', cgroup_dir, 'cpuacct.usage'):
+                    sample['cpu_seconds_total'] /= 1_000_000_000
+            for cgroup_dir in self.find_dirs(container_id, 'memory'):
+                self.read_value(sample, 'memory_bytes', cgroup_dir, 'memory.usage_in_bytes')
+            for cgroup_dir in self.find_dirs(container_id, 'pids'):
+                self.read_value(sample, 'pids', cgroup_dir, 'pids.current')
+
+        return sample
+
+    @staticmethod
+    def read_value(sample, metric, cgroup_dir, file_name):
+        path = os.path.join(cgroup_dir, file_name)
+        if not os.path.exists(path):
+            return False
+        sample[metric] = int(read_file(path).strip())
+        return True
+
+    def sample(self):
+        samples = {name: self.read_container(container_id) for name, container_id in self.container_ids.items()}
+        if not any(samples.values()):
+            raise FileNotFoundError(f'no container cgroup found under {self.cgroup_root}')
+        return {name: sample for name, sample in samples.items() if sample}
+
+
+def is_missing_source(ex, sampled_before):
+    # urllib wraps the actual error of both HTTP and "file://" URLs
+    reason = ex.reason if isinstance(ex, urllib.error.URLError) and isinstance(ex.reason, OSError) else ex
+    # A node refusing connections once it was scraped may just be restarting
+    return isinstance(reason, FileNotFoundError) or (isinstance(reason, ConnectionRefusedError) and not sampled_before)
+
+
+class ResourceMonitor:
+    # Samples are streamed to <report_prefix>-resources.csv as they are
+    # taken, only running aggregates stay in memory for the summary
+    def __init__(self, samplers, interval=DEFAULT_TELEMETRY_INTERVAL, report_prefix=None):
+        self.samplers = samplers
+        self.interval = interval
+        self.report_prefix = report_prefix
+        self.series = {}
+        self.csv_file = None
+        self.csv_writer = None
+        self.previous = {}
+        self.sampled = set()
+        self.errors = {}
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def open_report(self):
+        if self.report_prefix is not None:
+            report_dir = os.path.dirname(self.report_prefix)
+            if report_dir:
+                os.makedirs(report_dir, exist_ok=True)
+            self.csv_file = open(f'{self.report_prefix}-resources.csv', 'w', newline='')
+            self.csv_writer = csv.DictWriter(self.csv_file, fieldnames=SAMPLE_FIELDS)
+            self.csv_writer.writeheader()
+
+    def start(self):
+        self.open_report()
+        self.thread = threading.Thread(target=self._sample_loop, name='resource-monitor', daemon=True)
+        self.thread.start()
+        logging.info(f'Sampling resources of {", ".join(type(sampler).__name__ for sampler in self.samplers)} '
+                     f'every {self.interval:g}s')
+
+    def stop(self):
+        if self.thread is not None:
+            self.stopping.set()
+            self.thread.join()
+            self.thread = None
+
+        if self.csv_file is not None:
+            self.csv_file.close()
+            self.csv_file = None
+            self.csv_writer = None
+
+    def _sample_loop(self):
+        while True:
+            stopping = self.stopping.is_set()
+            self.sample_once()
+            # One last sample after stop() so the end of the run is covered
+            if stopping:
+                break
+            self.stopping.wait(self.interval)
+
+    def sample_once(self):
+        # Offsets are relative to the start of the operation metrics, so both
+        # can be laid over each other
+        now = time.time()
+        offset = now - metrics.get_run_metrics().started_at
+
+        for sampler in list(self.samplers):
+            try:
+                samples = sampler.sample()
+            except Exception as ex:
+                if is_missing_source(ex, sampler in self.sampled):
+                    # A source missing now will be missing for the whole run
+                    logging.warning(f'{type(sampler).__name__} unavailable, not sampling it anymore: {ex!r}')
+                    self.samplers.remove(sampler)
+                else:
+                    # Such as a scrape timing out while the node is busy
+                    logging.warning(f'{type(sampler).__name__} failed, skipping this sample: {ex!r}')
+                    self.errors[type(sampler).__name__] = self.errors.get(type(sampler).__name__, 0) + 1
+                    metrics.get_run_metrics().increment('telemetry-errors')
+                continue
+
+            self.sampled.add(sampler)
+            for source, sample in samples.items():
+                self.add_sample(now, offset, source, sample)
+
+    def add_sample(self, now, offset, source, sample):
+        values = dict(sample)
+        previous_at, previous = self.previous.get(source, (None, {}))
+        for metric, value in sample.items():
+            if metric.endswith(COUNTER_SUFFIX) and metric in previous and now > previous_at:
+                # Counters of processes that ended drop out of the sum
+                values[metric[:-len(COUNTER_SUFFIX)] + RATE_SUFFIX] = max(value - previous[metric], 0) / (now - previous_at)
+        self.previous[source] = (now, sample)
+
+        source_series = self.series.setdefault(source, {})
+        for metric, value in values.items():
+            if not metric.endswith(COUNTER_SUFFIX):
+                aggregate = source_series.setdefault(metric, {'total': 0.0, 'max': value, 'samples': 0})
+                aggregate['total'] += value
+                aggregate['max'] = max(aggregate['max'], value)
+                aggregate['samples'] += 1
+
+        if self.csv_writer is not None:
+            self.csv_writer.writerows({'time': now, 'offset': offset, 'source': source, 'metric': metric, 'value': value}
+                                      for metric, value in values.items())
+            self.csv_file.flush()
+        tracing.get_tracer().counter(source, 'telemetry', {metric: value for metric, value in values.items()
+                                                            if not metric.endswith(COUNTER_SUFFIX)})
+
+    def summary(self):
+        return {source: {metric: {'mean': aggregate['total'] / aggregate['samples'], 'max': aggregate['max'],
+                                  'samples': aggregate['samples']}
+                         for metric, aggregate in sorted(source_series.items())}
+                for source, source_series in sorted(self.series.items())}
+
+    def write_report(self):
+        summary = self.summary()
+        if self.report_prefix is not None:
+            with open(f'{self.report_prefix}-resources.json', 'w') as json_file:
+                json.dump(summary, json_file, indent=2)
+            logging.info(f'Resource report written to {self.report_prefix}-resources.json and '
+                         f'{self.report_prefix}-resources.csv')
+        if self.errors:
+            logging.warning('Samples skipped after errors: ' + ', '.join(
+                f'{sampler} {count}' for sampler, count in sorted(self.errors.items())))
+        for source, source_summary in summary.items():
+            logging.info(f'{source}: ' + ', '.join(
+                f'{metric} {source_summary[metric]["mean"]:.3g} mean, {source_summary[metric]["max"]:.3g} max'
+                for metric in ('cpu_seconds_per_second', 'rss_bytes', 'memory_bytes', 'open_fds')
+                if metric in source_summary))
+
+        return summary
+
+
+def create_samplers(root_pid=None, node_metrics_url=DEFAULT_NODE_METRICS_URL, containers=None, compose_project=None,
+                    docker_exec=None, proc_root='/proc', cgroup_root='/sys/fs/cgroup'):
+    # Without container names every container of the compose project is
+    # sampled, an empty list samples none
+    samplers = []
+    if os.path.isdir(proc_root):
+        samplers.append(ProcessTreeSampler(root_pid, proc_root))
+    else:
+        logging.info(f'No {proc_root}, the tester processes are not sampled')
+
+    if node_metrics_url:
+        samplers.append(PrometheusSampler(node_metrics_url))
+
+    if containers != [] and docker_exec is not None:
+        if containers:
+            container_ids = get_container_ids(docker_exec, containers)
+        else:
+            container_ids = get_project_container_ids(docker_exec, compose_project or get_compose_project())
+        if container_ids:
+            samplers.append(CgroupSampler(container_ids, cgroup_root))
+    elif containers != []:
+        logging.info('No docker binary, the containers are not sampled')
+
+    return samplers
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=['sample'],
+                        help='Take one sample of every available source and print it as JSON')
+    parser.add_argument('--pid', required=False,
+                        help='Root of the sampled process tree, defaults to this process', type=int)
+    parser.add_argument('--proc-root', required=False, default='/proc',
+                        help='Read processes from this directory, e.g. a fixture, defaults to "/proc"', type=str)
+    parser.add_argument('--node-metrics-url', required=False, default=DEFAULT_NODE_METRICS_URL,
+                        help=f'Prometheus endpoint or "file://" scrape of the node, defaults to "{DEFAULT_NODE_METRICS_URL}"', type=str)
+    parser.add_argument('--cgroup-root', required=False, default='/sys/fs/cgroup',
+                        help='Read container cgroups from this directory, defaults to "/sys/fs/cgroup"', type=str)
+    parser.add_argument('--container', required=False, action='append', default=[],
+                        help='Container name and id as "<name>=<id>", repeatable, instead of asking docker for the containers of the compose project', type=str)
+    parser.add_argument('--compose-project', required=False,
+                        help='Compose project whose containers are sampled, defaults to "$COMPOSE_PROJECT_NAME" or the current directory name', type=str)
+    parser.add_argument('--verbose', required=False,
+                        help='Show additional logging messages', action='store_true')
+
+    args = parser.parse_args()
+
+    scu.setup_logging(verbose=args.verbose)
+
+    samplers = [ProcessTreeSampler(args.pid, args.proc_root), PrometheusSampler(args.node_metrics_url)]
+    if args.container:
+        container_ids = dict(container.partition('=')[::2] for container in args.container)
+    elif (docker_path := shutil.which('docker')) is not None:
+        container_ids = get_project_container_ids(docker_path, args.compose_project or get_compose_project())
+    else:
+        container_ids = {}
+    if container_ids:
+        samplers.append(CgroupSampler(container_ids, args.cgroup_root))
+
+    samples = {}
+    for sampler in samplers:
+        try:
+            samples.update(sampler.sample())
+        except Exception as ex:
+            logging.warning(f'{type(sampler).__name__} unavailable: {ex!r}')
+
+    json.dump(samples, sys.stdout, indent=2)
+    sys.stdout.write('\n')
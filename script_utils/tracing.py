@@ -0,0 +1,386 @@
+#!/usr/bin/python3
+
+import argparse
+import contextvars
+import glob
+import heapq
+import json
+import logging
+import os
+import queue
+import socket
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import script_utils as scu
+
+
+DEFAULT_TRACE_PATH = 'game-logs/trace'
+DEFAULT_PROFILE_INTERVAL = 0.01
+
+# Thread ids of the profiler tracks, far above the span lanes
+PROFILE_TID_BASE = 1_000_000
+
+# Innermost part of the stack kept by the profiler
+PROFILE_MAX_DEPTH = 64
+
+
+class TracingException(Exception):
+    pass
+
+
+class Span:
+    def __init__(self, name, category, lane, parent, args):
+        self.name = name
+        self.category = category
+        self.lane = lane
+        self.parent = parent
+        self.args = args
+        self.start = 0.0
+
+
+# Span currently open in this task or thread
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+class Tracer:
+    # Writes spans as complete events of the Chrome trace event format, which
+    # both chrome://tracing and ui.perfetto.dev open. Concurrent games cannot
+    # share a thread track, so every span tree gets a lane of its own and
+    # children stay on their parent's lane unless a sibling already took it.
+    def __init__(self, path_prefix=DEFAULT_TRACE_PATH, process_name=None, batch_size=1024, flush_interval=1.0):
+        self.path = f'{path_prefix}-{socket.gethostname()}-{os.getpid()}.json'
+        self.pid = os.getpid()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        # Wall clock anchored so traces of several processes line up, with
+        # the resolution of the performance counter
+        self.epoch = time.time() - time.perf_counter()
+
+        self.lock = threading.Lock()
+        self.lanes = {}
+        self.free_lanes = []
+        self.lane_count = 0
+        self.dropped_events = 0
+        self.events = queue.Queue()
+
+        path_dir = os.path.dirname(self.path)
+        if path_dir:
+            os.makedirs(path_dir, exist_ok=True)
+        self.trace_file = open(self.path, 'w')
+        self.trace_file.write('[\n')
+        self.first_event = True
+
+        self.writer = threading.Thread(target=self._write_events, name='trace-writer', daemon=True)
+        self.writer.start()
+
+        self.set_process_name(process_name or os.path.basename(sys.argv[0]))
+
+    def timestamp(self, perf_time=None):
+        return round((self.epoch + (time.perf_counter() if perf_time is None else perf_time)) * 1_000_000, 1)
+
+    def set_process_name(self, name):
+        self.events.put({'ph': 'M', 'name': 'process_name', 'pid': self.pid, 'tid': 0, 'args': {'name': name}})
+
+    def set_thread_name(self, tid, name):
+        self.events.put({'ph': 'M', 'name': 'thread_name', 'pid': self.pid, 'tid': tid, 'args': {'name': name}})
+
+    def complete(self, name, category, tid, start, end, args=None):
+        event = {'ph': 'X', 'name': name, 'cat': category, 'pid': self.pid, 'tid': tid,
+                 'ts': self.timestamp(start), 'dur': round((end - start) * 1_000_000, 1)}
+        if args:
+            event['args'] = args
+        self.events.put(event)
+
+    def instant(self, name, category, **args):
+        current = _current_span.get()
+        self.events.put({'ph': 'i', 'name': name, 'cat': category, 'pid': self.pid,
+                         'tid': current.lane if current is not None else 0, 'ts': self.timestamp(),
+                         's': 't' if current is not None else 'p', 'args': args})
+
+    def counter(self, name, category, values):
+        if values:
+            self.events.put({'ph': 'C', 'name': name, 'cat': category, 'pid': self.pid, 'tid': 0,
+                             'ts': self.timestamp(), 'args': values})
+
+    def _take_lane(self, parent):
+        with self.lock:
+            if parent is not None and self.lanes[parent.lane] and self.lanes[parent.lane][-1] is parent:
+                lane = parent.lane
+            elif self.free_lanes:
+                lane = heapq.heappop(self.free_lanes)
+            else:
+                self.lane_count += 1
+                lane = self.lane_count
+                self.set_thread_name(lane, f'lane {lane}')
+                self.lanes[lane] = []
+            return lane
+
+    def open_span(self, name, category, args):
+        parent = _current_span.get()
+        opened = Span(name, category, self._take_lane(parent), parent, args)
+        with self.lock:
+            self.lanes[opened.lane].append(opened)
+        opened.start = time.perf_counter()
+        return opened
+
+    def close_span(self, closed):
+        end = time.perf_counter()
+        with self.lock:
+            stack = self.lanes[closed.lane]
+            # Only a child task outliving the span that started it breaks the
+            # nesting, its span is then simply dropped from the stack
+            stack.remove(closed)
+            if not stack:
+                heapq.heappush(self.free_lanes, closed.lane)
+        self.complete(closed.name, closed.category, closed.lane, closed.start, end, closed.args)
+
+    def _write_batch(self, batch):
+        data = ''.join(('' if self.first_event and i == 0 else ',\n') + json.dumps(event, separators=(',', ':'))
+                       for i, event in enumerate(batch))
+        self.first_event = False
+        self.trace_file.write(data)
+        self.trace_file.flush()
+
+    def _write_events(self):
+        closing = False
+        while not closing:
+            try:
+                batch = [self.events.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.events.get_nowait())
+                except queue.Empty:
+                    break
+
+            if batch[-1] is None:
+                closing = True
+                batch.pop()
+
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except Exception as ex:
+                    self.dropped_events += len(batch)
+                    logging.error(f'Failed to write {len(batch)} trace event/s: {ex}')
+
+        # A trace cut short by a crash lacks the closing bracket, which the
+        # trace viewers accept as well
+        self.trace_file.write('\n]\n')
+        self.trace_file.close()
+
+    def close(self):
+        self.events.put(None)
+        self.writer.join()
+        if self.dropped_events:
+            logging.error(f'{self.dropped_events} trace event/s could not be written')
+        logging.info(f'Trace written to {self.path}')
+
+
+class NullTracer:
+    def set_process_name(self, name):
+        pass
+
+    def instant(self, name, category, **args):
+        pass
+
+    def counter(self, name, category, values):
+        pass
+
+    def close(self):
+        pass
+
+
+class SamplingProfiler:
+    # Samples the Python stacks of the other threads of this process and turns
+    # runs of identical frames into nested spans on a track per thread, next
+    # to the game spans. sys._current_frames is cheap, but every sample still
+    # takes the GIL from the tester for a moment.
+    def __init__(self, tracer, interval=DEFAULT_PROFILE_INTERVAL, max_depth=PROFILE_MAX_DEPTH):
+        self.tracer = tracer
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = {}
+        self.tids = {}
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        logging.info(f'Sampling the tester every {self.interval * 1000:g}ms')
+
+    @staticmethod
+    def frame_label(frame):
+        code = frame.f_code
+        return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+    def get_tid(self, ident, thread_names):
+        if (tid := self.tids.get(ident)) is None:
+            tid = self.tids[ident] = PROFILE_TID_BASE + len(self.tids)
+            self.tracer.set_thread_name(tid, f'profile: {thread_names.get(ident, ident)}')
+        return tid
+
+    def sample(self, now):
+        ignored = {self.thread.ident, self.tracer.writer.ident}
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+
+        for ident, frame in sys._current_frames().items():
+            if ident in ignored:
+                continue
+
+            labels = []
+            while frame is not None and len(labels) < self.max_depth:
+                labels.append(self.frame_label(frame))
+                frame = frame.f_back
+            labels.reverse()
+
+            # Frames already open since an earlier sample simply go on
+            open_frames = self.stacks.setdefault(ident, [])
+            common = 0
+            while common < min(len(open_frames), len(labels)) and open_frames[common][0] == labels[common]:
+                common += 1
+            self._close_frames(ident, open_frames, common, now, thread_names)
+            open_frames.extend((label, now) for label in labels[common:])
+
+        # Threads that ended since the last sample
+        for ident in set(self.stacks) - set(sys._current_frames()):
+            self._close_frames(ident, self.stacks.pop(ident), 0, now, thread_names)
+
+        self.samples += 1
+
+    def _close_frames(self, ident, open_frames, keep, now, thread_names):
+        if len(open_frames) <= keep:
+            return
+        tid = self.get_tid(ident, thread_names)
+        while len(open_frames) > keep:
+            label, started = open_frames.pop()
+            self.tracer.complete(label, 'profile', tid, started, now)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample(time.perf_counter())
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        now = time.perf_counter()
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, open_frames in self.stacks.items():
+            self._close_frames(ident, open_frames, 0, now, thread_names)
+        logging.info(f'Sampling profiler took {self.samples} sample/s')
+
+
+_tracer = NullTracer()
+_profiler = None
+
+
+def get_tracer():
+    return _tracer
+
+
+def open_trace(path_prefix=DEFAULT_TRACE_PATH, process_name=None, profile_interval=None):
+    global _tracer, _profiler
+    try:
+        _tracer = Tracer(path_prefix, process_name)
+    except OSError as ex:
+        raise TracingException(f'Could not open trace "{path_prefix}": {ex}')
+
+    if profile_interval is not None:
+        _profiler = SamplingProfiler(_tracer, profile_interval)
+        _profiler.start()
+    return _tracer
+
+
+def close_trace():
+    global _tracer, _profiler
+    if _profiler is not None:
+        _profiler.stop()
+        _profiler = None
+    _tracer.close()
+    _tracer = NullTracer()
+
+
+@contextmanager
+def span(name, category='tester', **args):
+    tracer = _tracer
+    if isinstance(tracer, NullTracer):
+        yield
+        return
+
+    opened = tracer.open_span(name, category, {key: value for key, value in args.items() if value is not None})
+    token = _current_span.set(opened)
+    try:
+        yield
+    finally:
+        _current_span.reset(token)
+        tracer.close_span(opened)
+
+
+def annotate(**args):
+    # Adds details only known mid-span, such as the worker a call went to
+    if (current := _current_span.get()) is not None:
+        current.args.update(args)
+
+
+def read_trace(path):
+    with open(path) as trace_file:
+        content = trace_file.read().strip()
+
+    if content.startswith('{'):
+        return json.loads(content).get('traceEvents', [])
+    # Traces of processes that died are not terminated
+    content = content.rstrip(',')
+    if not content.endswith(']'):
+        content += ']'
+    return json.loads(content)
+
+
+def merge_traces(paths, output_path):
+    events = []
+    for path in paths:
+        events.extend(read_trace(path))
+
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    with open(output_path, 'w') as output_file:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, output_file, separators=(',', ':'))
+
+    return len(events)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=['merge'],
+                        help='Merge the traces of the tester processes, e.g. a coordinator and its agents, into one file')
+    parser.add_argument('path', help=f'Trace file, glob or prefix, e.g. "{DEFAULT_TRACE_PATH}"')
+    parser.add_argument('--output', required=False,
+                        help='Merged trace to write, defaults to "<path>-merged.json"', type=str)
+    parser.add_argument('--verbose', required=False,
+                        help='Show additional logging messages', action='store_true')
+
+    args = parser.parse_args()
+
+    scu.setup_logging(verbose=args.verbose)
+
+    output_path = args.output or f'{args.path}-merged.json'
+    paths = [path for path in (sorted(glob.glob(args.path)) or sorted(glob.glob(f'{args.path}-*.json')))
+             if os.path.abspath(path) != os.path.abspath(output_path)]
+    if not paths:
+        logging.error(f'No trace matches "{args.path}"')
+        sys.exit(1)
+
+    try:
+        event_count = merge_traces(paths, output_path)
+    except (OSError, ValueError) as ex:
+        logging.error(f'Failed to merge traces: {ex}')
+        sys.exit(1)
+
+    logging.info(f'Merged {event_count} event/s of {len(paths)} trace/s into {output_path}')
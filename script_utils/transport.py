@@ -0,0 +1,330 @@
+import asyncio
+import itertools
+import json
+import logging
+import queue
+import ssl
+import subprocess
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import websocket
+
+import script_utils as scu
+from script_utils import metrics, tracing
+
+
+TRUSTED_OPERATIONS = {'get-board', 'drop-bomb', 'drop-stone', 'set-balance', 'balance'}
+
+TRUSTED_GETTERS = {'get-board', 'balance'}
+
+BALANCING_POLICIES = ['round-robin', 'least-in-flight', 'sticky']
+
+# Statuses a watched trusted operation ends with, as in TrustedOperationStatus
+# of the worker. The CLI considers a call done once it is in a sidechain block.
+SUCCESS_STATUSES = {'InSidechainBlock', 'Finalized'}
+FAILURE_STATUSES = {'Invalid', 'Dropped', 'Usurped', 'FinalityTimeout'}
+
+
+class TransportException(Exception):
+    pass
+
+
+def write_output(stdout, output):
+    if output is not None and hasattr(stdout, 'write'):
+        stdout.write(output if output.endswith('\n') else output + '\n')
+        stdout.flush()
+
+
+async def run_cli_command(cmd, stdout, operation, timeout=60.0):
+    logging.debug(f'Running command: "{" ".join(cmd)}"')
+    with metrics.get_run_metrics().measure(operation, timeout_exceptions=(subprocess.TimeoutExpired,)):
+        with tracing.span('spawn', 'cli'):
+            proc = await asyncio.create_subprocess_exec(*cmd, stdout=stdout,
+                                                        stderr=subprocess.STDOUT)
+        try:
+            output, _ = await asyncio.wait_for(proc.communicate(), timeout)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            raise subprocess.TimeoutExpired(cmd, timeout)
+
+        if output is not None:
+            output = output.decode('utf-8', errors='replace')
+
+        if proc.returncode != 0:
+            raise subprocess.CalledProcessError(
+                cmd=' '.join(cmd), returncode=proc.returncode, output=output)
+
+    return output
+
+
+class CliTransport:
+    name = 'cli'
+
+    def __init__(self, cli_exec, mrenclave, node_port=9944, worker_port=2011, websocket_ip='127.0.0.1'):
+        self.cli_exec = cli_exec
+        self.mrenclave = mrenclave
+        self.base_cli_cmd = scu.get_base_cli_cmd(
+            cli_exec, node_port, worker_port, websocket_ip)
+
+    def get_command(self, operation, signer, args=()):
+        if operation in TRUSTED_OPERATIONS:
+            subcommand = scu.get_trusted_cli_subcommand(
+                signer, self.mrenclave, operation)
+        else:
+            subcommand = [operation]
+
+        return self.base_cli_cmd + subcommand + [signer] + [str(arg) for arg in args]
+
+    async def execute(self, operation, signer, args=(), stdout=subprocess.PIPE, timeout=60.0, affinity=None, metric=None):
+        return await run_cli_command(self.get_command(operation, signer, args), stdout, metric or operation, timeout)
+
+    def close(self):
+        pass
+
+
+class JsonRpcCodec:
+    # Maps operations onto the worker direct RPC methods, sending the trusted
+    # operation as plain JSON. Only the worker RPC simulator understands it, a
+    # worker needs the SCALE encoded and shielded operation of its build, so
+    # the "rpc" transport only runs with a codec chosen explicitly.
+    def encode(self, operation, signer, mrenclave, args):
+        if operation in TRUSTED_GETTERS:
+            method = 'state_executeGetter'
+        else:
+            method = 'author_submitAndWatchExtrinsic'
+
+        return method, [{'mrenclave': mrenclave, 'signer': signer, 'operation': operation,
+                         'args': [str(arg) for arg in args]}]
+
+    def is_final(self, response):
+        result = response.get('result')
+        if 'error' in response or not isinstance(result, dict):
+            return True
+        return not result.get('do_watch', False) or result.get('status') in SUCCESS_STATUSES | FAILURE_STATUSES
+
+    def decode(self, operation, response):
+        if 'error' in response:
+            raise TransportException(response['error'])
+
+        result = response.get('result')
+        if isinstance(result, dict) and 'status' in result:
+            if result['status'] in FAILURE_STATUSES:
+                raise TransportException(f'{operation} ended {result["status"]}: {result.get("value")}')
+            result = result.get('value')
+
+        if result is None:
+            return ''
+        if isinstance(result, str):
+            return result
+        return json.dumps(result)
+
+
+# Codecs the "rpc" transport can be run with, by "--worker-codec" name
+WORKER_CODECS = {'json': JsonRpcCodec}
+
+
+class WebSocketPool:
+    def __init__(self, url, pool_size=32, connect_timeout=10.0, verify_tls=False):
+        self.url = url
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.sslopt = {} if verify_tls else {'cert_reqs': ssl.CERT_NONE,
+                                             'check_hostname': False}
+        self.idle_connections = queue.LifoQueue()
+        self.created_connections = 0
+        self.request_ids = itertools.count(1)
+        self.executor = ThreadPoolExecutor(max_workers=pool_size,
+                                           thread_name_prefix='worker-rpc')
+
+    def acquire(self):
+        try:
+            return self.idle_connections.get_nowait()
+        except queue.Empty:
+            pass
+
+        # Only executor threads reach this point so at most pool_size exist
+        self.created_connections += 1
+        logging.debug(
+            f'Opening worker RPC connection #{self.created_connections} to {self.url}')
+        return websocket.create_connection(self.url, timeout=self.connect_timeout, sslopt=self.sslopt)
+
+    def release(self, connection, broken=False):
+        if broken:
+            self.created_connections -= 1
+            try:
+                connection.close()
+            except Exception:
+                pass
+        else:
+            self.idle_connections.put(connection)
+
+    def request_blocking(self, method, params, timeout, is_final):
+        request_id = next(self.request_ids)
+        payload = json.dumps({'jsonrpc': '2.0', 'method': method,
+                              'params': params, 'id': request_id})
+        deadline = time.monotonic() + timeout
+
+        connection = self.acquire()
+        try:
+            connection.send(payload)
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise websocket.WebSocketTimeoutException(f'No final status within {timeout:g}s')
+                connection.settimeout(remaining)
+                response = json.loads(connection.recv())
+                # Watched calls report every status change until the final
+                # one, updates of earlier timed out calls are skipped
+                if response.get('id') == request_id and is_final(response):
+                    break
+        except Exception:
+            self.release(connection, broken=True)
+            raise
+
+        self.release(connection)
+        return response
+
+    async def request(self, method, params, timeout=60.0, is_final=lambda response: True):
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self.executor, self.request_blocking, method, params, timeout, is_final)
+        except websocket.WebSocketTimeoutException:
+            raise subprocess.TimeoutExpired(method, timeout)
+
+    def close(self):
+        while not self.idle_connections.empty():
+            self.idle_connections.get_nowait().close()
+        self.executor.shutdown(wait=False)
+
+
+class WorkerRpcTransport:
+    name = 'rpc'
+
+    def __init__(self, cli_transport, worker_url, pool_size=32, codec=None):
+        self.mrenclave = cli_transport.mrenclave
+        self.cli_transport = cli_transport
+        self.pool = WebSocketPool(worker_url, pool_size)
+        self.codec = codec or JsonRpcCodec()
+
+    async def execute(self, operation, signer, args=(), stdout=subprocess.PIPE, timeout=60.0, affinity=None, metric=None):
+        # Extrinsics such as "queue-game" go to the node, not to the worker
+        if operation not in TRUSTED_OPERATIONS:
+            return await self.cli_transport.execute(operation, signer, args, stdout, timeout, metric=metric)
+
+        method, params = self.codec.encode(
+            operation, signer, self.mrenclave, args)
+        logging.debug(f'Sending {method} for "{operation}" signed by {signer}')
+
+        with metrics.get_run_metrics().measure(metric or operation, timeout_exceptions=(subprocess.TimeoutExpired,)):
+            try:
+                response = await self.pool.request(method, params, timeout, self.codec.is_final)
+                output = self.codec.decode(operation, response)
+            except (subprocess.TimeoutExpired, TransportException):
+                raise
+            except Exception as ex:
+                raise TransportException(f'{operation} failed: {ex}')
+
+        write_output(stdout, output)
+        return output
+
+    def close(self):
+        self.pool.close()
+
+
+class WorkerEndpoint:
+    def __init__(self, name, host='127.0.0.1', worker_port=2011, node_port=9944):
+        self.name = name
+        self.host = host
+        self.worker_port = worker_port
+        self.node_port = node_port
+
+    @property
+    def worker_url(self):
+        return f'wss://{self.host}:{self.worker_port}'
+
+    def to_dict(self):
+        return {'name': self.name, 'host': self.host, 'worker_port': self.worker_port, 'node_port': self.node_port}
+
+
+def load_topology(topology_path):
+    try:
+        with open(topology_path) as topology_file:
+            topology = json.load(topology_file)
+        return [WorkerEndpoint(**worker) for worker in topology['workers']]
+    except (OSError, ValueError, KeyError, TypeError) as ex:
+        raise TransportException(
+            f'Invalid topology file "{topology_path}": {ex}')
+
+
+class BalancedTransport:
+    def __init__(self, endpoint_transports, policy='round-robin'):
+        if policy not in BALANCING_POLICIES:
+            raise TransportException(f'Unknown balancing policy "{policy}"')
+
+        self.endpoint_transports = endpoint_transports
+        self.policy = policy
+        self.name = endpoint_transports[0][1].name
+        self.mrenclave = endpoint_transports[0][1].mrenclave
+        self.in_flight = [0] * len(endpoint_transports)
+        self.next_index = itertools.count()
+
+    def pick(self, signer, affinity=None):
+        if self.policy == 'sticky':
+            # Every call of a game, or of an account outside games, lands on
+            # the same worker
+            key = affinity if affinity is not None else signer
+            return zlib.crc32(key.encode('utf-8')) % len(self.endpoint_transports)
+        elif self.policy == 'least-in-flight':
+            return min(range(len(self.in_flight)), key=self.in_flight.__getitem__)
+
+        return next(self.next_index) % len(self.endpoint_transports)
+
+    async def execute(self, operation, signer, args=(), stdout=subprocess.PIPE, timeout=60.0, affinity=None, metric=None):
+        index = self.pick(signer, affinity)
+        endpoint_name, endpoint_transport = self.endpoint_transports[index]
+        tracing.annotate(worker=endpoint_name)
+
+        self.in_flight[index] += 1
+        try:
+            with metrics.get_run_metrics().measure(f'{metric or operation}@{endpoint_name}',
+                                                   timeout_exceptions=(subprocess.TimeoutExpired,)):
+                return await endpoint_transport.execute(operation, signer, args, stdout, timeout, metric=metric)
+        finally:
+            self.in_flight[index] -= 1
+
+    def close(self):
+        for _, endpoint_transport in self.endpoint_transports:
+            endpoint_transport.close()
+
+
+def create_transport(transport_name, cli_exec, mrenclave, worker_url='wss://127.0.0.1:2011', pool_size=32,
+                     endpoints=None, policy='round-robin', codec=None):
+    if transport_name not in (CliTransport.name, WorkerRpcTransport.name):
+        raise TransportException(f'Unknown transport "{transport_name}"')
+    if transport_name == WorkerRpcTransport.name and codec is None:
+        raise TransportException('The "rpc" transport needs a codec producing the trusted operations of the worker build')
+
+    if not endpoints:
+        cli_transport = CliTransport(cli_exec, mrenclave)
+        if transport_name == WorkerRpcTransport.name:
+            return WorkerRpcTransport(cli_transport, worker_url, pool_size, codec)
+        return cli_transport
+
+    endpoint_transports = []
+    for endpoint in endpoints:
+        cli_transport = CliTransport(cli_exec, mrenclave, endpoint.node_port,
+                                     endpoint.worker_port, endpoint.host)
+        if transport_name == WorkerRpcTransport.name:
+            endpoint_transport = WorkerRpcTransport(
+                cli_transport, endpoint.worker_url, pool_size, codec)
+        else:
+            endpoint_transport = cli_transport
+        endpoint_transports.append((endpoint.name, endpoint_transport))
+
+    logging.info(
+        f'Balancing trusted calls over {len(endpoints)} worker/s with the "{policy}" policy')
+
+    return BalancedTransport(endpoint_transports, policy)
@@ -0,0 +1,56 @@
+import json
+import sqlite3
+
+from script_utils import accounts
+
+
+def test_pool_grows_without_deriving_cached_accounts(tmp_path, monkeypatch):
+    pool_path = str(tmp_path / 'pool.sqlite')
+    pool = accounts.AccountPool.load(pool_path)
+    pool.derive(accounts.get_account_names(3))
+    pool.set_trusted_balance('enclave', '//Account_1', 100)
+    pool.save()
+    address = pool.get_address('//Account_1')
+
+    derived_uris = []
+    derive_keypairs = accounts.derive_keypairs
+    monkeypatch.setattr(accounts, 'derive_keypairs', lambda uris: derived_uris.extend(uris) or derive_keypairs(uris))
+
+    pool = accounts.AccountPool.load(pool_path)
+    # Only what is asked for is read
+    assert pool.accounts == {}
+    pool.derive(accounts.get_account_names(2, start=1) + accounts.get_account_names(2, start=3))
+
+    assert derived_uris == ['//Account_3', '//Account_4']
+    assert pool.get_address('//Account_1') == address
+    assert pool.get_trusted_balance('enclave', '//Account_1') == 100
+    assert pool.get_trusted_balance('enclave', '//Account_2') == 0
+    with sqlite3.connect(pool_path) as connection:
+        assert connection.execute('SELECT COUNT(*) FROM accounts').fetchone()[0] == 5
+
+
+def test_pool_clears_balances_per_enclave(tmp_path):
+    pool_path = str(tmp_path / 'pool.sqlite')
+    pool = accounts.AccountPool.load(pool_path)
+    pool.set_trusted_balance('old', '//Account_0', 100)
+    pool.set_trusted_balance('new', '//Account_0', 200)
+    pool.clear_trusted_balances('old')
+    pool.save()
+
+    pool = accounts.AccountPool.load(pool_path)
+    assert pool.get_trusted_balance('old', '//Account_0') == 0
+    assert pool.get_trusted_balance('new', '//Account_0') == 200
+
+
+def test_json_pool_is_converted(tmp_path):
+    pool_path = tmp_path / 'account-pool.json'
+    pool_path.write_text(json.dumps({
+        'accounts': {'//Account_0': {'public_key': 'ab', 'address': 'address-0'}},
+        'trusted_balances': {'enclave': {'//Account_0': 100}}}))
+
+    accounts.AccountPool.load(str(pool_path))
+
+    pool = accounts.AccountPool.load(str(pool_path))
+    pool.read_accounts(['//Account_0'])
+    assert pool.get_address('//Account_0') == 'address-0'
+    assert pool.get_trusted_balance('enclave', '//Account_0') == 100
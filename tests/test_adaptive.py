@@ -0,0 +1,53 @@
+import asyncio
+
+from script_utils import adaptive
+
+
+def test_raising_the_limit_releases_blocked_workers():
+    async def run():
+        limiter = adaptive.ConcurrencyLimiter(2)
+        acquired = []
+
+        async def worker(i):
+            # Acquired the way cycle_games does, with short timeouts
+            while True:
+                try:
+                    await asyncio.wait_for(limiter.acquire(), 0.05)
+                except asyncio.TimeoutError:
+                    continue
+                acquired.append(i)
+                return
+
+        workers = [asyncio.ensure_future(worker(i)) for i in range(6)]
+        await asyncio.sleep(0.2)
+        assert len(acquired) == 2
+
+        # Nothing is released, the raise alone lets the others in
+        await limiter.set_limit(5)
+        await asyncio.sleep(0.01)
+        assert len(acquired) == 5
+        assert limiter.take_peak() == 5
+
+        await limiter.release()
+        await asyncio.wait_for(asyncio.gather(*workers), 1.0)
+        assert sorted(acquired) == list(range(6))
+
+    asyncio.run(run())
+
+
+def test_cancelled_waiter_passes_its_wakeup_on():
+    async def run():
+        limiter = adaptive.ConcurrencyLimiter(1)
+        await limiter.acquire()
+        first = asyncio.ensure_future(limiter.acquire())
+        second = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+
+        # The first waiter is notified and cancelled before it runs
+        await limiter.release()
+        first.cancel()
+        await asyncio.wait_for(second, 1.0)
+        assert first.cancelled()
+        assert limiter.in_flight == 1
+
+    asyncio.run(run())
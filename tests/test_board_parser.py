@@ -0,0 +1,46 @@
+import random
+
+import pytest
+
+import script_utils as scu
+from script_utils.board_bench import BaselineBoardParser, compare_with_baseline, generate_board_string
+
+
+def format_board(cells):
+    rows = ', '.join('[' + ', '.join(row) + ']' for row in cells)
+    return f'BoardState {{ board: [{rows}], players: [//Account_0, //Account_1] }}'
+
+
+def north_board():
+    # Stones along the west and east edges rule those sides out, columns 5
+    # and 7 are free from the north edge down to a block and out of the way
+    # of the bombs dropped on the first row
+    cells = [['Empty'] * 10 for _ in range(10)]
+    for row in cells:
+        row[0] = row[9] = 'Stone'
+    cells[6][5] = cells[8][7] = 'Block'
+    return format_board(cells)
+
+
+@pytest.mark.parametrize('block_ratio', [0.02, 0.08, 0.2, 0.4])
+def test_matches_baseline_on_random_boards(block_ratio):
+    rng = random.Random(block_ratio)
+    for _ in range(500):
+        board_string = generate_board_string(rng, block_ratio=block_ratio)
+        assert compare_with_baseline(board_string) is None, board_string
+
+
+def test_matches_baseline_on_north_side():
+    board_string = north_board()
+    assert compare_with_baseline(board_string) is None
+
+    parser = scu.BoardParser(board_string)
+    parser.compute_bomb_orders(update_matrix=True)
+    stone_orders = parser.compute_stone_orders('player_1', 'player_2', update_matrix=True)
+    assert stone_orders == {'player_1': [('north', '5')] * 4, 'player_2': [('north', '7')] * 4}
+    assert [row[5] for row in parser.board_matrix[:7]] == ['Empty'] * 2 + ['Stone'] * 4 + ['Block']
+
+
+def test_parses_like_baseline():
+    board_string = generate_board_string(random.Random(0))
+    assert scu.BoardParser(board_string).board_matrix == BaselineBoardParser(board_string).board_matrix
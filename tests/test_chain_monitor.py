@@ -0,0 +1,40 @@
+import csv
+import threading
+import time
+
+from script_utils import chain_monitor, distributed, metrics, simulator
+from script_utils.funding import hash_extrinsic_hex
+
+
+def test_tracks_extrinsics_and_streams_blocks(tmp_path):
+    node = simulator.NodeSimulator(block_time=3600.0)
+    address = simulator.get_free_address()
+    server = simulator.NodeRpcServer(distributed.parse_address(address), node)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    run_metrics = metrics.reset_run_metrics()
+    monitor = chain_monitor.ChainMonitor(f'http://{address}', str(tmp_path / 'run'), poll_interval=0.05)
+    try:
+        monitor.start()
+
+        tracked_before = node.handle('author_submitExtrinsic', ['0x01'])
+        monitor.track(tracked_before, 'queue-game')
+        node.handle('author_submitExtrinsic', ['0x02'])
+        node.produce_block()
+
+        deadline = time.monotonic() + 10.0
+        while monitor.summary()['blocks'] < 1 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        # Included before it was handed over, like after a CLI that waits
+        monitor.track(hash_extrinsic_hex('0x02'), 'queue-game')
+
+        # Rows reach the report while the run goes on
+        with open(tmp_path / 'run-blocks.csv') as csv_file:
+            assert [row['extrinsics'] for row in csv.DictReader(csv_file)] == ['2']
+    finally:
+        monitor.stop()
+        server.shutdown()
+
+    assert chain_monitor.find_extrinsic_hash(f'queued, hash 0x{tracked_before[2:].upper()}\n') == tracked_before
+    assert run_metrics.summary()['operations']['inclusion-queue-game']['count'] == 2
+    assert monitor.summary()['extrinsics_max'] == 2
@@ -0,0 +1,34 @@
+import asyncio
+import threading
+
+from script_utils import accounts, distributed, simulator
+
+
+def test_messages_beyond_the_default_stream_limit():
+    address = simulator.get_free_address()
+    coordinator = distributed.Coordinator(address, 1, connect_timeout=30.0)
+
+    async def setup(message):
+        return {'type': 'setup-done', 'results': [True] * len(message['accounts'])}
+
+    async def assign(message):
+        return {'type': 'assign-done', 'results': [True] * len(message['pairs'])}
+
+    agent = threading.Thread(target=asyncio.run, args=(distributed.run_agent(
+        address, {'setup': setup, 'assign': assign}, name='agent', connect_timeout=30.0),), daemon=True)
+    try:
+        coordinator.start()
+        agent.start()
+        coordinator.wait_for_agents()
+
+        # Both messages are several times the 64KiB asyncio reads by default
+        account_names = accounts.get_account_names(10000)
+        assert coordinator.set_balances(account_names, 1000) == [True] * len(account_names)
+
+        pairs = [account_names[i:i + 2] for i in range(0, len(account_names), 2)]
+        assert coordinator.play(pairs, [0.0] * len(pairs)) == [True] * len(pairs)
+    finally:
+        coordinator.close()
+
+    agent.join(timeout=10.0)
+    assert not agent.is_alive()
@@ -0,0 +1,90 @@
+import json
+import threading
+import types
+import urllib.request
+
+import pytest
+
+from script_utils import distributed, funding, metrics, simulator
+
+
+class SimulatedNodeClient:
+    # The parts of SubstrateInterface fund_accounts uses, against the node
+    # simulator. Calls are JSON instead of SCALE encoded, the node does not
+    # decode them, and get_events plays the runtime by failing transfers to
+    # rejected addresses.
+    def __init__(self, url, rejected=()):
+        self.url = url
+        self.rejected = set(rejected)
+
+    def rpc_request(self, method, params):
+        request = urllib.request.Request(self.url, json.dumps({'jsonrpc': '2.0', 'id': 1, 'method': method,
+                                                               'params': params}).encode('utf-8'),
+                                         {'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=10.0) as response:
+            return json.loads(response.read())
+
+    def compose_call(self, call_module, call_function, call_params):
+        return {'call_module': call_module, 'call_function': call_function, 'call_params': call_params}
+
+    def create_signed_extrinsic(self, call, keypair, nonce):
+        extrinsic_hex = '0x' + json.dumps({'call': call, 'signer': keypair.ss58_address, 'nonce': nonce}).encode('utf-8').hex()
+        return types.SimpleNamespace(data=types.SimpleNamespace(to_hex=lambda: extrinsic_hex))
+
+    def get_events(self, block_hash):
+        block = self.rpc_request('chain_getBlock', [block_hash])['result']
+        events = []
+        for extrinsic_idx, extrinsic_hex in enumerate(block['block']['extrinsics']):
+            call = json.loads(bytes.fromhex(extrinsic_hex[2:]))['call']
+            transfers = call['call_params']['calls'] if call['call_module'] == 'Utility' else [call]
+            if any(transfer['call_params']['dest'] in self.rejected for transfer in transfers):
+                event = {'module_id': 'System', 'event_id': 'ExtrinsicFailed', 'attributes': {}}
+            else:
+                event = {'module_id': 'System', 'event_id': 'ExtrinsicSuccess', 'attributes': {}}
+            events.append(types.SimpleNamespace(value={'extrinsic_idx': extrinsic_idx, 'event': event}))
+        return events
+
+
+@pytest.fixture
+def node_url():
+    node = simulator.NodeSimulator(block_time=0.1)
+    address = simulator.get_free_address()
+    server = simulator.NodeRpcServer(distributed.parse_address(address), node)
+    node.start()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://{address}'
+    server.shutdown()
+    node.stop()
+
+
+@pytest.mark.parametrize('batch_size, failed', [(None, ['//Account_4']),
+                                                (3, ['//Account_3', '//Account_4', '//Account_5'])])
+def test_fund_accounts_reports_failed_transfers(node_url, batch_size, failed):
+    run_metrics = metrics.reset_run_metrics()
+    account_names = [f'//Account_{i}' for i in range(8)]
+    addresses = [f'address-{i}' for i in range(8)]
+    rpc_node = SimulatedNodeClient(node_url, rejected=['address-4'])
+
+    funded_accounts, failed_accounts = funding.fund_accounts(
+        rpc_node, types.SimpleNamespace(ss58_address='alice'), account_names, addresses, [1000] * 8,
+        batch_size=batch_size, max_pending=2, poll_interval=0.05, inclusion_timeout=10.0)
+
+    assert failed_accounts == failed
+    assert sorted(funded_accounts + failed_accounts) == account_names
+    assert run_metrics.operations['transfer'].errors == 1
+
+
+def test_interrupted_batches_keep_their_leading_transfers():
+    def record(extrinsic_idx, module_id, event_id, attributes):
+        return types.SimpleNamespace(value={'extrinsic_idx': extrinsic_idx, 'event': {
+            'module_id': module_id, 'event_id': event_id, 'attributes': attributes}})
+
+    rpc_node = types.SimpleNamespace(get_events=lambda block_hash: [
+        types.SimpleNamespace(value={'extrinsic_idx': None, 'event': {'module_id': 'System', 'event_id': 'ExtrinsicFailed'}}),
+        record(1, 'Utility', 'BatchInterrupted', {'index': 2, 'error': 'Token'}),
+        record(2, 'Utility', 'BatchInterrupted', [1, 'Token']),
+        record(3, 'System', 'ExtrinsicFailed', {}),
+        record(4, 'System', 'ExtrinsicSuccess', {}),
+    ])
+
+    assert funding.get_extrinsic_failures(rpc_node, '0x00') == {1: 2, 2: 1, 3: 0}
@@ -0,0 +1,140 @@
+import asyncio
+import importlib.util
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+import launch_tests
+from script_utils import accounts, metrics, simulator
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def wait_for_port(address, timeout=10.0):
+    host, _, port = address.rpartition(':')
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection((host, int(port)), timeout=1.0).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def run_launch_tests(tmp_path, *args, env=None):
+    # The CPU time of the run is returned as well, the tester is the only
+    # child reaped in between
+    started = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.monotonic()
+    process = subprocess.run([sys.executable, os.path.join(REPO_ROOT, 'launch_tests.py'), '--match-poll-interval', '0.1',
+                              '--no-baseline-store', '--report', str(tmp_path / 'run'), '--event-log', str(tmp_path / 'events'),
+                              '--account-pool', str(tmp_path / 'pool.json'), *args],
+                             cwd=tmp_path, env={**os.environ, **(env or {})}, stdout=subprocess.PIPE,
+                             stderr=subprocess.STDOUT, text=True, timeout=120)
+    duration = time.monotonic() - start
+    finished = resource.getrusage(resource.RUSAGE_CHILDREN)
+    assert process.returncode == 0, process.stdout
+
+    with open(tmp_path / 'run.json') as report_file:
+        report = json.load(report_file)
+    cpu_time = finished.ru_utime + finished.ru_stime - started.ru_utime - started.ru_stime
+    return report, duration, cpu_time
+
+
+@pytest.fixture
+def simulator_server():
+    cli_address, node_address = simulator.get_free_address(), simulator.get_free_address()
+    # The worker RPC is served with "websockets", see requirements-dev.txt
+    worker_address = simulator.get_free_address() if importlib.util.find_spec('websockets') else None
+    server = subprocess.Popen([sys.executable, '-m', 'script_utils.simulator', 'serve', '--cli-address', cli_address,
+                               '--node-address', node_address, '--block-time', '0.5', '--sim-config', 'latency=0.01',
+                               *(['--worker-address', worker_address] if worker_address else [])],
+                              cwd=REPO_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(cli_address)
+        if worker_address:
+            wait_for_port(worker_address)
+        yield cli_address, worker_address
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+def test_games_through_the_fake_cli(tmp_path, simulator_server):
+    # Without chain funding: transfers are built from runtime metadata the
+    # simulated node does not serve, tests/test_funding.py covers them
+    cli_address, _ = simulator_server
+    report, _, _ = run_launch_tests(tmp_path, '--games', '3', '--skip-chain-funding',
+                                    '--cli-path', os.path.join(REPO_ROOT, 'script_utils', 'fake_cli.py'),
+                                    env={'FAKE_CLI_ADDRESS': cli_address})
+
+    assert report['counters']['games-finished'] == 3
+    assert report['counters']['players-matched'] == 6
+    assert report['operations']['queue-game']['count'] == 6
+    assert report['operations']['queue-game']['errors'] == 0
+    # Polls for matches and boards are not counted as board reads
+    assert report['operations']['match-poll']['count'] >= 6
+    assert report['operations']['get-board']['count'] == report['counters']['board-verifications']
+
+
+def test_games_over_the_worker_rpc(tmp_path, simulator_server):
+    # Trusted calls go over the websockets, queueing still forks the CLI
+    cli_address, worker_address = simulator_server
+    if worker_address is None:
+        pytest.skip('The worker RPC simulator needs "websockets"')
+    report, _, _ = run_launch_tests(tmp_path, '--games', '2', '--skip-chain-funding', '--transport', 'rpc',
+                                    '--worker-codec', 'json', '--worker-url', f'ws://{worker_address}',
+                                    '--cli-path', os.path.join(REPO_ROOT, 'script_utils', 'fake_cli.py'),
+                                    env={'FAKE_CLI_ADDRESS': cli_address})
+
+    assert report['counters']['games-finished'] == 2
+    assert report['operations']['get-board']['errors'] == 0
+
+
+def test_scenario_waits_for_idle_accounts(tmp_path):
+    # Four workers on four accounts can only play two games at a time, the
+    # others have to wait for accounts rather than poll for them
+    (tmp_path / 'spin.json').write_text(json.dumps({
+        'name': 'spin', 'accounts': 4,
+        'phases': [{'name': 'games', 'duration': 4, 'concurrency': 4, 'mix': {'game': 1}}]}))
+
+    report, duration, cpu_time = run_launch_tests(tmp_path, '--transport', 'sim', '--sim-config', 'latency=0.01',
+                                                  '--scenario', str(tmp_path / 'spin.json'))
+
+    games = report['counters']['games-finished']
+    assert games >= 4
+    assert report['counters'].get('games:game-skipped', 0) <= games // 4
+    assert cpu_time < 0.6 * duration
+
+
+def test_games_start_before_unmatched_players_give_up():
+    # An odd player is never matched, the others must not wait for it
+    board_deadline = 8.0
+    run_metrics = metrics.reset_run_metrics()
+    config = simulator.parse_sim_config('latency=0.01,seed=1')
+    sim_transport = simulator.SimulatedTransport(simulator.GameSimulator(config.seed), config)
+
+    async def run():
+        start = time.monotonic()
+        games = asyncio.ensure_future(launch_tests.run_matched_games(
+            sim_transport, accounts.get_account_names(5), max_in_flight=8, board_deadline=board_deadline,
+            poll_interval=0.1))
+        while run_metrics.counters.get('games-finished', 0) < 2 and not games.done():
+            await asyncio.sleep(0.1)
+        games_finished_after = time.monotonic() - start
+        return games_finished_after, await games
+
+    games_finished_after, results = asyncio.run(run())
+
+    assert results == [True, True]
+    assert games_finished_after < board_deadline / 2
+    assert run_metrics.counters['players-unmatched'] == 1
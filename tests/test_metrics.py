@@ -0,0 +1,40 @@
+import json
+import sys
+import threading
+
+from script_utils import metrics
+
+
+def test_records_from_a_thread_while_snapshotting():
+    # Like the chain monitor recording blocks while the loop checkpoints
+    run_metrics = metrics.RunMetrics()
+    run_metrics.take_window()
+    records = 20000
+
+    def record():
+        for i in range(records):
+            run_metrics.record(f'inclusion-{i % 5000}', i / records)
+            run_metrics.increment(f'block-{i}')
+
+    # Operations, buckets and counters keep being added, threads switch
+    # often to hit the snapshots
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    recorder = threading.Thread(target=record)
+    recorder.start()
+    # Counted when taken, records landing in a window after that are lost
+    window_counts = []
+    try:
+        while recorder.is_alive():
+            json.dumps(run_metrics.to_dict())
+            run_metrics.summary()
+            window_counts.append(sum(run_metrics.take_window().counters.values()))
+    finally:
+        recorder.join()
+        sys.setswitchinterval(switch_interval)
+    window_counts.append(sum(run_metrics.take_window().counters.values()))
+
+    snapshot = metrics.RunMetrics.from_dict(run_metrics.to_dict())
+    assert sum(operation.latencies.count for operation in snapshot.operations.values()) == records
+    assert sum(snapshot.counters.values()) == records
+    assert sum(window_counts) == records
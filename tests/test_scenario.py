@@ -0,0 +1,18 @@
+import glob
+import os
+
+import pytest
+
+from script_utils import scenario
+
+
+SCENARIOS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scenarios')
+
+
+@pytest.mark.parametrize('scenario_path', sorted(glob.glob(os.path.join(SCENARIOS_DIR, '*'))),
+                         ids=os.path.basename)
+def test_example_scenarios_load(scenario_path):
+    # With the packages of requirements.txt every shipped example loads
+    workload = scenario.load_scenario(scenario_path)
+
+    assert workload.phases
@@ -0,0 +1,178 @@
+import csv
+import json
+import os
+import urllib.error
+
+import pytest
+
+from script_utils import metrics, telemetry
+
+
+def write_process(proc_root, pid, ppid, utime, stime, rss, fds, switches, cutime=0, cstime=0):
+    process_dir = proc_root / str(pid)
+    (process_dir / 'fd').mkdir(parents=True)
+    for fd in range(fds):
+        (process_dir / 'fd' / str(fd)).touch()
+    # Fields after the command name start with the state, see proc(5)
+    fields = ['S', ppid] + [0] * 9 + [utime, stime, cutime, cstime] + [0] * 6 + [rss]
+    (process_dir / 'stat').write_text(f'{pid} (python (tester)) ' + ' '.join(str(field) for field in fields) + '\n')
+    (process_dir / 'status').write_text(f'Name:\tpython\nvoluntary_ctxt_switches:\t{switches[0]}\n'
+                                        f'nonvoluntary_ctxt_switches:\t{switches[1]}\n')
+
+
+def test_process_tree_sampler_sums_the_descendants(tmp_path):
+    write_process(tmp_path, 100, 1, utime=100, stime=50, rss=1000, fds=3, switches=(10, 5), cutime=10, cstime=5)
+    write_process(tmp_path, 101, 100, utime=200, stime=0, rss=500, fds=2, switches=(3, 1))
+    write_process(tmp_path, 200, 1, utime=999, stime=999, rss=999, fds=9, switches=(99, 99))
+    (tmp_path / 'self').mkdir()
+
+    sample = telemetry.ProcessTreeSampler(100, str(tmp_path), clock_ticks=100, page_size=4096).sample()['tester']
+
+    assert sample['processes'] == 2
+    assert sample['cpu_seconds_total'] == pytest.approx(3.65)
+    assert sample['rss_bytes'] == 6144000
+    assert sample['open_fds'] == 5
+    assert sample['voluntary_ctxt_switches_total'] == 13
+    assert sample['nonvoluntary_ctxt_switches_total'] == 6
+
+
+def test_process_tree_sampler_without_the_root(tmp_path):
+    write_process(tmp_path, 200, 1, utime=1, stime=1, rss=1, fds=1, switches=(1, 1))
+
+    with pytest.raises(FileNotFoundError):
+        telemetry.ProcessTreeSampler(100, str(tmp_path), clock_ticks=100, page_size=4096).sample()
+
+
+def test_parse_prometheus():
+    text = '''# HELP substrate_block_height Block height info of the chain
+# TYPE substrate_block_height gauge
+substrate_block_height{status="best",chain="dev"} 42
+substrate_block_height{status="finalized",chain="dev"} 40
+substrate_proposer_block_constructed_bucket{le="0.005"} 3
+substrate_proposer_block_constructed_count 7
+substrate_ready_transactions_number 1.5e3
+process_cpu_seconds_total 12.5 1700000000000
+substrate_tasks_polling_duration_sum not-a-number
+go_goroutines 8
+'''
+
+    assert telemetry.parse_prometheus(text, telemetry.DEFAULT_PROMETHEUS_PREFIXES) == {
+        'substrate_block_height{status="best",chain="dev"}': 42.0,
+        'substrate_block_height{status="finalized",chain="dev"}': 40.0,
+        'substrate_proposer_block_constructed_count': 7.0,
+        'substrate_ready_transactions_number': 1500.0,
+        'process_cpu_seconds_total': 12.5,
+    }
+    assert telemetry.parse_prometheus(text)['go_goroutines'] == 8.0
+
+
+def test_cgroup_sampler_reads_both_hierarchies(tmp_path):
+    unified = tmp_path / 'v2'
+    node_dir = unified / 'system.slice' / 'docker-abc.scope'
+    node_dir.mkdir(parents=True)
+    (node_dir / 'cpu.stat').write_text('usage_usec 2500000\nuser_usec 2000000\nnr_throttled 3\n')
+    (node_dir / 'memory.current').write_text('1048576\n')
+    (node_dir / 'pids.current').write_text('12\n')
+
+    per_controller = tmp_path / 'v1'
+    for controller, file_name, value in (('cpu,cpuacct', 'cpuacct.usage', 1_500_000_000),
+                                         ('memory', 'memory.usage_in_bytes', 2048),
+                                         ('pids', 'pids.current', 4)):
+        worker_dir = per_controller / controller / 'docker' / 'def'
+        worker_dir.mkdir(parents=True)
+        (worker_dir / file_name).write_text(f'{value}\n')
+
+    assert telemetry.CgroupSampler({'node': 'abc', 'gone': 'xyz'}, str(unified)).sample() == {
+        'node': {'cpu_seconds_total': 2.5, 'cpu_throttled_total': 3, 'memory_bytes': 1048576, 'pids': 12}}
+    assert telemetry.CgroupSampler({'worker': 'def'}, str(per_controller)).sample() == {
+        'worker': {'cpu_seconds_total': 1.5, 'memory_bytes': 2048, 'pids': 4}}
+
+    with pytest.raises(FileNotFoundError):
+        telemetry.CgroupSampler({'gone': 'xyz'}, str(unified)).sample()
+
+
+class ScriptedSampler:
+    def __init__(self, *results):
+        self.results = list(results)
+
+    def sample(self):
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return {'scripted': result}
+
+
+def read_rows(report_prefix):
+    with open(f'{report_prefix}-resources.csv', newline='') as csv_file:
+        return list(csv.DictReader(csv_file))
+
+
+def test_resource_monitor_streams_samples(tmp_path):
+    metrics.reset_run_metrics()
+    report_prefix = str(tmp_path / 'reports' / 'run')
+    monitor = telemetry.ResourceMonitor([ScriptedSampler(*({'rss_bytes': value, 'cpu_seconds_total': value}
+                                                           for value in (4, 8, 6)))], report_prefix=report_prefix)
+    monitor.open_report()
+
+    monitor.sample_once()
+    # Written as sampled, not at the end of the run
+    assert [row['metric'] for row in read_rows(report_prefix)] == ['rss_bytes', 'cpu_seconds_total']
+    monitor.sample_once()
+    monitor.sample_once()
+    monitor.stop()
+
+    rows = read_rows(report_prefix)
+    assert [float(row['value']) for row in rows if row['metric'] == 'rss_bytes'] == [4, 8, 6]
+    assert len([row for row in rows if row['metric'] == 'cpu_seconds_per_second']) == 2
+    assert monitor.write_report()['scripted']['rss_bytes'] == {'mean': 6.0, 'max': 8, 'samples': 3}
+    with open(f'{report_prefix}-resources.json') as json_file:
+        assert json.load(json_file) == monitor.summary()
+
+
+def test_resource_monitor_skips_transient_errors(tmp_path):
+    run_metrics = metrics.reset_run_metrics()
+    sampler = ScriptedSampler({'value': 1}, TimeoutError('timed out'),
+                              urllib.error.URLError(ConnectionRefusedError()), {'value': 2})
+    report_prefix = str(tmp_path / 'run')
+    monitor = telemetry.ResourceMonitor([sampler], report_prefix=report_prefix)
+    monitor.open_report()
+
+    for _ in range(4):
+        monitor.sample_once()
+    monitor.stop()
+
+    assert monitor.samplers == [sampler]
+    assert [row['value'] for row in read_rows(report_prefix)] == ['1', '2']
+    assert monitor.errors == {'ScriptedSampler': 2}
+    assert run_metrics.counters['telemetry-errors'] == 2
+
+
+@pytest.mark.parametrize('error', [FileNotFoundError('gone'), urllib.error.URLError(FileNotFoundError()),
+                                   urllib.error.URLError(ConnectionRefusedError())])
+def test_resource_monitor_drops_missing_sources(error):
+    metrics.reset_run_metrics()
+    monitor = telemetry.ResourceMonitor([ScriptedSampler(error)])
+
+    monitor.sample_once()
+
+    assert monitor.samplers == []
+    assert monitor.errors == {}
+
+
+def test_project_containers_by_service(tmp_path):
+    docker = tmp_path / 'docker'
+    docker.write_text('#!/bin/sh\n'
+                      'echo "$@" > "$(dirname "$0")/args"\n'
+                      'printf "node-0 aaa\\nworker-0 bbb\\nworker-1 ccc\\n"\n')
+    os.chmod(docker, 0o755)
+
+    assert telemetry.get_project_container_ids(str(docker), 'stress_tester') == {
+        'node-0': 'aaa', 'worker-0': 'bbb', 'worker-1': 'ccc'}
+    assert 'label=com.docker.compose.project=stress_tester' in (tmp_path / 'args').read_text()
+
+
+def test_compose_project_name(monkeypatch, tmp_path):
+    monkeypatch.delenv('COMPOSE_PROJECT_NAME', raising=False)
+    assert telemetry.get_compose_project(str(tmp_path / 'Stress.Tester')) == 'stresstester'
+    monkeypatch.setenv('COMPOSE_PROJECT_NAME', 'load')
+    assert telemetry.get_compose_project(str(tmp_path)) == 'load'
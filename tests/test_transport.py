@@ -0,0 +1,52 @@
+import asyncio
+import threading
+
+import pytest
+
+from script_utils import simulator, transport
+
+
+@pytest.fixture
+def worker_rpc():
+    # The worker RPC simulator serves with "websockets", see requirements-dev.txt
+    pytest.importorskip('websockets')
+    config = simulator.parse_sim_config('latency=0,seed=1')
+    game_simulator = simulator.GameSimulator(config.seed)
+    address = simulator.get_free_address()
+    server = simulator.WorkerRpcServer(address, simulator.SimulatedBackend(game_simulator, config))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    rpc_transport = transport.WorkerRpcTransport(simulator.SimulatedTransport(game_simulator, config),
+                                                 f'ws://{address}', pool_size=2, codec=transport.JsonRpcCodec())
+    yield rpc_transport
+    rpc_transport.close()
+    server.shutdown()
+
+
+def test_rpc_transport_plays_over_pooled_connections(worker_rpc):
+    async def play():
+        assert 'could not fetch board' in await worker_rpc.execute('get-board', '//Alice')
+        await worker_rpc.execute('queue-game', '//Alice')
+        await worker_rpc.execute('queue-game', '//Bob')
+
+        boards = await asyncio.gather(*[worker_rpc.execute('get-board', player) for player in ['//Alice', '//Bob'] * 4])
+        # Watched calls only return with their final status, not the
+        # extrinsic hash of the first one
+        dropped = await worker_rpc.execute('drop-bomb', '//Alice', [0, 0])
+        return boards, dropped
+
+    boards, dropped = asyncio.run(play())
+
+    assert all(board.startswith('BoardState') for board in boards)
+    assert dropped == ''
+    assert worker_rpc.pool.created_connections <= 2
+
+
+def test_rpc_transport_raises_on_failed_status(worker_rpc):
+    with pytest.raises(transport.TransportException, match='Invalid'):
+        asyncio.run(worker_rpc.execute('drop-stone', '//Carol', ['north', 0]))
+
+
+def test_rpc_transport_requires_a_worker_codec():
+    with pytest.raises(transport.TransportException):
+        transport.create_transport(transport.WorkerRpcTransport.name, 'integritee-cli', simulator.FAKE_MRENCLAVE)